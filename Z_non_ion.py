@@ -1,4 +1,5 @@
 from __future__ import division
+import numpy as np
 
 
 ##########################################################################
@@ -74,3 +75,77 @@ class zValue:
     def zSoilBulk (self, soilAirVf, soilWaterVf, zAirSub, zWaterSub, zSoilSolidSub):
         zSoilBulk = soilAirVf * zAirSub + soilWaterVf * zWaterSub + (1-soilAirVf-soilWaterVf) * zSoilSolidSub
         return zSoilBulk
+
+    def zValues(self, chemParams, env):
+        # every Z value at once, returns the bulk (15) and subcompartment (30) lists ordered as V_bulk and V_sub
+        zAirSub = self.zAirSub()
+        zAerSub = self.zAerSub(zAirSub)
+        zWaterSub = self.zWaterSub(zAirSub)
+        zRWSusSedSub = self.zWaterSusSedSub(zWaterSub, chemParams['Kssrw_unitless'])
+        zFWSusSedSub = self.zWaterSusSedSub(zWaterSub, chemParams['Kssfw_unitless'])
+        zSWSusSedSub = self.zWaterSusSedSub(zWaterSub, chemParams['Ksssw_unitless'])
+        zRSedSSub = self.zWaterSedSolidSub(zWaterSub, chemParams['Kbsrw_unitless'])
+        zFSedSSub = self.zWaterSedSolidSub(zWaterSub, chemParams['Kbsfw_unitless'])
+        zSSedSSub = self.zWaterSedSolidSub(zWaterSub, chemParams['Kbssw_unitless'])
+        zS1SolidSub = self.zSoilSolidSub(zWaterSub, chemParams['Kd1_unitless'])
+        zS2SolidSub = self.zSoilSolidSub(zWaterSub, chemParams['Kd2_unitless'])
+        zS3SolidSub = self.zSoilSolidSub(zWaterSub, chemParams['Kd3_unitless'])
+        zS4SolidSub = self.zSoilSolidSub(zWaterSub, chemParams['Kd4_unitless'])
+        zS1DeepSSub = self.zDeepS(zWaterSub, chemParams['Kd1_d_unitless'])
+        zS2DeepSSub = self.zDeepS(zWaterSub, chemParams['Kd2_d_unitless'])
+        zS3DeepSSub = self.zDeepS(zWaterSub, chemParams['Kd3_d_unitless'])
+        zS4DeepSSub = self.zDeepS(zWaterSub, chemParams['Kd4_d_unitless'])
+        zAirBulk = self.zAirBulk(env['aerVf'], zAirSub, zAerSub)
+        zRWBulk = self.zWaterBulk(env['rSSVf'], zRWSusSedSub, zWaterSub)
+        zFWBulk = self.zWaterBulk(env['fSSVf'], zFWSusSedSub, zWaterSub)
+        zSWBulk = self.zWaterBulk(env['sSSVf'], zSWSusSedSub, zWaterSub)
+        zRWSedimentBulk = self.zSedimentBulk(env['riversedpercSolid'], zWaterSub, zRSedSSub)
+        zFWSedimentBulk = self.zSedimentBulk(env['fsedpercSolid'], zWaterSub, zFSedSSub)
+        zSWSedimentBulk = self.zSedimentBulk(env['ssedpercSolid'], zWaterSub, zSSedSSub)
+        zSoil1Bulk = self.zSoilBulk(env['soilAC1'], env['soilWC1'], zAirSub, zWaterSub, zS1SolidSub)
+        zSoil2Bulk = self.zSoilBulk(env['soilAC2'], env['soilWC2'], zAirSub, zWaterSub, zS2SolidSub)
+        zSoil3Bulk = self.zSoilBulk(env['soilAC3'], env['soilWC3'], zAirSub, zWaterSub, zS3SolidSub)
+        zSoil4Bulk = self.zSoilBulk(env['soilAC4'], env['soilWC4'], zAirSub, zWaterSub, zS4SolidSub)
+
+        Z_bulk = [zAirBulk, zRWBulk, zRWSedimentBulk, zFWBulk, zFWSedimentBulk, zSWBulk, zSWSedimentBulk,
+                  zSoil1Bulk, zS1DeepSSub, zSoil2Bulk, zS2DeepSSub, zSoil3Bulk, zS3DeepSSub, zSoil4Bulk, zS4DeepSSub]
+        Z_sub = [zAirSub, zAerSub,
+                 zWaterSub, zRWSusSedSub, zWaterSub, zRSedSSub,
+                 zWaterSub, zFWSusSedSub, zWaterSub, zFSedSSub,
+                 zWaterSub, zSWSusSedSub, zWaterSub, zSSedSSub,
+                 zAirSub, zWaterSub, zS1SolidSub, zS1DeepSSub,
+                 zAirSub, zWaterSub, zS2SolidSub, zS2DeepSSub,
+                 zAirSub, zWaterSub, zS3SolidSub, zS3DeepSSub,
+                 zAirSub, zWaterSub, zS4SolidSub, zS4DeepSSub]
+        return Z_bulk, Z_sub
+
+    def zTable(self, chemParams, env):
+        # batch mode, tempK is the daily temperature series (array) and env['rSSVf'] the daily river
+        # suspended sediment fraction, so every Z value of the simulation is computed in one go
+        # returns the bulk (days x 15) and subcompartment (days x 30) tables
+        env = dict(env, rSSVf=np.asarray(env['rSSVf'], dtype=float))
+        Z_bulk, Z_sub = self.zValues(chemParams, env)
+        # constant columns (eg. zAirBulk) are broadcast over the days
+        return np.column_stack(np.broadcast_arrays(*Z_bulk)), np.column_stack(np.broadcast_arrays(*Z_sub))
+
+
+def z_table(climate, env, chemParams):
+    # Z value tables of the organic chemical for every day of climate['temp_K'], see zValue.zTable
+    zV = zValue(np.asarray(climate['temp_K'], dtype=float), chemParams['Kaw_n'], chemParams['Kp_n'], env['aerP'],
+                chemParams['Koc_n'])
+    return zV.zTable(chemParams, env)
+
+
+def z_day(Z_table, i):
+    # Z values of day i as plain floats, see z_unpack
+    Z_bulk, Z_sub = Z_table
+    return z_unpack(Z_bulk[i].tolist(), Z_sub[i].tolist())
+
+
+def z_unpack(bulk, sub):
+    # Z values in the order zAirSub, zAerSub, zWaterSub, zRWSusSedSub, zFWSusSedSub, zSWSusSedSub,
+    # zRSedSSub, zFSedSSub, zSSedSSub, zS1-4SolidSub, zS1-4DeepSSub, zAirBulk, zRWBulk, zFWBulk, zSWBulk,
+    # zRW/FW/SWSedimentBulk, zSoil1-4Bulk from the bulk and subcompartment lists of zValue.zValues
+    return (sub[0], sub[1], sub[2], sub[3], sub[7], sub[11], sub[5], sub[9], sub[13],
+            sub[16], sub[20], sub[24], sub[28], sub[17], sub[21], sub[25], sub[29],
+            bulk[0], bulk[1], bulk[3], bulk[5], bulk[2], bulk[4], bulk[6], bulk[7], bulk[9], bulk[11], bulk[13])
@@ -0,0 +1,173 @@
+from __future__ import division
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+from scipy.integrate import ode, solve_ivp
+
+CUR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CUR_PATH)
+
+from model_solver import SOLVER_METHODS, daily_env, nano_volume, org_initial_fugacity
+from Y_ion import Y_Value
+from Z_non_ion import z_table
+from diffusion_process_non_ion import mtc_table
+from linear_system import no_source, DayJacobian
+from ode_non_ion import org_ode
+from ode_ion import ion_ode, ion_jac
+from ode_metal import metal_ode, metal_jac
+from ode_nano import ode_nano
+from eqDissolution import eqDissolution
+from solver_methods import load_inputs, counted
+
+
+##################################################################
+#
+#   Benchmark: one integrator across the whole window
+#
+#################################################################
+
+# the 'vode' solver method starts a new vode integrator every day, this compares it with a single solve_ivp call
+# (BDF and LSODA) over the whole window: the day index of the ode parameters is floor(t), the daily states come
+# from t_eval, the tolerances and jacobians (ion_jac, metal_jac) are those of the daily integrators
+# printed per model: wall time and ode calls of the integration alone (no process fluxes), and the largest
+# difference of the daily states from those of the daily integrators, relative to the largest state of each
+# compartment
+# python benchmarks/continuous_solver.py --days 365
+
+# rtol, atol and nsteps of the daily integrators in model_solver
+TOLERANCES = {'NonionizableOrganic': (1e-6, 1e-14, 5000), 'IonizableOrganic': (1e-6, 1e-14, 5000),
+              'Metal': (1e-9, 1e-10, 1000), 'Nanomaterial': (1e-6, 1e-14, 5000)}
+
+
+def model_odes(chem_type, inputs):
+    # ode, jacobian (or None), ode parameters of day i, jacobian parameters of day i, initial state and days,
+    # as the solvers of model_solver set them up
+    if chem_type == 'NonionizableOrganic':
+        start_date, days, presence, env, climate, chemParams, bgConc, release = inputs
+        Z_table = z_table(climate, env, chemParams)
+        MTC_table = mtc_table(climate, env, chemParams)
+        params = lambda i: (i, presence, daily_env(env, i), climate, chemParams, release, bgConc, Z_table,
+                            MTC_table)
+        return org_ode, None, params, None, org_initial_fugacity(bgConc, Z_table), days
+
+    if chem_type == 'Nanomaterial':
+        start_date, days, presence, env, climate, ENM, bgConc, release = inputs
+        DIS = eqDissolution(ENM['ENM'], env['riverpH'], env['freshwpH'], env['seawpH'], env['soilWpH1'],
+                            env['soilWpH2'], env['soilWpH3'], env['soilWpH4'], presence)
+        params = lambda i: (i, nano_volume(env, i), presence, daily_env(env, i, ('rSSV', 'rwV')), climate, ENM,
+                            release, bgConc, DIS, days)
+        # initial masses as nano_solver sets them
+        V = nano_volume(env, 0)
+        y0 = np.nan_to_num(np.array([bgConc[name] for name in list(bgConc)[:len(V)]], dtype=float) * V)
+        return ode_nano, None, params, None, y0, days
+
+    chem_type, start_date, days, presence, env, climate, chemParams, bgConc, release = inputs
+    Y_val = Y_Value(chem_type, chemParams, env)
+    Z_ij, Z_ij_sub = Y_val.Z_ij()
+    Y_ij, X_ij, Z_i = Y_val.Y_ij(), Y_val.X_ij(), Y_val.Z_i()
+    release_no_source, bgConc_no_source = no_source(release, bgConc)
+    if chem_type == 'IonizableOrganic':
+        tables = (Z_ij, Z_ij_sub, Y_ij, X_ij, Z_i)
+        func, jac = ion_ode, ion_jac
+    else:
+        tables = (Z_ij, Y_ij, Z_i)
+        func, jac = metal_ode, metal_jac
+    params = lambda i: (i, presence, daily_env(env, i), chemParams, climate, release, bgConc) + tables
+    jac_params = lambda i: (i, presence, daily_env(env, i), chemParams, climate, release_no_source,
+                            bgConc_no_source) + tables
+    # initial aquivalences as ion_solver sets them
+    bgConcNames = ['air', 'rw', 'rSedS', 'fw', 'fSedS', 'sw', 'sSedS', 'soilS1', 'dsoil1', 'soilS2', 'dsoil2',
+                   'soilS3', 'dsoil3', 'soilS4', 'dsoil4']
+    compart_list = ['air', 'rw', 'rwSed', 'fw', 'fwSed', 'sw', 'swSed', 'soil1', 'deepS1', 'soil2', 'deepS2',
+                    'soil3', 'deepS3', 'soil4', 'deepS4']
+    y0 = np.array([bgConc[name] / np.mean(Z_i[compart]) for name, compart in zip(bgConcNames, compart_list)])
+    return func, jac, params, jac_params, y0, days
+
+
+def daily(chem_type, func, jac, params, jac_params, y0, days):
+    # wall time, ode calls and daily states of the 'vode' solver method: a new integrator every day
+    rtol, atol, nsteps = TOLERANCES[chem_type]
+    calls = [0]
+    func = counted(func, calls)
+    day_jac = DayJacobian(jac) if jac is not None else None
+    states = np.zeros((days, len(y0)))
+    y = y0
+    start = time.perf_counter()
+    for i in range(days):
+        r = ode(func, day_jac).set_integrator('vode', method='bdf', order=5, with_jacobian=True, nsteps=nsteps,
+                                              rtol=rtol, atol=atol)
+        r.set_initial_value(y, 0)
+        r.set_f_params(*params(i))
+        if day_jac is not None:
+            r.set_jac_params(*jac_params(i))
+        y = r.integrate(1)
+        states[i] = y
+    return time.perf_counter() - start, calls[0], states
+
+
+def continuous(chem_type, method, func, jac, params, jac_params, y0, days):
+    # wall time, ode calls and daily states of one solve_ivp call over [0, days]
+    rtol, atol, nsteps = TOLERANCES[chem_type]
+    calls = [0]
+    # the parameters (and jacobian) of the last day asked for, solve_ivp asks for the same day many times
+    cache = {'day': None, 'jac_day': None}
+
+    def day(t):
+        return min(int(np.floor(t)), days - 1)
+
+    def rhs(t, y):
+        calls[0] += 1
+        i = day(t)
+        if cache['day'] != i:
+            cache['day'], cache['params'] = i, params(i)
+        return func(t, y, *cache['params'])
+
+    def day_jac(t, y):
+        i = day(t)
+        if cache['jac_day'] != i:
+            cache['jac_day'], cache['jac'] = i, jac(t, y, *jac_params(i))
+        return cache['jac']
+
+    options = {'jac': day_jac} if jac is not None else {}
+    start = time.perf_counter()
+    solution = solve_ivp(rhs, (0, days), y0, method=method, t_eval=np.arange(1, days + 1), rtol=rtol, atol=atol,
+                         **options)
+    if solution.status != 0:
+        raise RuntimeError('%s failed: %s' % (method, solution.message))
+    return time.perf_counter() - start, calls[0], solution.y.T
+
+
+def difference(states, reference):
+    # largest difference, relative to the largest reference state of each compartment (0 for empty ones)
+    scale = np.max(np.abs(reference), axis=0)
+    used = scale > 0
+    return np.max(np.abs(states - reference)[:, used] / scale[used])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare one integrator across the whole window with the daily '
+                                                 'integrators of the ChemFate models.')
+    parser.add_argument('--days', type=int, default=120, help='simulated days (default: 120)')
+    parser.add_argument('--chem_type', nargs='+', default=list(SOLVER_METHODS), choices=list(SOLVER_METHODS),
+                        help='chemical types (default: all)')
+    args = parser.parse_args()
+
+    os.chdir(CUR_PATH)
+    warnings.simplefilter('ignore')
+    print('%-20s %-12s %10s %10s %12s' % ('chem_type', 'integrator', 'time', 'ode calls', 'difference'))
+    for chem_type in args.chem_type:
+        setup = model_odes(chem_type, load_inputs(chem_type, args.days))
+        seconds, calls, reference = daily(chem_type, *setup)
+        print('%-20s %-12s %8.2f s %10d %12s' % (chem_type, 'daily vode', seconds, calls, '-'))
+        for method in ['BDF', 'LSODA']:
+            try:
+                seconds, calls, states = continuous(chem_type, method, *setup)
+            except (ValueError, RuntimeError) as e:
+                # eg. ode_nano returns nans at some states BDF tries, its jacobian then has nans
+                print('%-20s %-12s failed: %s' % (chem_type, method, e))
+                continue
+            print('%-20s %-12s %8.2f s %10d %12.1e' % (chem_type, method, seconds, calls,
+                                                        difference(states, reference)))
@@ -0,0 +1,77 @@
+from __future__ import division
+import os
+import sys
+import copy
+import time
+import argparse
+import warnings
+import numpy as np
+
+CUR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CUR_PATH)
+
+from load_data import LoadData
+from model_solver import daily_env
+
+
+##################################################################
+#
+#   Benchmark: environment of every day of a run
+#
+#################################################################
+
+# time to build the environment of every day of a run, with the deep copy of env the solvers made before
+# (copy.deepcopy of the whole env, then the river volumes of the day) and with daily_env (a shallow day view)
+# the environment of the bundled Region.xlsx (2005) is used, with its per-day series tiled to each run length,
+# rWaterV is a list of floats, as load_data built it when the solvers deep copied env (the deep copy of a list
+# copies every float, the one of an array is a single memory copy)
+# python benchmarks/day_setup.py --years 1 5 10
+
+
+def tiled_env(env, days):
+    # env with every per-day series (as long as the loaded year) repeated to days entries
+    year = len(env['rwV'])
+    tiled = {}
+    for key, value in env.items():
+        if isinstance(value, (list, np.ndarray)) and len(value) == year:
+            tiled[key] = np.resize(value, days)
+        else:
+            tiled[key] = value
+    tiled['rWaterV'] = list(tiled['rWaterV'])
+    return tiled
+
+
+def deepcopy_env(env, i, keys=('rWaterV', 'rSSV', 'rwV', 'rSSVf')):
+    # the day setup of the solvers before daily_env
+    env_new = copy.deepcopy(env)
+    for key in keys:
+        env_new[key] = env[key][i]
+    return env_new
+
+
+def time_days(day_env, env, days):
+    start = time.perf_counter()
+    for i in range(days):
+        day_env(env, i)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the per-day environment setup of the solvers.')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10, 30], help='run lengths in years')
+    parser.add_argument('--no-deepcopy', action='store_true', help='time daily_env only (the deep copy of a 30 '
+                                                                    'year run takes minutes)')
+    args = parser.parse_args()
+
+    os.chdir(CUR_PATH)
+    warnings.simplefilter('ignore')
+    data = LoadData('NonionizableOrganic', 'Input/ChemParam_nonionizableOrganic.xlsx', 'Input/Region.xlsx',
+                    'Input/ChemRelease.xlsx', '2005 1 1', '2005 12 31', 365)
+    env = data.run_loadData()[2]
+
+    print('%5s %6s %12s %14s' % ('years', 'days', 'deepcopy', 'shallow view'))
+    for years in args.years:
+        days = 365 * years
+        env_days = tiled_env(env, days)
+        deep = float('nan') if args.no_deepcopy else time_days(deepcopy_env, env_days, days)
+        print('%5d %6d %10.4f s %12.4f s' % (years, days, deep, time_days(daily_env, env_days, days)))
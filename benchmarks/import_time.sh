@@ -0,0 +1,41 @@
+#!/bin/sh
+##################################################################
+#
+#   Benchmark: import time of the model
+#
+#################################################################
+
+# python -X importtime of model_setup (the modules every run imports), the slowest imports by cumulative time,
+# then the import and a 90-day expm run (vode for nanoFate) of every chemical type with plots='none', and the
+# optional libraries (plotting, rdkit/mordred, scipy.io) each run loaded
+# sh benchmarks/import_time.sh [python]
+
+PYTHON=${1:-python}
+cd "$(dirname "$0")/.." || exit 1
+
+echo "python -X importtime -c 'import model_setup', slowest cumulative imports (us):"
+$PYTHON -X importtime -c 'import model_setup' 2>&1 | sort -t '|' -k 2 -n -r | head -n 10
+
+OUT=$(mktemp -d)
+for CHEM in NonionizableOrganic:nonionizableOrganic:expm IonizableOrganic:ionizableOrganic:expm \
+            Metal:metal:expm Nanomaterial:nanomaterial:vode; do
+    CHEM_TYPE=${CHEM%%:*}
+    REST=${CHEM#*:}
+    CHEM_FILE=Input/ChemParam_${REST%%:*}.xlsx
+    METHOD=${REST#*:}
+    $PYTHON -W ignore - "$CHEM_TYPE" "$CHEM_FILE" "$METHOD" "$OUT" <<'PYTHON'
+import sys
+import time
+start = time.time()
+from model_setup import Model_SetUp
+imported = time.time() - start
+chem_type, chem_file, solver_method, out = sys.argv[1:]
+model = Model_SetUp('2005 1 1', '2005 3 31', 1, 10, chem_type, chem_file, 'Input/Region.xlsx',
+                    'Input/ChemRelease.xlsx', out, chem_type, solver_method, 'csv', 'none')
+model.run_model()
+loaded = [name for name in ['matplotlib', 'seaborn', 'rdkit', 'mordred', 'scipy.io'] if name in sys.modules]
+print('%-20s import %.2f s, total %.2f s, loaded: %s'
+      % (chem_type, imported, time.time() - start, ', '.join(loaded) or 'none'))
+PYTHON
+done | grep -v '^Saved'
+rm -rf "$OUT"
@@ -0,0 +1,92 @@
+from __future__ import division
+import os
+import sys
+import time
+import argparse
+import warnings
+from datetime import datetime, timedelta
+
+CUR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CUR_PATH)
+
+import model_solver
+from model_solver import SOLVER_METHODS
+from load_data import LoadData
+from load_data_nano import load_data
+
+
+##################################################################
+#
+#   Benchmark: solver methods
+#
+#################################################################
+
+# wall time and number of ode calls of every solver method of every chemical type, on the bundled inputs
+# the ode calls are all the calls of the ode function of the model (org_ode, ion_ode, metal_ode or ode_nano) made
+# by the solver: the integrator steps, the assembly of the daily linear system and the daily process fluxes
+# (the calls made by ion_jac and metal_jac inside ode_ion and ode_metal are not counted)
+# python benchmarks/solver_methods.py --days 90 --chem_type Metal
+
+CHEM_FILES = {'NonionizableOrganic': 'Input/ChemParam_nonionizableOrganic.xlsx',
+              'IonizableOrganic': 'Input/ChemParam_ionizableOrganic.xlsx',
+              'Metal': 'Input/ChemParam_metal.xlsx',
+              'Nanomaterial': 'Input/ChemParam_nanomaterial.xlsx'}
+ODE_NAMES = {'NonionizableOrganic': 'org_ode', 'IonizableOrganic': 'ion_ode', 'Metal': 'metal_ode',
+             'Nanomaterial': 'ode_nano'}
+START_DATE = '2005 1 1'
+
+
+def counted(func, calls):
+    def wrapper(*args, **kwargs):
+        calls[0] += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def load_inputs(chem_type, days):
+    end_date = (datetime.strptime(START_DATE, '%Y %m %d') + timedelta(days=days - 1)).strftime('%Y %m %d')
+    if chem_type == 'Nanomaterial':
+        time_, presence, env, climate, bgConc, chemParams, release, release_scenario = load_data(
+            'Input/Region.xlsx', 'Input/ChemRelease.xlsx', CHEM_FILES[chem_type], START_DATE, end_date)
+        return (START_DATE, time_, presence, env, climate, chemParams, bgConc, release)
+    data = LoadData(chem_type, CHEM_FILES[chem_type], 'Input/Region.xlsx', 'Input/ChemRelease.xlsx', START_DATE,
+                    end_date, days)
+    chemParams, presence, env, climate, bgConc, release, release_scenario = data.run_loadData()
+    args = (START_DATE, days, presence, env, climate, chemParams, bgConc, release)
+    return args if chem_type == 'NonionizableOrganic' else (chem_type,) + args
+
+
+def run_method(chem_type, args, solver_method):
+    # wall time (s) and ode calls of one run
+    name = ODE_NAMES[chem_type]
+    func = getattr(model_solver, name)
+    calls = [0]
+    setattr(model_solver, name, counted(func, calls))
+    try:
+        start = time.perf_counter()
+        if chem_type == 'NonionizableOrganic':
+            model_solver.org_solver(*args, solver_method=solver_method)
+        elif chem_type == 'Nanomaterial':
+            model_solver.nano_solver(*args, solver_method=solver_method)
+        else:
+            model_solver.ion_solver(*args, solver_method=solver_method)
+        return time.perf_counter() - start, calls[0]
+    finally:
+        setattr(model_solver, name, func)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the solver methods of the ChemFate models.')
+    parser.add_argument('--days', type=int, default=90, help='simulated days (default: 90)')
+    parser.add_argument('--chem_type', nargs='+', default=list(SOLVER_METHODS), choices=list(SOLVER_METHODS),
+                        help='chemical types (default: all)')
+    args = parser.parse_args()
+
+    os.chdir(CUR_PATH)
+    warnings.simplefilter('ignore')
+    print('%-20s %-6s %10s %10s' % ('chem_type', 'method', 'time', 'ode calls'))
+    for chem_type in args.chem_type:
+        inputs = load_inputs(chem_type, args.days)
+        for solver_method in SOLVER_METHODS[chem_type]:
+            seconds, calls = run_method(chem_type, inputs, solver_method)
+            print('%-20s %-6s %8.2f s %10d' % (chem_type, solver_method, seconds, calls))
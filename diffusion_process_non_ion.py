@@ -1,4 +1,5 @@
 from __future__ import division
+import numpy as np
 
 class Diffusion:
 
@@ -116,3 +117,62 @@ class MTC:
         waterParticleMTC = waterMDeff/diffusion_pathLength
         return waterParticleMTC
 
+
+    def mtcValues(self, env):
+        # every coefficient at once, as a dict in m2/day (MD) and m/day (MTC)
+        airMD = self.airMD()
+        waterMD = self.waterMD()
+        table = {'airMD': airMD, 'waterMD': waterMD,
+                 'airWaterMTC': self.airWaterMTC(airMD),
+                 'airSoilMTC': self.airSoilMTC(airMD),
+                 'soil1AirMTC': self.soilAirMTC(airMD, env['soilAC1'], env['soilWC1']),
+                 'soil2AirMTC': self.soilAirMTC(airMD, env['soilAC2'], env['soilWC2']),
+                 'soil3AirMTC': self.soilAirMTC(airMD, env['soilAC3'], env['soilWC3']),
+                 'soil4AirMTC': self.soilAirMTC(airMD, env['soilAC4'], env['soilWC4']),
+                 'soil1WaterMTC': self.soilWaterMTC(waterMD, env['soilAC1'], env['soilWC1']),
+                 'soil2WaterMTC': self.soilWaterMTC(waterMD, env['soilAC2'], env['soilWC2']),
+                 'soil3WaterMTC': self.soilWaterMTC(waterMD, env['soilAC3'], env['soilWC3']),
+                 'soil4WaterMTC': self.soilWaterMTC(waterMD, env['soilAC4'], env['soilWC4']),
+                 'waterAirMTC': self.waterAirMTC(waterMD),
+                 'sedmtWaterMTC': self.sedmtWaterMTC(waterMD, env['fsedpercSolid'])}
+        return table
+
+
+    def mtcTable(self, env):
+        # batch mode, tempK is the daily temperature series (array), every coefficient of the simulation is
+        # computed in one go, returns a dict of (days) arrays
+        table = self.mtcValues(env)
+        # the water coefficients do not depend on temperature, broadcast them over the days
+        days = np.shape(self.tempK)
+        for key in table:
+            table[key] = np.broadcast_to(np.asarray(table[key], dtype=float), days)
+        return table
+
+
+# order of the coefficients returned by mtc_day
+MTC_names = ['airMD', 'waterMD', 'airWaterMTC', 'airSoilMTC', 'soil1AirMTC', 'soil2AirMTC', 'soil3AirMTC',
+             'soil4AirMTC', 'soil1WaterMTC', 'soil2WaterMTC', 'soil3WaterMTC', 'soil4WaterMTC', 'waterAirMTC',
+             'sedmtWaterMTC']
+
+# MTC tables of the current process, keyed by chemical, so repeated scenario runs of the same chemical
+# (eg. different releases) reuse them
+mtc_cache = {}
+
+
+def mtc_table(climate, env, chemParams):
+    # mass transfer coefficients of the organic chemical for every day of climate['temp_K'], see MTC.mtcTable
+    temp_K = np.asarray(climate['temp_K'], dtype=float)
+    # the table also depends on the temperature series and the soil and sediment fractions of the region
+    key = (chemParams.get('name'), chemParams['molar_volume'], chemParams['MW'], temp_K.tobytes(),
+           env['soilAC1'], env['soilAC2'], env['soilAC3'], env['soilAC4'],
+           env['soilWC1'], env['soilWC2'], env['soilWC3'], env['soilWC4'], env['fsedpercSolid'])
+    if key not in mtc_cache:
+        if len(mtc_cache) >= 32:
+            mtc_cache.clear()
+        mtc_cache[key] = MTC(chemParams['molar_volume'], temp_K, chemParams['MW']).mtcTable(env)
+    return mtc_cache[key]
+
+
+def mtc_day(MTC_table, i):
+    # coefficients of day i as plain floats, in the order of MTC_names
+    return [float(MTC_table[name][i]) for name in MTC_names]
@@ -1,5 +1,4 @@
 import datetime
-import scipy.io as sio
 
 #################################################################
 #
@@ -40,7 +39,8 @@ def eqDissolution(ENM,RWpH,FWpH,SWpH,GWpH1,GWpH2,GWpH3,GWpH4,presence):
 			else:
 				print("invalid position\n")
 
-	# load correct mat file
+	# load correct mat file, scipy.io is only imported by nanoFate runs
+	import scipy.io as sio
 	if ENM == 'Ag':
 		contents = sio.loadmat('./Ag_eq_dis.mat')
 	elif ENM == 'CuO':
@@ -1,14 +1,9 @@
-import matplotlib
-
-matplotlib.use('Agg')
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import seaborn as sns
 import os
 from collections import OrderedDict
-from openpyxl import load_workbook
+from concurrent.futures import ProcessPoolExecutor, Future
+from result_writer import result_writer
 
 #################################################################
 #
@@ -26,6 +21,55 @@ color_water = ['palegreen', 'lightgreen', 'forestgreen', 'limegreen',
 color_soil = ['bisque', 'turquoise', 'tan', 'darkgoldenrod', 'bisque', 'turquoise', 'tan', 'darkgoldenrod',
               'bisque', 'turquoise', 'tan', 'darkgoldenrod', 'bisque', 'turquoise', 'tan', 'darkgoldenrod']
 
+# matplotlib and seaborn take long to import, they are imported by the first plot (import_plotting), so runs
+# without plots and the processes that only write the tables never load them
+plt = None
+mcolors = None
+sns = None
+
+
+def import_plotting():
+    global plt, mcolors, sns
+    if plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot
+        import matplotlib.colors
+        import seaborn
+        plt, mcolors, sns = matplotlib.pyplot, matplotlib.colors, seaborn
+
+
+PLOT_OPTIONS = ['none', 'summary', 'all']
+# processes rendering the plots, shared by the runs of this process and started on the first plot, 0 renders them
+# in this process when they are submitted, eg. in the worker processes of run_batch and job_queue, which can not
+# start a pool of their own (its processes keep the pipes of the parent pool open and block its shutdown)
+PLOT_WORKERS = min(4, os.cpu_count() or 1)
+plot_pool = None
+
+
+def plot_executor():
+    global plot_pool
+    if plot_pool is None:
+        plot_pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS)
+    return plot_pool
+
+
+def render_plot(method, args):
+    # one plot in a plot worker, matplotlib uses the Agg backend (see import_plotting)
+    getattr(GenerateResult(), method)(*args)
+    return args[-1]
+
+
+def submit_plot(method, args):
+    if PLOT_WORKERS == 0:
+        future = Future()
+        try:
+            future.set_result(render_plot(method, args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return plot_executor().submit(render_plot, method, args)
+
 
 class GenerateResult:
 
@@ -33,7 +77,10 @@ class GenerateResult:
         pass
 
     def store_output(self, chem_type, chem_name, region_name, release_scenario, release,
-                     date_array, process_array, V_bulk_list, funC_df_list, funM_df_list, output_file_path, file_name):
+                     date_array, process_array, V_bulk_list, funC_df_list, funM_df_list, output_file_path, file_name,
+                     output_format='csv', plots='all'):
+        # writes the tables, and returns the futures of the plots (the path of each figure), which are still
+        # being rendered
         header = ['air', 'rw', 'rw_sed', 'fw', 'fw_sed', 'sw', 'sw_sed', 'undeveloped_soil', 'deep_undeveloped_soil',
                   'urban_soil', 'deep_urban_soil', 'agricultural_soil', 'deep_agricultural_soil', 'biosolids_soil',
                   'deep_biosolids_soil']  # 15
@@ -47,69 +94,89 @@ class GenerateResult:
                                'agricultural_soil_solid', 'deep_agricultural_soil', 'biosolids_soil_air',
                                'biosolids_soil_water', 'biosolids_soil_solid', 'deep_biosolids_soil']  # 29
 
-        # if funC_df_list only contains 2 items, it is NonionizableOrganic
-        writer_C = pd.ExcelWriter(os.path.join(output_file_path, 'chem_conc_' + file_name + '.xlsx'))
-        writer_M = pd.ExcelWriter(os.path.join(output_file_path, 'chem_mass_' + file_name + '.xlsx'))
-
+        # concentration (g/L) and mass (kg) tables of the run, (table name, index in funC_df_list/funM_df_list,
+        # columns), written through the output format's writer (result_writer)
+        if chem_type == 'NonionizableOrganic':
+            tables = [('neutral', 0, header), ('neutral_sub', 1, header_non_nano_sub)]
+        elif chem_type == 'IonizableOrganic':
+            tables = [('neutral', 0, header), ('neutral_sub', 1, header_non_nano_sub),
+                      ('ionic', 2, header), ('ionic_sub', 3, header_non_nano_sub)]
+        elif chem_type == 'Metal':
+            tables = [('particulate', 0, header), ('colloidal', 2, header), ('dissolved', 4, header)]
+        else:
+            tables = [('particulate', 0, header), ('free nano', 1, header), ('dissolved', 2, header)]
+
+        writer = result_writer(output_format, output_file_path, file_name)
+        for table, index, columns in tables:
+            writer.write_table('chem_conc', table, 'g/L', date_array, columns, funC_df_list[index])
+            writer.write_table('chem_mass', table, 'kg', date_array, columns, funM_df_list[index])
+        self.store_process_output(chem_type, date_array, process_array, writer)
+        writer.close()
+        print('Saved the results (%s).' % output_format)
+
+        # the plots are rendered in the background by a process pool once the tables are written, plots is
+        # 'none', 'summary' (bulk concentrations of the whole chemical and the mass heatmap) or 'all'
+        if plots not in PLOT_OPTIONS:
+            raise ValueError('plots should be one of %s, not %s' % (', '.join(PLOT_OPTIONS), plots))
+        if plots == 'none':
+            return []
+        jobs = self.plot_jobs(chem_type, chem_name, region_name, release_scenario, release, date_array, V_bulk_list,
+                              funC_df_list, header, header_non_nano_sub, output_file_path, file_name)
+        if plots == 'summary':
+            jobs = [job for job in jobs if job[0]]
+        return [submit_plot(method, args) for summary, method, args in jobs]
+
+    def plot_jobs(self, chem_type, chem_name, region_name, release_scenario, release, date_array, V_bulk_list,
+                  funC_df_list, header, header_non_nano_sub, output_file_path, file_name):
+        # the plots of a run as (in the summary, GenerateResult method, its arguments)
+        jobs = []
+        # the plots only need the concentrations
         df_1_C = pd.DataFrame(funC_df_list[0], columns=header, index=date_array)
-        df_1_M = pd.DataFrame(funM_df_list[0], columns=header, index=date_array)
         if chem_type != 'Nanomaterial':
             df_1_sub_C = pd.DataFrame(funC_df_list[1], columns=header_non_nano_sub, index=date_array)
-            df_1_M = pd.DataFrame(funM_df_list[0], columns=header, index=date_array)
-            df_1_sub_M = pd.DataFrame(funM_df_list[1], columns=header_non_nano_sub, index=date_array)
 
-        self.generate_release_bulk(release, chem_name, region_name, release_scenario,
-                                   os.path.join(output_file_path, 'release_bulk_' + file_name + '.png'))
+        jobs.append((False, 'generate_release_bulk', (release, chem_name, region_name, release_scenario,
+                     os.path.join(output_file_path, 'release_bulk_' + file_name + '.png'))))
 
         if chem_type == 'NonionizableOrganic' or chem_type == 'IonizableOrganic':
             txt = 'neutral'
-            df_1_C.to_excel(writer_C, txt)
-            df_1_sub_C.to_excel(writer_C, txt + '_sub')
-            df_1_M.to_excel(writer_M, txt)
-            df_1_sub_M.to_excel(writer_M, txt + '_sub')
-            self.generate_plot_bulk(df_1_C, txt, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt + '_bulk_' + file_name + '.png'))
-            self.generate_mass_bulk(df_1_C, txt, V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt + '_bulk_mass_' + file_name + '.png'))
-            self.generate_plot_sub(df_1_sub_C, txt, chem_name, chem_type, region_name, release_scenario,
-                                   os.path.join(output_file_path, txt + '_sub_' + file_name + '.png'))
+            # organoFate has only the neutral species, which is the whole chemical
+            jobs.append((chem_type == 'NonionizableOrganic', 'generate_plot_bulk',
+                         (df_1_C, txt, chem_name, region_name, release_scenario,
+                          os.path.join(output_file_path, txt + '_bulk_' + file_name + '.png'))))
+            jobs.append((False, 'generate_mass_bulk', (df_1_C, txt, V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt + '_bulk_mass_' + file_name + '.png'))))
+            jobs.append((False, 'generate_plot_sub', (df_1_sub_C, txt, chem_name, chem_type, region_name, release_scenario,
+                         os.path.join(output_file_path, txt + '_sub_' + file_name + '.png'))))
 
         else:
             # for metal and nanomaterial, no subcompartment
             txt = 'particulate'
-            df_1_C.to_excel(writer_C, txt)
-            df_1_M.to_excel(writer_M, txt)
-            self.generate_plot_bulk(df_1_C, txt, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt + '_bulk_' + file_name + '.png'))
-            self.generate_mass_bulk(df_1_C, txt, V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt + '_bulk_mass_' + file_name + '.png'))
+            jobs.append((False, 'generate_plot_bulk', (df_1_C, txt, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt + '_bulk_' + file_name + '.png'))))
+            jobs.append((False, 'generate_mass_bulk', (df_1_C, txt, V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt + '_bulk_mass_' + file_name + '.png'))))
 
         if chem_type == 'IonizableOrganic':
             df_2_C = pd.DataFrame(funC_df_list[2], columns=header, index=date_array)
             df_2_sub_C = pd.DataFrame(funC_df_list[3], columns=header_non_nano_sub, index=date_array)
-            df_2_M = pd.DataFrame(funM_df_list[2], columns=header, index=date_array)
-            df_2_sub_M = pd.DataFrame(funM_df_list[3], columns=header_non_nano_sub, index=date_array)
-            df_2_C.to_excel(writer_C, 'ionic')
-            df_2_sub_C.to_excel(writer_C, 'ionic_sub')
-            df_2_M.to_excel(writer_M, 'ionic')
-            df_2_sub_M.to_excel(writer_M, 'ionic_sub')
             df_sum_bulk = df_1_C.add(df_2_C)
             df_sum_sub = df_1_sub_C.add(df_2_sub_C)
             txt = 'ionic'
             txt_sub = 'ionic_sub'
-            self.generate_plot_bulk(df_2_C, txt, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt + '_bulk_' + file_name + '.png'))
-            self.generate_mass_bulk(df_2_C, txt, V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt + '_bulk_mass_' + file_name + '.png'))
-            self.generate_plot_sub(df_2_sub_C, txt, chem_name, chem_type, region_name, release_scenario,
-                                   os.path.join(output_file_path, txt_sub + '_' + file_name + '.png'))
-            self.generate_plot_bulk(df_sum_bulk, '', chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, 'sum_bulk_' + file_name + '.png'))
-            self.generate_mass_bulk(df_sum_bulk, '', V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, 'sum_bulk_mass_' + file_name + '.png'))
-
-            self.generate_plot_sub(df_sum_sub, '', chem_name, chem_type, region_name, release_scenario,
-                                   os.path.join(output_file_path, 'sum_sub_' + file_name + '.png'))
+            jobs.append((False, 'generate_plot_bulk', (df_2_C, txt, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt + '_bulk_' + file_name + '.png'))))
+            jobs.append((False, 'generate_mass_bulk', (df_2_C, txt, V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt + '_bulk_mass_' + file_name + '.png'))))
+            jobs.append((False, 'generate_plot_sub', (df_2_sub_C, txt, chem_name, chem_type, region_name, release_scenario,
+                         os.path.join(output_file_path, txt_sub + '_' + file_name + '.png'))))
+            jobs.append((True, 'generate_plot_bulk', (df_sum_bulk, '', chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, 'sum_bulk_' + file_name + '.png'))))
+            jobs.append((False, 'generate_mass_bulk', (df_sum_bulk, '', V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, 'sum_bulk_mass_' + file_name + '.png'))))
+
+            jobs.append((False, 'generate_plot_sub', (df_sum_sub, '', chem_name, chem_type, region_name, release_scenario,
+                         os.path.join(output_file_path, 'sum_sub_' + file_name + '.png'))))
         elif chem_type == 'Metal' or chem_type == 'Nanomaterial':
             if chem_type == 'Metal':
                 index1, index2 = 2, 4
@@ -119,75 +186,44 @@ class GenerateResult:
                 txt1, txt2 = 'free nano', 'dissolved'
 
             df_2_C = pd.DataFrame(funC_df_list[index1], columns=header, index=date_array)
-            df_2_M = pd.DataFrame(funM_df_list[index1], columns=header, index=date_array)
             df_3_C = pd.DataFrame(funC_df_list[index2], columns=header, index=date_array)
-            df_3_M = pd.DataFrame(funM_df_list[index2], columns=header, index=date_array)
-            df_2_C.to_excel(writer_C, txt1)
-            df_3_C.to_excel(writer_C, txt2)
-            df_2_M.to_excel(writer_M, txt1)
-            df_3_M.to_excel(writer_M, txt2)
             df_sum1 = df_1_C.add(df_2_C)
             df_sum = df_sum1.add(df_3_C)
 
-            self.generate_plot_bulk(df_2_C, txt1, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt1 + '_bulk_' + file_name + '.png'))
-            self.generate_plot_bulk(df_3_C, txt2, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt2 + '_bulk_' + file_name + '.png'))
-            self.generate_plot_bulk(df_sum, '', chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, 'sum_bulk_' + file_name + '.png'))
+            jobs.append((False, 'generate_plot_bulk', (df_2_C, txt1, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt1 + '_bulk_' + file_name + '.png'))))
+            jobs.append((False, 'generate_plot_bulk', (df_3_C, txt2, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt2 + '_bulk_' + file_name + '.png'))))
+            jobs.append((True, 'generate_plot_bulk', (df_sum, '', chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, 'sum_bulk_' + file_name + '.png'))))
 
-            self.generate_mass_bulk(df_2_C, txt1, V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt1 + '_bulk_mass_' + file_name + '.png'))
-            self.generate_mass_bulk(df_3_C, txt2, V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, txt2 + '_bulk_mass_' + file_name + '.png'))
-            self.generate_mass_bulk(df_sum, '', V_bulk_list, chem_name, region_name, release_scenario,
-                                    os.path.join(output_file_path, 'sum_bulk_mass_' + file_name + '.png'))
+            jobs.append((False, 'generate_mass_bulk', (df_2_C, txt1, V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt1 + '_bulk_mass_' + file_name + '.png'))))
+            jobs.append((False, 'generate_mass_bulk', (df_3_C, txt2, V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, txt2 + '_bulk_mass_' + file_name + '.png'))))
+            jobs.append((False, 'generate_mass_bulk', (df_sum, '', V_bulk_list, chem_name, region_name, release_scenario,
+                         os.path.join(output_file_path, 'sum_bulk_mass_' + file_name + '.png'))))
 
         if chem_type == 'NonionizableOrganic':
             txt = 'organoFate'
-            self.generate_heatmap_bulk(chem_type, [df_1_C], chem_name, region_name, release_scenario, V_bulk_list,
-                                       os.path.join(output_file_path, txt + '_heatmap_' + file_name + '.png'))
+            jobs.append((True, 'generate_heatmap_bulk', (chem_type, [df_1_C], chem_name, region_name, release_scenario,
+                         V_bulk_list, os.path.join(output_file_path, txt + '_heatmap_' + file_name + '.png'))))
         elif chem_type == 'IonizableOrganic':
-            self.generate_heatmap_bulk(chem_type, [df_1_C, df_2_C], chem_name, region_name, release_scenario,
-                                       V_bulk_list, os.path.join(output_file_path, 'ionOFate_heatmap_' + file_name + '.png'))
+            jobs.append((True, 'generate_heatmap_bulk', (chem_type, [df_1_C, df_2_C], chem_name, region_name,
+                         release_scenario, V_bulk_list,
+                         os.path.join(output_file_path, 'ionOFate_heatmap_' + file_name + '.png'))))
         else:
             if chem_type == 'Metal':
                 txt = 'metal'
             else:
                 txt = 'nano'
-            self.generate_heatmap_bulk(chem_type, [df_1_C, df_2_C, df_3_C], chem_name, region_name, release_scenario,
-                                       V_bulk_list, os.path.join(output_file_path, txt + '_heatmap_' + file_name + '.png'))
-
-        writer_C.save()
-        writer_M.save()
-        print('Saved the results to excel file.')
-
-        # output process data
-        self.store_process_output(chem_type, date_array, process_array, output_file_path, file_name)
-
-        # insert unit into A1 cell in conc, mass and process file
-        conc_file = os.path.join(output_file_path, 'chem_conc_' + file_name + '.xlsx')
-        mass_file = os.path.join(output_file_path, 'chem_mass_' + file_name + '.xlsx')
-        process_file = os.path.join(output_file_path, 'process_' + file_name + '.xlsx')
-
-        conc_book = load_workbook(conc_file)
-        conc_sheetnames = conc_book.sheetnames
-        mass_book = load_workbook(mass_file)
-        for sheetname in conc_sheetnames:
-            conc_sheet = conc_book[sheetname]
-            mass_sheet = mass_book[sheetname]
-            conc_sheet['A1'] = 'g/L'
-            mass_sheet['A1'] = 'kg'
-
-        process_book = load_workbook(process_file)
-        process_sheet = process_book['process']
-        process_sheet['A1'] = 'kg/day'
-
-        conc_book.save(os.path.join(output_file_path, 'chem_conc_' + file_name + '.xlsx'))
-        mass_book.save(os.path.join(output_file_path, 'chem_mass_' + file_name + '.xlsx'))
-        process_book.save(os.path.join(output_file_path, 'process_' + file_name + '.xlsx'))
-
-    def store_process_output(self, chem_type, date_array, process_array, output_file_path, file_name):
+            jobs.append((True, 'generate_heatmap_bulk', (chem_type, [df_1_C, df_2_C, df_3_C], chem_name, region_name,
+                         release_scenario, V_bulk_list,
+                         os.path.join(output_file_path, txt + '_heatmap_' + file_name + '.png'))))
+        return jobs
+
+    def store_process_output(self, chem_type, date_array, process_array, writer):
+        # process table (kg/day by process) of the run, writer is a result_writer
         if chem_type == 'IonizableOrganic':
             header_list = ['adv_air_in', 'adv_air_out',
                            'adv_rw_in', 'adv_rw_out', 'adv_rwSed_in', 'adv_rwSed_out',
@@ -315,12 +351,10 @@ class GenerateResult:
                            'burial_rwSed', 'burial_fwSed', 'burial_swSed',
                            'resusp_rwSed', 'resusp_fwSed', 'resusp_swSed', 'aero_resusp_sSS']
 
-        writer = pd.ExcelWriter(os.path.join(output_file_path, 'process_' + file_name + '.xlsx'))
-        df = pd.DataFrame(process_array, columns=header_list, index=date_array)
-        df.to_excel(writer, 'process')
-        writer.save()
+        writer.write_table('process', 'process', 'kg/day', date_array, header_list, process_array)
 
     def generate_plot_bulk(self, df, txt, chem_name, region_name, release_scenario, output_figure_path):
+        import_plotting()
         df = df.reset_index(drop=True)
         sns.set(style='white')
         sim_days = df.shape[0]
@@ -370,6 +404,7 @@ class GenerateResult:
         plt.close('all')
 
     def generate_plot_sub(self, df, txt, chem_name, chem_type, region_name, release_scenario, output_figure_path):
+        import_plotting()
         df = df.reset_index(drop=True)
         sns.set(style='white')
         sim_days = df.shape[0]
@@ -506,6 +541,7 @@ class GenerateResult:
 
     def generate_heatmap_bulk(self, chem_type, df, chem_name, region_name, release_scenario,
                               V_bulk_list, output_figure_path):
+        import_plotting()
         data = OrderedDict()
         data['conc'] = OrderedDict()
         data['massFr'] = OrderedDict()
@@ -534,12 +570,12 @@ class GenerateResult:
             data['conc'][txt]['Ag. Soil'] = df[i]['agricultural_soil'].mean()
             data['conc'][txt]['Bio. Soil'] = df[i]['biosolids_soil'].mean()
 
-            total_mass = total_mass + df[i]['air'][-1] * V_bulk_list[0] + df[i]['rw'][-1] * V_bulk_list[1][-1] + \
-                         df[i]['rw_sed'][-1] * V_bulk_list[2] \
-                         + df[i]['fw'][-1] * V_bulk_list[3] + df[i]['fw_sed'][-1] * V_bulk_list[4] \
-                         + df[i]['sw'][-1] * V_bulk_list[5] + df[i]['sw_sed'][-1] * V_bulk_list[6] + \
-                         df[i]['undeveloped_soil'][-1] * V_bulk_list[7] + df[i]['urban_soil'][-1] * V_bulk_list[8] + \
-                         df[i]['agricultural_soil'][-1] * V_bulk_list[9] + df[i]['biosolids_soil'][-1] * V_bulk_list[10]
+            total_mass = total_mass + df[i]['air'].iloc[-1] * V_bulk_list[0] + df[i]['rw'].iloc[-1] * V_bulk_list[1][-1] + \
+                         df[i]['rw_sed'].iloc[-1] * V_bulk_list[2] \
+                         + df[i]['fw'].iloc[-1] * V_bulk_list[3] + df[i]['fw_sed'].iloc[-1] * V_bulk_list[4] \
+                         + df[i]['sw'].iloc[-1] * V_bulk_list[5] + df[i]['sw_sed'].iloc[-1] * V_bulk_list[6] + \
+                         df[i]['undeveloped_soil'].iloc[-1] * V_bulk_list[7] + df[i]['urban_soil'].iloc[-1] * V_bulk_list[8] + \
+                         df[i]['agricultural_soil'].iloc[-1] * V_bulk_list[9] + df[i]['biosolids_soil'].iloc[-1] * V_bulk_list[10]
 
         for i in range(0, len(df)):
             if i == 0:
@@ -550,17 +586,17 @@ class GenerateResult:
                 txt = 'third'
 
             data['massFr'][txt] = OrderedDict()
-            data['massFr'][txt]['Air'] = (df[i]['air'][-1] * V_bulk_list[0] / total_mass) * 100
-            data['massFr'][txt]['RW'] = (df[i]['rw'][-1] * V_bulk_list[1][-1] / total_mass) * 100
-            data['massFr'][txt]['RW Sed'] = (df[i]['rw_sed'][-1] * V_bulk_list[2] / total_mass) * 100
-            data['massFr'][txt]['FW'] = (df[i]['fw'][-1] * V_bulk_list[3] / total_mass) * 100
-            data['massFr'][txt]['FW Sed'] = (df[i]['fw_sed'][-1] * V_bulk_list[4] / total_mass) * 100
-            data['massFr'][txt]['SW'] = (df[i]['sw'][-1] * V_bulk_list[5] / total_mass) * 100
-            data['massFr'][txt]['SW Sed'] = (df[i]['sw_sed'][-1] * V_bulk_list[6] / total_mass) * 100
-            data['massFr'][txt]['Natural Soil'] = (df[i]['undeveloped_soil'][-1] * V_bulk_list[7] / total_mass) * 100
-            data['massFr'][txt]['Urban Soil'] = (df[i]['urban_soil'][-1] * V_bulk_list[8] / total_mass) * 100
-            data['massFr'][txt]['Ag. Soil'] = (df[i]['agricultural_soil'][-1] * V_bulk_list[9] / total_mass) * 100
-            data['massFr'][txt]['Bio. Soil'] = (df[i]['biosolids_soil'][-1] * V_bulk_list[10] / total_mass) * 100
+            data['massFr'][txt]['Air'] = (df[i]['air'].iloc[-1] * V_bulk_list[0] / total_mass) * 100
+            data['massFr'][txt]['RW'] = (df[i]['rw'].iloc[-1] * V_bulk_list[1][-1] / total_mass) * 100
+            data['massFr'][txt]['RW Sed'] = (df[i]['rw_sed'].iloc[-1] * V_bulk_list[2] / total_mass) * 100
+            data['massFr'][txt]['FW'] = (df[i]['fw'].iloc[-1] * V_bulk_list[3] / total_mass) * 100
+            data['massFr'][txt]['FW Sed'] = (df[i]['fw_sed'].iloc[-1] * V_bulk_list[4] / total_mass) * 100
+            data['massFr'][txt]['SW'] = (df[i]['sw'].iloc[-1] * V_bulk_list[5] / total_mass) * 100
+            data['massFr'][txt]['SW Sed'] = (df[i]['sw_sed'].iloc[-1] * V_bulk_list[6] / total_mass) * 100
+            data['massFr'][txt]['Natural Soil'] = (df[i]['undeveloped_soil'].iloc[-1] * V_bulk_list[7] / total_mass) * 100
+            data['massFr'][txt]['Urban Soil'] = (df[i]['urban_soil'].iloc[-1] * V_bulk_list[8] / total_mass) * 100
+            data['massFr'][txt]['Ag. Soil'] = (df[i]['agricultural_soil'].iloc[-1] * V_bulk_list[9] / total_mass) * 100
+            data['massFr'][txt]['Bio. Soil'] = (df[i]['biosolids_soil'].iloc[-1] * V_bulk_list[10] / total_mass) * 100
 
         df_conc = pd.DataFrame.from_dict(data['conc'])
         df_massFr = pd.DataFrame.from_dict(data['massFr'])
@@ -624,6 +660,7 @@ class GenerateResult:
         plt.close('all')
 
     def generate_release_bulk(self, release, chem_name, region_name, release_scenario, output_figure_path):
+        import_plotting()
         air = release['air']
         rw = release['rw']
         rSS = release['rSS']
@@ -645,14 +682,8 @@ class GenerateResult:
 
         compart_list = [air, rw, rSS, rwSed, fw, fSS, fwSed, sw, sSS, swSed, soil1, dsoil1, soil2, dsoil2, soil3,
                         dsoil3, soil4, dsoil4]
-        compart2_list = compart_list[:]
-
-        for i in range(0, len(compart_list)):
-            for j in range(0, len(compart_list[i])):
-                if j == 0:
-                    compart2_list[i][j] = compart_list[i][j]
-                else:
-                    compart2_list[i][j] = compart2_list[i][j - 1] + compart_list[i][j]
+        # cumulative release, without changing the release series of the run
+        compart2_list = [np.cumsum(series) for series in compart_list]
 
         sns.set(style='white')
         sim_days = len(air)
@@ -714,6 +745,7 @@ class GenerateResult:
         plt.close('all')
 
     def generate_mass_bulk(self, df, txt, V_bulk_list, chem_name, region_name, release_scenario, output_figure_path):
+        import_plotting()
         df = df.reset_index(drop=True)
         sns.set(style='white')
         sim_days = df.shape[0]
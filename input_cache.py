@@ -0,0 +1,153 @@
+from __future__ import division
+import os
+import time
+import pickle
+import hashlib
+from input_tables import open_input, read_date_window
+
+
+##################################################################
+#
+#   Cache of the parsed input sheets
+#
+#################################################################
+
+# reading the region, release and chemical workbooks takes most of the start up time of a small run, the loaders
+# read them through an InputBook, which keeps every parsed sheet under CACHE_DIR, keyed by the content of the
+# workbook (not its name or date), the sheet and the parse arguments, so a sheet is parsed once for all the
+# chemicals it is run with, the daily sheets (Climate, Release) are kept per simulated window, only the days of
+# the window are read from them (read_date_window)
+# the workbook itself is opened only when a sheet is not in the cache
+# the entries not used for CACHE_MAX_AGE are removed, then the least recently used ones while the cache takes
+# more than CACHE_MAX_BYTES, and the entries of an older CACHE_VERSION
+# set CHEMFATE_CACHE_DIR to move the cache, or to an empty string to turn it off
+
+CUR_PATH = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get('CHEMFATE_CACHE_DIR', os.path.join(CUR_PATH, 'cache'))
+# bump when a loader changes what it returns, the older entries are then removed
+CACHE_VERSION = 4
+CACHE_MAX_AGE = 30 * 24 * 3600
+CACHE_MAX_BYTES = 256 * 1024 ** 2
+
+
+def source_hash(source):
+    # sha256 of a workbook, given as a path or as an open file (eg. a streamlit upload), or of a folder of
+    # sheet tables (input_tables), from the names and contents of its files
+    h = hashlib.sha256()
+    if isinstance(source, str) and os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path):
+                h.update(name.encode())
+                h.update(source_hash(path).encode())
+    elif hasattr(source, 'getvalue'):
+        h.update(source.getvalue())
+    elif hasattr(source, 'read'):
+        position = source.tell()
+        h.update(source.read())
+        source.seek(position)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+def cache_prefix():
+    return 'v%d_' % CACHE_VERSION
+
+
+def cached_load(name, hashes, args, load):
+    # return load(), from the cache when the sources with these hashes (source_hash) were already loaded with
+    # the same args
+    if not CACHE_DIR:
+        return load()
+    key = hashlib.sha256(repr((name, hashes, args)).encode()).hexdigest()
+    cache_file = os.path.join(CACHE_DIR, cache_prefix() + name + '_' + key + '.pkl')
+
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                result = pickle.load(f)
+            # the entry age is its last use, see evict_cache
+            os.utime(cache_file)
+            return result
+        except Exception:
+            # unreadable (eg. partly written by a crashed run), parse again and replace it
+            pass
+
+    result = load()
+    tmp_file = cache_file + '.%d.tmp' % os.getpid()
+    try:
+        if not os.path.exists(CACHE_DIR):
+            os.makedirs(CACHE_DIR)
+        # write to a temporary file first so parallel runs never read a partial entry
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+        evict_cache()
+    except (OSError, pickle.PicklingError, TypeError):
+        # a read-only install still runs, just without the cache
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return result
+
+
+def evict_cache(max_age=CACHE_MAX_AGE, max_bytes=CACHE_MAX_BYTES):
+    # remove the entries of an older CACHE_VERSION and the ones not used for max_age, then the least recently
+    # used ones while the cache takes more than max_bytes
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if not name.endswith('.pkl'):
+            continue
+        try:
+            if not name.startswith(cache_prefix()):
+                os.remove(path)
+                continue
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except OSError:
+            # removed by a parallel run
+            pass
+    entries.sort()
+    total = sum(size for used, size, path in entries)
+    now = time.time()
+    for used, size, path in entries:
+        if now - used > max_age or total > max_bytes:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class InputBook:
+    # a workbook (path or uploaded file) or folder of sheet tables (input_tables) read through the cache, with
+    # the parse() of pd.ExcelFile and date_window() for the daily sheets, the workbook is opened on the first
+    # sheet that is not in the cache, close() closes it
+    def __init__(self, source):
+        self.source = source
+        self.hash = source_hash(source)
+        self.book = None
+
+    def open(self):
+        if self.book is None:
+            self.book = open_input(self.source)
+        return self.book
+
+    def parse(self, sheet_name, **kwargs):
+        # the sheet as a DataFrame, as pd.ExcelFile.parse(sheet_name, **kwargs) returns it
+        return cached_load('sheet', self.hash, (sheet_name, sorted(kwargs.items())),
+                           lambda: self.open().parse(sheet_name=sheet_name, **kwargs))
+
+    def date_window(self, sheet_name, start_date, end_date, header_row=0):
+        # the rows above the header and the columns of the days from start_date to end_date of a daily sheet
+        # (see read_date_window), only the rows up to end_date are read from the workbook
+        return cached_load('window', self.hash, (sheet_name, start_date, end_date, header_row),
+                           lambda: read_date_window(self.open().book[sheet_name], start_date, end_date,
+                                                    header_row))
+
+    def close(self):
+        if self.book is not None:
+            self.book.close()
+            self.book = None
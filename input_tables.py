@@ -0,0 +1,228 @@
+from __future__ import division
+import os
+import csv
+import argparse
+from datetime import datetime
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+
+##################################################################
+#
+#   Input workbooks as folders of sheet tables
+#
+#################################################################
+
+# the Region, ChemRelease and ChemParam inputs can also be given as a folder with one table per sheet,
+# <sheet name>.csv or <sheet name>.parquet, holding the cells of the sheet as they are: no header is applied,
+# the title and header rows of the sheet are rows of the table, so the loaders read a folder exactly like the
+# workbook (same skiprows, header and columns)
+# these are read much faster than an xlsx, mostly for the long daily Climate and Release sheets
+# convert_workbook (or python input_tables.py Input/Region.xlsx) writes this layout from a workbook
+
+# when a sheet has both, the parquet table is used (reading and writing parquet needs pyarrow)
+TABLE_EXTENSIONS = ['.parquet', '.csv']
+
+
+def is_table_folder(source):
+    return isinstance(source, str) and os.path.isdir(source)
+
+
+def open_input(source):
+    # pd.ExcelFile for a workbook (path or uploaded file), TableBook for a folder of sheet tables
+    if is_table_folder(source):
+        return TableBook(source)
+    return pd.ExcelFile(source)
+
+
+def table_files(folder):
+    # sheet name: table file of a folder
+    files = {}
+    for extension in reversed(TABLE_EXTENSIONS):
+        for name in sorted(os.listdir(folder)):
+            sheet, ext = os.path.splitext(name)
+            if ext.lower() == extension:
+                files[sheet] = os.path.join(folder, name)
+    return files
+
+
+def cell_text(value):
+    # text of a cell in a table, '' for an empty cell, numbers keep all their digits (repr)
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def cell_value(text):
+    # value of a cell from its text, None when empty, int or float for a number (an integral number is an int,
+    # as pd.read_excel returns it), True/False for a boolean, else the text
+    if text is None or text == '':
+        return None
+    try:
+        number = float(text)
+    except ValueError:
+        if text in ['True', 'False']:
+            return text == 'True'
+        return text
+    if number.is_integer():
+        return int(number)
+    return number
+
+
+def table_rows(path):
+    # rows of cell texts of a table file, a csv is streamed line by line
+    if path.lower().endswith('.csv'):
+        with open(path, newline='') as f:
+            for row in csv.reader(f):
+                yield row
+    else:
+        df = pd.read_parquet(path)
+        # column by column, iterating the rows of the (arrow backed) string columns is much slower
+        for row in zip(*[df[column].tolist() for column in df.columns]):
+            yield row
+
+
+class TableSheet:
+    # one sheet of a TableBook, its rows come from iter_rows(values_only=True) like an openpyxl worksheet
+    # (see read_date_window)
+    def __init__(self, title, path):
+        self.title = title
+        self.path = path
+
+    def iter_rows(self, values_only=True):
+        for row in table_rows(self.path):
+            yield tuple(cell_value(text) for text in row)
+
+
+class TableBook:
+    # a folder of sheet tables with the parts of pd.ExcelFile the loaders use: sheet_names, parse(),
+    # book[sheet name] (the rows of a sheet) and close()
+    def __init__(self, folder):
+        self.folder = folder
+        self.files = table_files(folder)
+        self.sheet_names = sorted(self.files)
+
+    @property
+    def book(self):
+        return self
+
+    def __getitem__(self, sheet_name):
+        if sheet_name not in self.files:
+            raise KeyError('no table for sheet %s in %s' % (sheet_name, self.folder))
+        return TableSheet(sheet_name, self.files[sheet_name])
+
+    def parse(self, sheet_name=0, header=0, index_col=None, usecols=None, skiprows=None, nrows=None):
+        # the sheet as a DataFrame, with the same arguments and result as pd.read_excel of the workbook sheet
+        if isinstance(sheet_name, int):
+            sheet_name = self.sheet_names[sheet_name]
+        # the cell grid as pd.read_excel passes it to the parser: empty cells are '', the empty rows and
+        # columns after the last value are dropped and the rows are padded to the same length
+        data = [list(row) for row in self[sheet_name].iter_rows(values_only=True)]
+        for row in data:
+            while row and row[-1] is None:
+                row.pop()
+        while data and not data[-1]:
+            data.pop()
+        width = max([len(row) for row in data] + [0])
+        data = [['' if cell is None else cell for cell in row] + [''] * (width - len(row)) for row in data]
+        try:
+            parser = TextParser(data, header=header, index_col=index_col, usecols=usecols, skiprows=skiprows,
+                                nrows=nrows, skip_blank_lines=False)
+            return parser.read(nrows=nrows)
+        except EmptyDataError:
+            return pd.DataFrame()
+
+    def close(self):
+        pass
+
+
+def read_date_window(sheet, start_date, end_date, header_row=0):
+    # rows of a daily sheet (Month, Day and Year columns, eg. Climate or Release) from start_date to end_date,
+    # both included, located by their dates instead of by their position in the sheet
+    # sheet is an openpyxl worksheet (eg. pd.ExcelFile(...).book['Climate']) or a TableSheet, it is streamed row by
+    # row and the reading stops after end_date, so the cost grows with the simulated window and not with the sheet
+    # length
+    # returns the rows above the header row and a dict of numpy arrays by column name
+    start_day = datetime.strptime(start_date, "%Y %m %d")
+    end_day = datetime.strptime(end_date, "%Y %m %d")
+    start = (start_day.year, start_day.month, start_day.day)
+    end = (end_day.year, end_day.month, end_day.day)
+
+    rows = sheet.iter_rows(values_only=True)
+    top = [next(rows) for k in range(header_row)]
+    header = list(next(rows))
+    month, day, year = header.index('Month'), header.index('Day'), header.index('Year')
+
+    window = []
+    for row in rows:
+        if row[year] is None:
+            break
+        date = (int(row[year]), int(row[month]), int(row[day]))
+        if date < start:
+            continue
+        if date > end:
+            break
+        window.append(row)
+
+    sim_days = (end_day - start_day).days + 1
+    if len(window) != sim_days or (int(window[0][year]), int(window[0][month]), int(window[0][day])) != start:
+        raise ValueError("the %s sheet has %d of the %d days from %s to %s"
+                         % (sheet.title, len(window), sim_days, start_date, end_date))
+
+    columns = OrderedDict()
+    for k, name in enumerate(header):
+        if name is None:
+            continue
+        values = [np.nan if row[k] is None else row[k] for row in window]
+        try:
+            columns[name] = np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            columns[name] = np.array(values, dtype=object)
+    return top, columns
+
+
+def convert_workbook(workbook, folder=None, table_format='csv'):
+    # write every sheet of an xlsx workbook to folder (the workbook path without .xlsx by default) as a csv or
+    # parquet table of its cell values, returns the folder
+    if folder is None:
+        folder = os.path.splitext(workbook)[0]
+    if table_format not in ['csv', 'parquet']:
+        raise ValueError('table format should be csv or parquet, not %s' % table_format)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    excel = pd.ExcelFile(workbook)
+    try:
+        for sheet_name in excel.sheet_names:
+            rows = [[cell_text(value) for value in row] for row in excel.book[sheet_name].iter_rows(values_only=True)]
+            # all the rows have the same number of cells, as in the worksheet
+            width = max([len(row) for row in rows] + [0])
+            rows = [row + [''] * (width - len(row)) for row in rows]
+            path = os.path.join(folder, sheet_name + '.' + table_format)
+            if table_format == 'csv':
+                with open(path, 'w', newline='') as f:
+                    csv.writer(f).writerows(rows)
+            else:
+                pd.DataFrame(rows, columns=[str(k) for k in range(width)]).to_parquet(path, index=False)
+    finally:
+        excel.close()
+    return folder
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert ChemFate input workbooks (.xlsx) to folders of sheet '
+                                                 'tables, which load faster.')
+    parser.add_argument('workbooks', nargs='+', help='input workbooks, eg. Input/Region.xlsx')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='table format (default: csv)')
+    parser.add_argument('--output', default=None,
+                        help='output folder, only with one workbook (default: the workbook path without .xlsx)')
+    args = parser.parse_args()
+    if args.output is not None and len(args.workbooks) > 1:
+        parser.error('--output needs a single workbook')
+    for workbook in args.workbooks:
+        print('%s -> %s' % (workbook, convert_workbook(workbook, args.output, args.format)))
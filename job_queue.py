@@ -0,0 +1,261 @@
+from __future__ import division
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+CUR_PATH = os.path.dirname(os.path.abspath(__file__))
+
+
+##################################################################
+#
+#   Queue of model runs shared by several users
+#
+#################################################################
+
+# the runs are submitted to a bounded process pool, so they do not run in the process of the app (or service)
+# that takes the requests, each run (job) has its own folder under JOB_ROOT:
+#   input/     the chemical, region and release files of the run
+#   output/    the result files, named with RUN_NAME
+#   progress.json, written by the worker: state, days solved, simulated days, start and end time, error
+# a finished job is reused by a new submission of the same input files and settings (same key), its folder is
+# removed when it was last used more than max_age ago or when the folders under JOB_ROOT take more than max_bytes
+# (least recently used first)
+# set CHEMFATE_JOB_DIR to move the job folders and CHEMFATE_JOB_WORKERS to set the number of worker processes
+# the workers are spawned, they import the main module of the process again, so a script creating a JobQueue
+# does it under if __name__ == '__main__' (streamlit and job_service do)
+
+JOB_ROOT = os.environ.get('CHEMFATE_JOB_DIR', os.path.join(tempfile.gettempdir(), 'chemfate_jobs'))
+JOB_WORKERS = int(os.environ.get('CHEMFATE_JOB_WORKERS', min(2, os.cpu_count() or 1)))
+# jobs waiting for a worker, more submissions are refused until some start
+MAX_QUEUED = 16
+JOB_MAX_AGE = 24 * 3600
+JOB_MAX_BYTES = 2 * 1024 ** 3
+# the result files of a job are written under this name, give the output name when they are saved or zipped
+RUN_NAME = 'chemfate-run'
+INPUT_FILES = ['chem_file', 'region_file', 'release_file']
+# settings of a run (Model_SetUp arguments) and their defaults
+RUN_SETTINGS = OrderedDict([('chem_type', None), ('start_date', None), ('end_date', None), ('run_option', 1),
+                            ('bgPercOption2', 10), ('solver_method', 'vode'), ('output_format', 'csv'),
+                            ('plots', 'all')])
+# the worker writes progress.json at most this often (s)
+PROGRESS_INTERVAL = 0.5
+
+
+def init_worker():
+    # the solvers read helper files relative to the working directory, and the model is imported once per
+    # worker, not once per run, the plots of a run are rendered by its worker
+    os.chdir(CUR_PATH)
+    import model_setup
+    import generate_result
+    generate_result.PLOT_WORKERS = 0
+
+
+def worker_ready():
+    return os.getpid()
+
+
+def write_progress(job_dir, progress):
+    # written to a temporary file first, so a reader never sees a partial file
+    tmp_file = os.path.join(job_dir, 'progress.json.%d.tmp' % os.getpid())
+    with open(tmp_file, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_file, os.path.join(job_dir, 'progress.json'))
+
+
+def read_progress(job_dir):
+    try:
+        with open(os.path.join(job_dir, 'progress.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_job(job_dir, settings):
+    # one model run in a worker process, the input files are in job_dir/input
+    from model_setup import Model_SetUp
+    progress = {'state': 'running', 'days': 0, 'time': 0, 'start': time.time(), 'end': None, 'error': ''}
+    write_progress(job_dir, progress)
+    last_write = [0]
+
+    def solver_progress(days, sim_days):
+        progress['days'], progress['time'] = days, sim_days
+        if time.time() - last_write[0] >= PROGRESS_INTERVAL:
+            write_progress(job_dir, progress)
+            last_write[0] = time.time()
+
+    output_path = os.path.join(job_dir, 'output')
+    os.makedirs(output_path)
+    inputs = [os.path.join(job_dir, 'input', name + '.xlsx') for name in INPUT_FILES]
+    try:
+        model = Model_SetUp(settings['start_date'], settings['end_date'], settings['run_option'],
+                            settings['bgPercOption2'], settings['chem_type'], inputs[0], inputs[1], inputs[2],
+                            output_path, RUN_NAME, settings['solver_method'], settings['output_format'],
+                            settings['plots'], solver_progress)
+        model.run_model()
+        progress['state'] = 'done'
+        progress['days'] = progress['time']
+    except Exception as e:
+        progress['state'] = 'failed'
+        progress['error'] = '%s: %s' % (type(e).__name__, e)
+    progress['end'] = time.time()
+    write_progress(job_dir, progress)
+    return progress['state']
+
+
+def folder_size(folder):
+    size = 0
+    for path, dirs, files in os.walk(folder):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(path, name))
+            except OSError:
+                pass
+    return size
+
+
+class Job:
+
+    def __init__(self, job_id, key, job_dir, settings):
+        self.id = job_id
+        self.key = key
+        self.dir = job_dir
+        self.settings = settings
+        self.submitted = time.time()
+        self.future = None
+
+    def progress(self):
+        # state ('queued', 'running', 'done' or 'failed'), days solved, simulated days, start and end time
+        # and error of the run
+        progress = read_progress(self.dir)
+        if progress is None:
+            progress = {'state': 'queued', 'days': 0, 'time': 0, 'start': None, 'end': None, 'error': ''}
+        if self.future is not None and self.future.done() and progress['state'] in ['queued', 'running']:
+            # the worker died (or progress.json was removed) before the end of the run
+            progress['state'] = 'failed'
+            error = self.future.exception()
+            progress['error'] = '%s: %s' % (type(error).__name__, error) if error else 'the run was stopped'
+        return progress
+
+    def state(self):
+        return self.progress()['state']
+
+    def finished(self):
+        return self.state() in ['done', 'failed']
+
+    def output_files(self):
+        # result file names (with RUN_NAME) of a finished job
+        output_path = os.path.join(self.dir, 'output')
+        return sorted(os.listdir(output_path)) if os.path.isdir(output_path) else []
+
+    def output_path(self, name):
+        return os.path.join(self.dir, 'output', name)
+
+
+class JobQueue:
+
+    def __init__(self, root=JOB_ROOT, workers=JOB_WORKERS, max_queued=MAX_QUEUED, max_age=JOB_MAX_AGE,
+                 max_bytes=JOB_MAX_BYTES):
+        self.root = os.path.abspath(root)
+        self.max_queued = max_queued
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        # the workers are started with spawn, not forked from the process of the app (or service), which runs
+        # threads (eg. streamlit's) that a forked child would copy in whatever state they are
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=init_worker)
+        # job id: Job, in the order of submission
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def warm_up(self):
+        # start the workers now (they import the model) instead of on the first run
+        self.pool.submit(worker_ready).result()
+
+    def job_key(self, inputs, settings):
+        h = hashlib.sha256()
+        for name in INPUT_FILES:
+            h.update(hashlib.sha256(inputs[name]).digest())
+        h.update(repr([(name, settings[name]) for name in RUN_SETTINGS]).encode())
+        return h.hexdigest()
+
+    def submit(self, inputs, settings):
+        # inputs: the content (bytes) of chem_file, region_file and release_file, settings: see RUN_SETTINGS
+        # returns the job, a finished or running job with the same key if there is one
+        settings = dict((name, settings.get(name, default)) for name, default in RUN_SETTINGS.items())
+        for name, value in settings.items():
+            if value is None:
+                raise ValueError('the run has no %s' % name)
+        for name in INPUT_FILES:
+            if not inputs.get(name):
+                raise ValueError('the run has no %s' % name)
+        key = self.job_key(inputs, settings)
+
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and job.state() != 'failed' and os.path.isdir(job.dir):
+                    # the folder age is its last use, see evict
+                    os.utime(job.dir)
+                    return job
+            queued = len([job for job in self.jobs.values() if job.state() == 'queued'])
+            if queued >= self.max_queued:
+                raise RuntimeError('%d runs are waiting already, please try again later' % queued)
+
+            job_id = uuid.uuid4().hex[:16]
+            job_dir = os.path.join(self.root, 'job_' + job_id)
+            os.makedirs(os.path.join(job_dir, 'input'))
+            for name in INPUT_FILES:
+                with open(os.path.join(job_dir, 'input', name + '.xlsx'), 'wb') as f:
+                    f.write(inputs[name])
+            job = Job(job_id, key, job_dir, settings)
+            job.future = self.pool.submit(run_job, job_dir, settings)
+            self.jobs[job_id] = job
+        self.evict()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def position(self, job):
+        # number of queued jobs submitted before job, 0 when it is next (or not queued anymore)
+        if job.state() != 'queued':
+            return 0
+        with self.lock:
+            queued = [other for other in self.jobs.values() if other.state() == 'queued']
+        return queued.index(job) if job in queued else 0
+
+    def evict(self, keep=()):
+        # remove the folders under root (finished jobs and any other folder) not modified (or reused, see
+        # submit) for max_age, then the least recently used ones while all the folders take more than
+        # max_bytes, the queued and running jobs and the folders in keep stay
+        with self.lock:
+            active = set(job.dir for job in self.jobs.values() if not job.finished())
+            active.update(os.path.abspath(folder) for folder in keep)
+            folders = []
+            for name in os.listdir(self.root):
+                folder = os.path.abspath(os.path.join(self.root, name))
+                if os.path.isdir(folder):
+                    folders.append((os.path.getmtime(folder), folder_size(folder), folder))
+            folders.sort()
+            total = sum(size for modified, size, folder in folders)
+            now = time.time()
+            for modified, size, folder in folders:
+                if folder in active:
+                    continue
+                if now - modified > self.max_age or total > self.max_bytes:
+                    shutil.rmtree(folder, ignore_errors=True)
+                    total -= size
+            for job_id in [job_id for job_id, job in self.jobs.items() if not os.path.isdir(job.dir)]:
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,232 @@
+from __future__ import division
+import os
+import re
+import json
+import shutil
+import zipfile
+import argparse
+import email.policy
+from datetime import datetime
+from email.parser import BytesParser
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from job_queue import JobQueue, JOB_WORKERS, INPUT_FILES, RUN_SETTINGS, RUN_NAME
+from model_solver import check_solver_method
+from result_writer import OUTPUT_FORMATS
+from generate_result import PLOT_OPTIONS
+
+
+##################################################################
+#
+#   Local HTTP service running ChemFate jobs
+#
+#################################################################
+
+# a small http api over job_queue, for tools driving the model without the GUIs, all the clients share the warm
+# worker processes of one JobQueue
+#   POST /jobs                       multipart/form-data with the files chem_file, region_file and release_file and
+#                                    the fields of RUN_SETTINGS (chem_type, start_date, end_date, ...), eg.
+#                                    curl -F chem_file=@Input/ChemParam_metal.xlsx ... -F chem_type=Metal
+#                                    answers 202 with the job (or 200 with a finished job of the same inputs),
+#                                    413 for a body over MAX_BODY_BYTES
+#   GET  /jobs                       all the jobs
+#   GET  /jobs/<id>                  state, days solved, simulated days, queue position, error and files of a job
+#   GET  /jobs/<id>/files/<name>     a result file
+#   GET  /jobs/<id>/zip?name=<name>  all the result files in a zip, named with name (default: the job id), made of
+#                                    letters, digits, _, . and -
+# the answers are json, except the files, which are streamed
+# python job_service.py --port 8000 starts it on localhost
+
+# size of the blocks a result file is sent in
+BLOCK_BYTES = 1 << 20
+# largest body of a POST, the three input workbooks (the bundled ones take about 2 MB)
+MAX_BODY_BYTES = 64 * 1024 ** 2
+# the output names accepted by zip, they go into the Content-Disposition header and the names of the zip entries
+OUTPUT_NAME = re.compile(r'[A-Za-z0-9_.-]+$')
+
+
+def parse_form(content_type, body):
+    # field name: value (bytes) of a multipart/form-data body
+    message = BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    if not message.is_multipart():
+        raise ValueError('the body should be multipart/form-data')
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if name:
+            fields[name] = part.get_payload(decode=True) or b''
+    return fields
+
+
+def run_settings(fields):
+    # the settings of RUN_SETTINGS given as form fields, with the numbers converted, a ValueError for a setting
+    # the model does not know, so the request is refused instead of the run failing in a worker
+    settings = {}
+    for name in RUN_SETTINGS:
+        if name in fields:
+            settings[name] = fields[name].decode().strip()
+    if 'run_option' in settings:
+        settings['run_option'] = int(settings['run_option'])
+    if 'bgPercOption2' in settings:
+        settings['bgPercOption2'] = float(settings['bgPercOption2'])
+    days = {}
+    for name in ['start_date', 'end_date']:
+        if name in settings:
+            try:
+                days[name] = datetime.strptime(settings[name], '%Y %m %d')
+            except ValueError:
+                raise ValueError('%s should be a date as year month day (eg. 2005 1 31), not %s'
+                                 % (name, settings[name]))
+    if len(days) == 2 and days['end_date'] < days['start_date']:
+        raise ValueError('end_date %s is before start_date %s' % (settings['end_date'], settings['start_date']))
+    if 'chem_type' in settings:
+        check_solver_method(settings['chem_type'], settings.get('solver_method', RUN_SETTINGS['solver_method']))
+    output_format = settings.get('output_format', RUN_SETTINGS['output_format'])
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('output_format should be one of %s, not %s' % (', '.join(OUTPUT_FORMATS), output_format))
+    plots = settings.get('plots', RUN_SETTINGS['plots'])
+    if plots not in PLOT_OPTIONS:
+        raise ValueError('plots should be one of %s, not %s' % (', '.join(PLOT_OPTIONS), plots))
+    return settings
+
+
+def job_status(queue, job):
+    status = job.progress()
+    status['id'] = job.id
+    status['position'] = queue.position(job)
+    status['settings'] = job.settings
+    status['files'] = job.output_files() if status['state'] == 'done' else []
+    return status
+
+
+class JobHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {'error': message})
+
+    def path_parts(self):
+        url = urlparse(self.path)
+        return [part for part in url.path.split('/') if part], parse_qs(url.query)
+
+    def do_POST(self):
+        parts, query = self.path_parts()
+        if parts != ['jobs']:
+            return self.send_error_json(404, 'not found')
+        queue = self.server.queue
+        length = self.headers.get('Content-Length')
+        if length is None:
+            return self.send_error_json(411, 'the request has no Content-Length')
+        if not length.strip().isdigit():
+            return self.send_error_json(400, 'invalid Content-Length %r' % length)
+        if int(length) > MAX_BODY_BYTES:
+            # the body is not read, so the connection cannot be used for another request
+            self.close_connection = True
+            return self.send_error_json(413, 'the body takes more than %d bytes' % MAX_BODY_BYTES)
+        try:
+            fields = parse_form(self.headers.get('Content-Type', ''), self.rfile.read(int(length)))
+            inputs = dict((name, fields.get(name)) for name in INPUT_FILES)
+            job = queue.submit(inputs, run_settings(fields))
+        except ValueError as e:
+            return self.send_error_json(400, str(e))
+        except RuntimeError as e:
+            # the queue is full
+            return self.send_error_json(503, str(e))
+        status = job_status(queue, job)
+        self.send_json(200 if status['state'] == 'done' else 202, status)
+
+    def do_GET(self):
+        parts, query = self.path_parts()
+        queue = self.server.queue
+        if parts == ['jobs']:
+            return self.send_json(200, [job_status(queue, job) for job in list(queue.jobs.values())])
+        if len(parts) < 2 or parts[0] != 'jobs' or queue.get(parts[1]) is None:
+            return self.send_error_json(404, 'not found')
+        job = queue.get(parts[1])
+        if len(parts) == 2:
+            return self.send_json(200, job_status(queue, job))
+        if job.state() != 'done':
+            return self.send_error_json(409, 'the job is %s' % job.state())
+        if len(parts) == 4 and parts[2] == 'files' and parts[3] in job.output_files():
+            return self.send_file(job.output_path(parts[3]))
+        if len(parts) == 3 and parts[2] == 'zip':
+            file_name = query.get('name', [job.id])[0]
+            if not OUTPUT_NAME.match(file_name) or '..' in file_name:
+                return self.send_error_json(400, 'name should be made of letters, digits, _, . and -, not %r'
+                                            % file_name)
+            return self.send_zip(job, file_name)
+        return self.send_error_json(404, 'not found')
+
+    def send_file(self, path):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, BLOCK_BYTES)
+
+    def send_zip(self, job, file_name):
+        # written to the connection as it is built, so its length is not known and the connection is closed
+        # at its end
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Disposition', 'attachment; filename="%s.zip"' % file_name)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        with zipfile.ZipFile(self.wfile, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for name in job.output_files():
+                with open(job.output_path(name), 'rb') as f, \
+                        zip_file.open(name.replace(RUN_NAME, file_name), 'w') as entry:
+                    shutil.copyfileobj(f, entry, BLOCK_BYTES)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class JobService(ThreadingHTTPServer):
+    # every request is answered in its own thread, the runs go to the worker processes of queue
+    daemon_threads = True
+
+    def __init__(self, address, queue, verbose=True):
+        ThreadingHTTPServer.__init__(self, address, JobHandler)
+        self.queue = queue
+        self.verbose = verbose
+
+
+def serve(host='127.0.0.1', port=8000, workers=JOB_WORKERS, root=None, verbose=True):
+    queue = JobQueue(workers=workers) if root is None else JobQueue(root, workers=workers)
+    # start the workers (and import the model in them) before the first request
+    queue.warm_up()
+    service = JobService((host, port), queue, verbose)
+    print('ChemFate job service on http://%s:%d, %d workers, job folders in %s'
+          % (host, service.server_address[1], workers, queue.root))
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        queue.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local HTTP service that queues ChemFate runs.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='port (default: 8000)')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS,
+                        help='number of worker processes (default: %d)' % JOB_WORKERS)
+    parser.add_argument('--jobs', default=None, help='folder of the jobs (default: CHEMFATE_JOB_DIR or a temporary '
+                                                     'folder)')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.jobs)
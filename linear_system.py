@@ -0,0 +1,140 @@
+from __future__ import division
+import numpy as np
+from scipy.linalg import expm
+from scipy.integrate import ode
+
+
+##################################################################
+#
+#   Daily linear operator for the organoFate/ionOFate/metalFate odes
+#
+#################################################################
+
+# within one simulated day every flux in org_ode, ion_ode and metal_ode is a D-value times the
+# state of one compartment, plus a release or an advective inflow that does not depend on the state,
+# so each of these odes is dYdt = A*Y + b with A and b fixed for the day
+# the odes also accept a state matrix (one column per state), which is used to evaluate all the columns of A
+# in a single call
+
+
+def no_source(release, bgConc):
+    # copies of release and bgConc with every value set to 0, the ode evaluated with them only keeps
+    # the D-value (loss and transfer) terms
+    # the zero series is shared between the release keys, so this is cheap to build
+    zero_release = {}
+    zero_series = None
+    for key, value in release.items():
+        if key in ['dates', 'matrix']:
+            continue
+        if zero_series is None:
+            zero_series = np.zeros(len(value))
+        zero_release[key] = zero_series
+    zero_bgConc = dict.fromkeys(bgConc, 0.0)
+    return zero_release, zero_bgConc
+
+
+def assemble_linear_system(ode_func, n, f_params, f_params_no_source):
+    # build A (n x n) and b (n) of the day from the ode function itself
+    # b is the ode at Y = 0 with the sources, column k of A is the ode at the unit vector e_k without
+    # the sources, so A is not affected by round-off from the (much larger) release terms
+    b = np.array(ode_func(0, np.zeros(n), *f_params), dtype=float)
+    return linear_matrix(ode_func, n, f_params_no_source), b
+
+
+def linear_matrix(ode_func, n, f_params_no_source):
+    # A (n x n) alone, which is also the (exact) jacobian of the ode
+    # the ode is evaluated once for the states [e_1 ... e_n, 0], column k of A is its value at e_k minus its
+    # value at 0, so A is right (up to round-off) even if the parameters still have sources
+    Y = np.zeros((n, n + 1))
+    Y[:, :n] = np.eye(n)
+    M = stacked(ode_func(0, Y, *f_params_no_source), n + 1)
+    return M[:, :n] - M[:, n:]
+
+
+def stacked(values, m):
+    # list of per-compartment (or per-process) values from an ode evaluated for m states at once, some are
+    # scalars (no source or state term), as an (len(values) x m) array
+    out = np.empty((len(values), m))
+    for k, value in enumerate(values):
+        out[k] = value
+    return out
+
+
+class DayJacobian:
+    # jacobian callback for vode, vode asks for the jacobian several times a day but the jacobian of these
+    # odes only changes with the day (the first ode parameter i), so it is built once per day and reused
+    def __init__(self, jac):
+        self.jac = jac
+        self.day = None
+        self.J = None
+
+    def __call__(self, t, y, i, *params):
+        if i != self.day:
+            self.day = i
+            self.J = vode_layout(self.jac(t, y, i, *params))
+        return self.J
+
+
+def linear_ode(t, y, A, b):
+    # unit follows the wrapped ode, eg. Pa/day for fugacity
+    return A.dot(y) + b
+
+
+def linear_jac(t, y, A, b):
+    # the jacobian of A*y + b is A
+    return vode_layout(A)
+
+
+def vode_reads_transposed():
+    # the C version of the vode wrapper in recent scipy releases reads the matrix returned by jac transposed,
+    # which layout works is found by solving a small non-symmetric linear system with both layouts and
+    # keeping the one that needs fewer rhs evaluations (the wrong one makes the Newton iterations fail)
+    # vode is not reentrant, so this has to run outside of any integration, it is done once on import
+    M = np.array([[-1.0, 0.0], [50.0, -2.0]])
+    calls = []
+    for layout in [M, M.T]:
+        count = [0]
+
+        def rhs(t, y):
+            count[0] += 1
+            return M.dot(y)
+        r = ode(rhs, lambda t, y: layout).set_integrator('vode', method='bdf', with_jacobian=True,
+                                                         rtol=1e-10, atol=1e-14)
+        r.set_initial_value([1.0, 0.0], 0)
+        r.integrate(1.0)
+        calls.append(count[0])
+    return calls[1] < calls[0]
+
+
+vode_transposed = vode_reads_transposed()
+
+
+def vode_layout(J):
+    # J[i, j] = df[i]/dy[j] arranged the way the installed scipy's vode reads it
+    if vode_transposed:
+        return J.T
+    return J
+
+
+def expm_step(A, b, y, dt=1.0):
+    # exact solution of dYdt = A*Y + b after dt days, Y(t+dt) = expm(A*dt)*Y + A^-1*(expm(A*dt) - I)*b
+    # evaluated through the augmented matrix [[A, b], [0, 0]] so that A does not need to be invertible
+    # (eg. a compartment that is not present has a zero row and column)
+    n = len(b)
+    M = np.zeros((n + 1, n + 1))
+    M[:n, :n] = A * dt
+    M[:n, n] = b * dt
+    return expm(M)[:n].dot(np.append(y, 1.0))
+
+
+def expm_step_many(A, B, Y, dt=1.0):
+    # expm_step for several states that share A, eg. the release scenarios of one chemical, Y and B are
+    # (n x m) with one column per scenario
+    # expm of [[A, I], [0, 0]] gives expm(A*dt) and Phi = A^-1*(expm(A*dt) - I) at once, so the cost does not
+    # grow with the number of scenarios, Y(t+dt) = expm(A*dt)*Y + Phi*B
+    n = A.shape[0]
+    M = np.zeros((2 * n, 2 * n))
+    M[:n, :n] = A * dt
+    M[:n, n:] = np.eye(n) * dt
+    E = expm(M)
+    return E[:n, :n].dot(Y) + E[:n, n:].dot(B)
@@ -4,6 +4,7 @@ from datetime import datetime
 from numpy import *
 import pandas as pd
 import numpy as np
+from input_cache import InputBook
 
 
 #################################################################
@@ -14,6 +15,43 @@ import numpy as np
 #################################################################
 
 
+# release channels of the Release sheet, in the column order of the release matrix:
+# key of the release dict, column of the sheet
+RELEASE_CHANNELS = [('air', "Air (kg/day)"),
+                    ('rw', "Riverwater (kg/day)"),
+                    ('rSS', "Riverwater Suspended Sediment (kg/day)"),
+                    ('rwSed', "Riverwater Sediment (kg/day)"),
+                    ('fw', "Freshwater (kg/day)"),
+                    ('fSS', "Freshwater Suspended Sediment (kg/day)"),
+                    ('fwSed', "Freshwater Sediment (kg/day)"),
+                    ('sw', "Seawater (kg/day)"),
+                    ('sSS', "Seawater Suspended Sediment (kg/day)"),
+                    ('swSed', "Seawater Sediment (kg/day)"),
+                    ('soil1', "Undeveloped Surface Soil (kg/day)"),
+                    ('dsoil1', "Undeveloped Deep Soil (kg/day)"),
+                    ('soil2', "Urban Surface Soil (kg/day)"),
+                    ('dsoil2', "Urban Deep Soil (kg/day)"),
+                    ('soil3', "Agricultural Surface Soil (kg/day)"),
+                    ('dsoil3', "Agricultural Deep Soil (kg/day)"),
+                    ('soil4', "Agricultural Surface Soil Biosolid (kg/day)"),
+                    ('dsoil4', "Agricultural Deep Soil Biosolid (kg/day)")]
+
+
+def release_matrix(columns):
+    # the release of the simulated days as one (days x channels) float64 matrix in RELEASE_CHANNELS order,
+    # columns is the dict returned by input_tables.read_date_window for the Release sheet (kg/day)
+    return np.column_stack([np.asarray(columns[column], dtype=float) for key, column in RELEASE_CHANNELS])
+
+
+def add_release_series(release, matrix):
+    # release['matrix'] is the (days x channels) matrix for the stages that work on all channels at once,
+    # release[key] the series of one channel (a contiguous copy of its column) as indexed day by day by the odes
+    release['matrix'] = matrix
+    for k, (key, column) in enumerate(RELEASE_CHANNELS):
+        release[key] = np.ascontiguousarray(matrix[:, k])
+    return release
+
+
 class LoadData:
 
     def __init__(self, chem_type, chem_file, region_file, release_file, start_date, end_date, sim_days):
@@ -24,22 +62,27 @@ class LoadData:
         self.start_date = start_date
         self.end_date = end_date
         self.sim_days = sim_days
-
-    def load_date(self):
-        # load the start rows and end rows from the climate dataset
-        original_start_date = datetime.strptime('2005 1 1', "%Y %m %d")
-        start_day = datetime.strptime(self.start_date, "%Y %m %d")
-        start_row = (start_day - original_start_date).days + 1
-        end_day = datetime.strptime(self.end_date, "%Y %m %d")
-        sim_days = (end_day - start_day).days
-        end_row = start_row + sim_days + 1
-        return start_row, end_row
-
+        # workbooks opened by this loader, see workbook()
+        self.workbooks = {}
+
+    def workbook(self, source):
+        # each workbook (path or uploaded file) or folder of sheet tables (input_tables) is read through one
+        # InputBook, its sheets come from the cache when they were already parsed (input_cache), else from the
+        # workbook, opened once for all of them
+        key = id(source)
+        if key not in self.workbooks:
+            self.workbooks[key] = (source, InputBook(source))
+        return self.workbooks[key][1]
+
+    def close_workbooks(self):
+        for source, workbook in self.workbooks.values():
+            workbook.close()
+        self.workbooks = {}
 
     def get_Koc_acid(self, smiles, cas):
         # if the chemical is organic acid, this parameter would be used to calculate Kd_i in soil
         Koc_acid = None
-        df = pd.read_excel('./IonizableChem_DB.xlsx', sheet_name='Koc_organicAcid')
+        df = self.workbook('./IonizableChem_DB.xlsx').parse(sheet_name='Koc_organicAcid')
         # check if smiles in the SMILES column
         # if contains, a row of values would return
         # if not contain, an empty dataframe would return
@@ -86,7 +129,7 @@ class LoadData:
 
     def load_chemParams(self, chem_type, env):
         # load chemical properties
-        df = pd.read_excel(self.chem_file, sheet_name="Sheet1")
+        df = self.workbook(self.chem_file).parse(sheet_name="Sheet1")
         chem_loading = zip(df["Code"], df["Value"])
         chem_params = {}
         for code, value in chem_loading:
@@ -229,7 +272,7 @@ class LoadData:
 
     def load_compart_presence(self):
         # load presence of each compartment
-        df = pd.read_excel(self.region_file, sheet_name="Presence")
+        df = self.workbook(self.region_file).parse(sheet_name="Presence")
         presence_loading = zip(df["Code"], df["Presence"])
         presence = OrderedDict()
         for name, value in presence_loading:
@@ -240,7 +283,7 @@ class LoadData:
 
     def load_env_params(self, climate, sim_days):
         # load the environmental parameters
-        df = pd.read_excel(self.region_file, sheet_name="Environment")
+        df = self.workbook(self.region_file).parse(sheet_name="Environment")
         env_loading = zip(df["Code"], df["Value"])
         env = {}
         for code, value in env_loading:
@@ -262,7 +305,7 @@ class LoadData:
 
         # volume calculation
         env['areaV'] = env['area'] * env['airH']
-        env['rWaterV'] = [(x * env['riverL']) for x in climate['waterflow1_s']] # cross section area * length of river = volume; river water volume directly correlated with flow
+        env['rWaterV'] = climate['waterflow1_s'] * env['riverL'] # cross section area * length of river = volume; river water volume directly correlated with flow
         env['fWaterV'] = env['freshwA'] * env['freshwD']
         env['sWaterV'] = env['seawA'] * env['seawD']
         # kg-aer/m3-air * m3-air / (kg-aer/m3-aer) = m3 aer
@@ -371,43 +414,36 @@ class LoadData:
         return env
 
     def load_climate(self):
-        # load climate parameters
-        start_row, end_row = self.load_date()
-        df = pd.read_excel(self.region_file, sheet_name="Climate")
-        df = df.iloc[start_row:end_row]
-        climate_month = df["Month"].tolist()
-        climate_day = df["Day"].tolist()
-        climate_year = df["Year"].tolist()
+        # load climate parameters of the simulated days, as numpy arrays
+        top, df = self.workbook(self.region_file).date_window("Climate", self.start_date, self.end_date)
         # precipitation unit: mm/day
-        climate_precip = df["Precipitation (mm/day)"].tolist()
+        climate_precip = df["Precipitation (mm/day)"]
         # windspeed unit: m/second
-        climate_windspeed = df["Windspeed (m/second)"].tolist()
+        climate_windspeed = df["Windspeed (m/second)"]
         # water flow unit: m3/second
-        climate_flow1 = df["River Flow (m^3/s)"].tolist() # river
-        climate_flow2 = df["Lake flow (m^3/s)"].tolist() # lake
+        climate_flow1 = df["River Flow (m^3/s)"] # river
+        climate_flow2 = df["Lake flow (m^3/s)"] # lake
         # temperature unit: C
-        climate_temp = df["Temperature ('C)"].tolist()
+        climate_temp = df["Temperature ('C)"]
         # evaporation unit: mm
-        climate_evap = df["Evaporation (mm)"].tolist()
+        climate_evap = df["Evaporation (mm)"]
 
-        new_month = [int(i) for i in climate_month]
-        new_day = [int(i) for i in climate_day]
-        new_year = [int(i) for i in climate_year]
-        date = zip(new_year, new_month, new_day)
+        date = list(zip(df["Year"].astype(int).tolist(), df["Month"].astype(int).tolist(),
+                        df["Day"].astype(int).tolist()))
 
         # unit conversion
         climate = OrderedDict()
         climate['dates'] = date
         climate['precip_mm'] = climate_precip  # mm/day
-        climate['precip_m'] = [(x / 1000.0) for x in climate['precip_mm']]  # m/day
+        climate['precip_m'] = climate['precip_mm'] / 1000.0  # m/day
         climate['windspeed_s'] = climate_windspeed  # m/second
-        climate['windspeed_d'] = [(x * 86400.0) for x in climate['windspeed_s']]  # m/day
+        climate['windspeed_d'] = climate['windspeed_s'] * 86400.0  # m/day
         climate['waterflow1_s'] = climate_flow1  # m3/s
-        climate['waterflow1_d'] = [(x * 86400.0) for x in climate['waterflow1_s']]  # m^3/day
+        climate['waterflow1_d'] = climate['waterflow1_s'] * 86400.0  # m^3/day
         climate['waterflow2_s'] = climate_flow2  # m3/s
-        climate['waterflow2_d'] = [(x * 86400.0) for x in climate['waterflow2_s']]  # m^3/day
+        climate['waterflow2_d'] = climate['waterflow2_s'] * 86400.0  # m^3/day
         climate['temp_C'] = climate_temp  # C - celcius
-        climate['temp_K'] = [(x + 273.15) for x in climate['temp_C']]  # K
+        climate['temp_K'] = climate['temp_C'] + 273.15  # K
         climate['evap_mm'] = climate_evap
 
         return climate
@@ -415,7 +451,7 @@ class LoadData:
 
     def load_bg_conc(self, chem_params):
         # load background concentration
-        df = pd.read_excel(self.release_file, sheet_name="bgConc", skiprows=1)
+        df = self.workbook(self.release_file).parse(sheet_name="bgConc", skiprows=1)
         bgConc_loading = zip(df["Code"], df["kg/m^3"])
         bgConc = {}
         for code, value in bgConc_loading:
@@ -428,74 +464,31 @@ class LoadData:
 
     def load_release(self, chem_params, presence):
         # load release data
-        start_row, end_row = self.load_date()
-        # to take into account of the row of release scenario
-        df = pd.read_excel(self.release_file, sheet_name="Release", skiprows=1)
-        df2 = pd.read_excel(self.release_file, sheet_name="Release", index_col="Release Scenario")
-        release_scenario = df2.columns[0]
-        df = df.iloc[start_row:end_row]
-        release_month = df["Month"].tolist()
-        release_day = df["Day"].tolist()
-        release_year = df["Year"].tolist()
-        release_air = df["Air (kg/day)"].tolist()
-        release_rw = df["Riverwater (kg/day)"].tolist()
-        release_rSS = df["Riverwater Suspended Sediment (kg/day)"].tolist()
-        release_rwSed = df["Riverwater Sediment (kg/day)"].tolist()
-        release_fw = df["Freshwater (kg/day)"].tolist()
-        release_fSS = df["Freshwater Suspended Sediment (kg/day)"].tolist()
-        release_fwSed = df["Freshwater Sediment (kg/day)"].tolist()
-        release_sw = df["Seawater (kg/day)"].tolist()
-        release_sSS = df["Seawater Suspended Sediment (kg/day)"].tolist()
-        release_swSed = df["Seawater Sediment (kg/day)"].tolist()
-        release_soil1 = df["Undeveloped Surface Soil (kg/day)"].tolist()
-        release_dsoil1 = df["Undeveloped Deep Soil (kg/day)"].tolist()
-        release_soil2 = df["Urban Surface Soil (kg/day)"].tolist()
-        release_dsoil2 = df["Urban Deep Soil (kg/day)"].tolist()
-        release_soil3 = df["Agricultural Surface Soil (kg/day)"].tolist()
-        release_dsoil3 = df["Agricultural Deep Soil (kg/day)"].tolist()
-        release_soil4 = df["Agricultural Surface Soil Biosolid (kg/day)"].tolist()
-        release_dsoil4 = df["Agricultural Deep Soil Biosolid (kg/day)"].tolist()
-        # Create Datetime Objects
-        new_datetime = []
-        new_month = [int(i) for i in release_month]
-        new_day = [int(i) for i in release_day]
-        new_year = [int(i) for i in release_year]
-        dt = zip(new_year, new_month, new_day)
-
+        # the first row holds the release scenario, the column names are in the second row
+        top, df = self.workbook(self.release_file).date_window("Release", self.start_date, self.end_date,
+                                                                header_row=1)
+        release_scenario = top[0][list(top[0]).index("Release Scenario") + 1]
         release = {}
-        release['dates'] = dt
-
-        # mol/day
-        release['air'] = [(x / chem_params['molar_mass'])  for x in release_air]
-        release['rw'] = [(x / chem_params['molar_mass']) for x in release_rw]
-        release['rSS'] = [(x / chem_params['molar_mass']) for x in release_rSS]
-        release['rwSed'] = [(x / chem_params['molar_mass']) for x in release_rwSed]
-        release['fw'] = [(x / chem_params['molar_mass']) for x in release_fw]
-        release['fSS'] = [(x / chem_params['molar_mass']) for x in release_fSS]
-        release['fwSed'] = [(x / chem_params['molar_mass']) for x in release_fwSed]
-        release['sw'] = [(x / chem_params['molar_mass'])  for x in release_sw]
-        release['sSS'] = [(x / chem_params['molar_mass']) for x in release_sSS]
-        release['swSed'] = [(x / chem_params['molar_mass']) for x in release_swSed]
-        release['soil1'] = [(x / chem_params['molar_mass']) for x in release_soil1]
-        release['dsoil1'] = [(x / chem_params['molar_mass']) for x in release_dsoil1]
-        release['soil2'] = [(x / chem_params['molar_mass']) for x in release_soil2]
-        release['dsoil2'] = [(x / chem_params['molar_mass']) for x in release_dsoil2]
-        release['soil3'] = [(x / chem_params['molar_mass'])  for x in release_soil3]
-        release['dsoil3'] = [(x / chem_params['molar_mass']) for x in release_dsoil3]
-        release['soil4'] = [(x / chem_params['molar_mass']) for x in release_soil4]
-        release['dsoil4'] = [(x / chem_params['molar_mass']) for x in release_dsoil4]
+        release['dates'] = list(zip(df["Year"].astype(int).tolist(), df["Month"].astype(int).tolist(),
+                                    df["Day"].astype(int).tolist()))
+        # mol/day, converted for all the channels at once
+        add_release_series(release, release_matrix(df) / chem_params['molar_mass'])
 
         return release, release_scenario
 
 
     def run_loadData(self):
-        # run the functions above to load all of the data
-        presence = self.load_compart_presence()
-        climate = self.load_climate()
-        env = self.load_env_params(climate, self.sim_days)
-        chem_params = self.load_chemParams(self.chem_type, env)
-        bgConc = self.load_bg_conc(chem_params)
-        release, release_scenario = self.load_release(chem_params, presence)
+        # run the functions above to load all of the data, the sheets come from the cache (see workbook), so
+        # only the sheets (and simulated windows) that were never read before are parsed
+        try:
+            presence = self.load_compart_presence()
+            climate = self.load_climate()
+            env = self.load_env_params(climate, self.sim_days)
+            chem_params = self.load_chemParams(self.chem_type, env)
+            bgConc = self.load_bg_conc(chem_params)
+            release, release_scenario = self.load_release(chem_params, presence)
+        finally:
+            self.close_workbooks()
 
         return chem_params, presence, env, climate, bgConc, release, release_scenario
 
@@ -3,8 +3,9 @@ import collections
 from collections import OrderedDict
 from datetime import datetime
 import numpy as np
-import pandas as pd
 from advective_processes_nano import lsFactor
+from input_cache import InputBook
+from load_data import RELEASE_CHANNELS, release_matrix, add_release_series
 
 #################################################################
 #
@@ -18,8 +19,8 @@ from advective_processes_nano import lsFactor
 #################################################################
 
 
-def load_bgConc(filename, sheetname, presence):
-    df = pd.read_excel(filename, sheet_name=sheetname, skiprows=1)
+def load_bgConc(book, sheetname, presence):
+    df = book.parse(sheet_name=sheetname, skiprows=1)
     bgValues_code = df["Code"].tolist()
     bgValues_value = df["kg/m^3"].tolist()
     # convert to units of ug/m3
@@ -110,31 +111,21 @@ def load_bgConc(filename, sheetname, presence):
     return bgConc
 
 
-def load_climate(filename, sheetname, start_row, end_row):
-    df = pd.read_excel(filename, sheet_name=sheetname)
-    df = df.iloc[start_row:end_row]
+def load_climate(book, sheetname, start_date, end_date):
+    # climate of the simulated days as numpy arrays, located by date in the sheet (read_date_window)
+    top, df = book.date_window(sheetname, start_date, end_date)
 
     # Climate Parameter Loading
-    climate_month = df["Month"].tolist()
-    climate_day = df["Day"].tolist()
-    climate_year = df["Year"].tolist()
-    climate_precip = df["Precipitation (mm/day)"].tolist()
-    climate_windspeed = df["Windspeed (m/second)"].tolist()
-    climate_flow1 = df["River Flow (m^3/s)"].tolist()
-    climate_flow2 = df["Lake flow (m^3/s)"].tolist() # lake
-    climate_temp = df["Temperature ('C)"].tolist()
-    climate_evap = df["Evaporation (mm)"].tolist()
+    climate_precip = df["Precipitation (mm/day)"]
+    climate_windspeed = df["Windspeed (m/second)"]
+    climate_flow1 = df["River Flow (m^3/s)"]
+    climate_flow2 = df["Lake flow (m^3/s)"] # lake
+    climate_temp = df["Temperature ('C)"]
+    climate_evap = df["Evaporation (mm)"]
 
     # Create Datetime Objects
-    new_datetime = []
-    new_month = [int(i) for i in climate_month]
-    new_day = [int(i) for i in climate_day]
-    new_year = [int(i) for i in climate_year]
-    dt = zip(new_year, new_month, new_day)
-    for val in dt:
-        mystring = ' '.join(map(str, val))
-        dt = datetime.strptime(mystring, "%Y %m %d")
-        new_datetime.append(dt)
+    new_datetime = [datetime(int(year), int(month), int(day))
+                    for year, month, day in zip(df["Year"], df["Month"], df["Day"])]
 
     # climate = {}
     climate = OrderedDict()
@@ -149,8 +140,8 @@ def load_climate(filename, sheetname, start_row, end_row):
     return climate
 
 
-def load_ENM(filename, sheetname, presence):
-    df = pd.read_excel(filename, sheet_name=sheetname, skiprows=1)
+def load_ENM(book, sheetname, presence):
+    df = book.parse(sheet_name=sheetname, skiprows=1)
     ENM_code = df["Code"].tolist()
     ENM_value = df["Value"].tolist()
     ENM_loading = zip(ENM_code, ENM_value)
@@ -199,8 +190,8 @@ def load_ENM(filename, sheetname, presence):
     return ENM
 
 
-def load_env(filename, sheetname, presence, climate):
-    df = pd.read_excel(filename, sheet_name=sheetname)
+def load_env(book, sheetname, presence, climate):
+    df = book.parse(sheet_name=sheetname)
     env_code = df["Code"].tolist()
     env_value = df["Value"].tolist()
     env_loading = zip(env_code, env_value)
@@ -239,9 +230,9 @@ def load_env(filename, sheetname, presence, climate):
     # River Water
     env['rwA'] = env['riverL'] * (env['riverW_min'] + env['riverW_max'])/2 # surface area is length * width
     # Volume of river  (m^3)
-    env['rwV'] = [(x * env['riverL']) for x in climate['flow1']] # cross section area * length of river = volume; river water volume directly correlated with flow
+    env['rwV'] = climate['flow1'] * env['riverL'] # cross section area * length of river = volume; river water volume directly correlated with flow
     # River suspended sediment volume (m^3)
-    env['rSSV'] = [(env['riverssC'] * np.true_divide(x, env['riverssP'])) for x in env['rwV']]
+    env['rSSV'] = env['riverssC'] * np.true_divide(env['rwV'], env['riverssP'])
     # Area of riverwater sediment (m^2)
     env['sedRWA'] = env['rwA']
     # Volume of riverwater sediment (m^3)
@@ -611,8 +602,8 @@ def load_env(filename, sheetname, presence, climate):
     return env
 
 
-def load_presence(filename, sheetname):
-    df = pd.read_excel(filename, sheet_name=sheetname)
+def load_presence(book, sheetname):
+    df = book.parse(sheet_name=sheetname)
     presence_code = df["Code"].tolist()
     presence_value = df["Presence"].tolist()
     presence_loading = zip(presence_code, presence_value)
@@ -704,102 +695,62 @@ def load_presence(filename, sheetname):
     return presence
 
 
-def load_release(filename, sheetname, start_row, end_row, presence):
-    # load release data
-    # to take into account of the row of release scenario
-    df = pd.read_excel(filename, sheet_name=sheetname, skiprows=1)
-    df2 = pd.read_excel(filename, sheet_name=sheetname, index_col="Release Scenario")
-    release_scenario = df2.columns[0]
-    df = df.iloc[start_row:end_row]
-    release_month = df["Month"].tolist()
-    release_day = df["Day"].tolist()
-    release_year = df["Year"].tolist()
-    release_air = df["Air (kg/day)"].tolist()
-    release_rw = df["Riverwater (kg/day)"].tolist()
-    release_rSS = df["Riverwater Suspended Sediment (kg/day)"].tolist()
-    release_rwSed = df["Riverwater Sediment (kg/day)"].tolist()
-    release_fw = df["Freshwater (kg/day)"].tolist()
-    release_fSS = df["Freshwater Suspended Sediment (kg/day)"].tolist()
-    release_fwSed = df["Freshwater Sediment (kg/day)"].tolist()
-    release_sw = df["Seawater (kg/day)"].tolist()
-    release_sSS = df["Seawater Suspended Sediment (kg/day)"].tolist()
-    release_swSed = df["Seawater Sediment (kg/day)"].tolist()
-    release_soil1 = df["Undeveloped Surface Soil (kg/day)"].tolist()
-    release_dsoil1 = df["Undeveloped Deep Soil (kg/day)"].tolist()
-    release_soil2 = df["Urban Surface Soil (kg/day)"].tolist()
-    release_dsoil2 = df["Urban Deep Soil (kg/day)"].tolist()
-    release_soil3 = df["Agricultural Surface Soil (kg/day)"].tolist()
-    release_dsoil3 = df["Agricultural Deep Soil (kg/day)"].tolist()
-    release_soil4 = df["Agricultural Surface Soil Biosolid (kg/day)"].tolist()
-    release_dsoil4 = df["Agricultural Deep Soil Biosolid (kg/day)"].tolist()
-
-    # Create Datetime Objects
-    new_datetime = []
-    new_month = [int(i) for i in release_month]
-    new_day = [int(i) for i in release_day]
-    new_year = [int(i) for i in release_year]
-    dt = zip(new_year, new_month, new_day)
-    for val in dt:
-        mystring = ' '.join(map(str, val))
-        dt = datetime.strptime(mystring, "%Y %m %d")
-        new_datetime.append(dt)
+def load_release(book, sheetname, start_date, end_date, presence):
+    # load release data of the simulated days, located by date in the sheet (read_date_window)
+    # the first row holds the release scenario, the column names are in the second row
+    top, df = book.date_window(sheetname, start_date, end_date, header_row=1)
+    release_scenario = top[0][list(top[0]).index("Release Scenario") + 1]
+    new_datetime = [datetime(int(y), int(m), int(d)) for y, m, d in zip(df["Year"], df["Month"], df["Day"])]
 
     # release = {}
     release = OrderedDict()
     release['dates'] = new_datetime
-    release['air'] = [x * 10 ** 9 for x in release_air]
-    release['rw'] = [x * 10 ** 9 for x in release_rw]
-    release['rSS'] = [x * 10 ** 9 for x in release_rSS]
-    release['rwSed'] = [x * 10 ** 9 for x in release_rwSed]
-    release['fw'] = [x * 10 ** 9 for x in release_fw]
-    release['fSS'] = [x * 10 ** 9 for x in release_fSS]
-    release['fwSed'] = [x * 10 ** 9 for x in release_fwSed]
-    release['sw'] = [x * 10 ** 9 for x in release_sw]
-    release['sSS'] = [x * 10 ** 9 for x in release_sSS]
-    release['swSed'] = [x * 10 ** 9 for x in release_swSed]
-    release['soil1'] = [x * 10 ** 9 for x in release_soil1]
-    release['dsoil1'] = [x * 10 ** 9 for x in release_dsoil1]
-    release['soil2'] = [x * 10 ** 9 for x in release_soil2]
-    release['dsoil2'] = [x * 10 ** 9 for x in release_dsoil2]
-    release['soil3'] = [x * 10 ** 9 for x in release_soil3]
-    release['dsoil3'] = [x * 10 ** 9 for x in release_dsoil3]
-    release['soil4'] = [x * 10 ** 9 for x in release_soil4]
-    release['dsoil4'] = [x * 10 ** 9 for x in release_dsoil4]
+    # kg/day to ug/day (x 10^9) for all the channels at once
+    matrix = release_matrix(df) * 10 ** 9
+    # the water compartments that are not present get no release
+    for k, (key, column) in enumerate(RELEASE_CHANNELS):
+        if key in ['rw', 'fw', 'sw'] and presence[key] == 0:
+            matrix[:, k] = 0
+    add_release_series(release, matrix)
 
     if presence['air'] == 0:
-        release['Air'] = [x * 0 for x in release_air]
-    if presence['rw'] == 0:
-        release['rw'] = [x * 0 for x in release_rw]
-    if presence['fw'] == 0:
-        release['fw'] = [x * 0 for x in release_fw]
-    if presence['sw'] == 0:
-        release['sw'] = [x * 0 for x in release_sw]
+        release['Air'] = np.zeros(len(new_datetime))
     if presence['soil1'] == 0:
-        release['Soil1'] = [x * 0 for x in release_soil1]
+        release['Soil1'] = np.zeros(len(new_datetime))
     if presence['soil2'] == 0:
-        release['Soil2'] = [x * 0 for x in release_soil2]
+        release['Soil2'] = np.zeros(len(new_datetime))
     if presence['soil3'] == 0:
-        release['Soil3'] = [x * 0 for x in release_soil3]
+        release['Soil3'] = np.zeros(len(new_datetime))
     if presence['soil4'] == 0:
-        release['Soil4'] = [x * 0 for x in release_soil4]
+        release['Soil4'] = np.zeros(len(new_datetime))
 
     return release, release_scenario
 
 
 def load_data(env_filename, enmConc_filename, enm_filename, start_date, end_date):
-    # original start date will change if user does custom datasets...
-    original_start_date = datetime.strptime('2005 1 1', "%Y %m %d")
     start_day = datetime.strptime(start_date, "%Y %m %d")
-    start_row = (start_day - original_start_date).days + 1
     end_day = datetime.strptime(end_date, "%Y %m %d")
     sim_days = (end_day - start_day).days + 1
-    end_row = start_row + sim_days
-
-    presence = load_presence(env_filename, 'Presence')
-    climate = load_climate(env_filename, 'Climate', start_row, end_row)
-    env = load_env(env_filename, 'Environment', presence, climate)
-    bgConc = load_bgConc(enmConc_filename, 'bgConc', presence)
-    ENM = load_ENM(enm_filename, 'Sheet1', presence)
-    release, release_scenario = load_release(enmConc_filename, 'Release', start_row, end_row, presence)
+
+    # the workbooks are read through the cache (input_cache.InputBook), a sheet is parsed from the workbook
+    # only when it is not there
+    books = []
+    try:
+        env_book = InputBook(env_filename)
+        books.append(env_book)
+        enmConc_book = InputBook(enmConc_filename)
+        books.append(enmConc_book)
+        enm_book = InputBook(enm_filename)
+        books.append(enm_book)
+
+        presence = load_presence(env_book, 'Presence')
+        climate = load_climate(env_book, 'Climate', start_date, end_date)
+        env = load_env(env_book, 'Environment', presence, climate)
+        bgConc = load_bgConc(enmConc_book, 'bgConc', presence)
+        ENM = load_ENM(enm_book, 'Sheet1', presence)
+        release, release_scenario = load_release(enmConc_book, 'Release', start_date, end_date, presence)
+    finally:
+        for book in books:
+            book.close()
 
     return sim_days, presence, env, climate, bgConc, ENM, release, release_scenario
\ No newline at end of file
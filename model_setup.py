@@ -1,23 +1,35 @@
 from __future__ import division
+import os
 from datetime import datetime
 import pandas as pd
 from collections import OrderedDict
 from load_data import LoadData
 from load_data_nano import load_data
-from model_solver import org_solver, ion_solver, nano_solver
+from model_solver import org_solver, org_ensemble_solver, ion_solver, nano_solver, check_solver_method
 from generate_result import GenerateResult
 
 
 class Model_SetUp:
 
     def __init__(self, start_date, end_date, run_option, bgPercOption2,
-                 chem_type, chem_file, region_file, release_file, output_file_path, file_name):
+                 chem_type, chem_file, region_file, release_file, output_file_path, file_name,
+                 solver_method='vode', output_format='csv', plots='all', progress=None):
         # start date and end date need to be in the format of "%Y %m %d", eg:'2005 2 3'
         # option contains two options
         # option 1 - set background concentration to 0 or front end replace the concentration sheet data directly
         # option 2 - set background concentration to 0 first, and then run the model;
         # and then calculate the average concentrations and set it to the background concentration
         # and then run the model again
+        # solver_method - 'vode' integrates the full ode every day (default),
+        # 'linear' integrates the daily linear system A*f + b assembled from the ode (organoFate only),
+        # 'expm' advances each day exactly with the matrix exponential of that system (all but nanoFate)
+        # output_format - file format of the result tables, 'csv' (default), 'parquet', 'feather', 'npz' or 'excel'
+        # (see result_writer)
+        # plots - 'none', 'summary' or 'all' (default), rendered in the background (see GenerateResult.store_output)
+        # progress - called by the solver as progress(days done, simulated days) every day, eg. for a progress bar
+        # an unknown chem_type or a solver_method the chemical type does not have raises ValueError here,
+        # before any input is loaded
+        check_solver_method(chem_type, solver_method)
 
         self.start_date = start_date
         self.end_date = end_date
@@ -29,6 +41,11 @@ class Model_SetUp:
         self.release_file = release_file
         self.output_file_path = output_file_path
         self.file_name = file_name
+        self.solver_method = solver_method
+        self.output_format = output_format
+        self.plots = plots
+        self.progress = progress
+        self.plot_jobs = []
 
     def simulation_days(self):
         start_day = datetime.strptime(self.start_date, "%Y %m %d")
@@ -237,15 +254,20 @@ class Model_SetUp:
         return bgConc_new
 
 
-    def run_model(self):
+    def wait_plots(self):
+        # wait for the plots of run_model, a failed plot raises its exception here
+        for job in self.plot_jobs:
+            job.result()
+        self.plot_jobs = []
+
+    def run_model(self, wait_plots=True):
+        # with wait_plots=False the result tables are written when run_model returns but the plots may still be
+        # rendering, call wait_plots() before using them
         sim_days = self.simulation_days()
         if self.chem_type != 'Nanomaterial':
             # load data
-            data = LoadData(self.chem_type, self.chem_file, self.region_file, self.release_file, self.start_date,
-                            self.end_date, sim_days)
-            chemParams, presence, env, climate, bgConc, release, release_scenario = data.run_loadData()
-            V_bulk_list = [env['airV'], env['rwV'], env['sedRWV'], env['fwV'], env['sedFWV'], env['swV'], env['sedSWV'], env['soilV1'],
-                           env['soilV2'], env['soilV3'], env['soilV4']]
+            chemParams, presence, env, climate, bgConc, release, release_scenario = self.load_inputs(sim_days)
+            V_bulk_list = bulk_volumes(env)
             funC_df_list = []
             funM_df_list = []
         else:
@@ -260,14 +282,16 @@ class Model_SetUp:
         if self.run_option == 1:
             if self.chem_type == 'NonionizableOrganic':
                 date_array, process_array, funC_kg_1, funC_kg_1_sub, funM_kg_1, funM_kg_1_sub = \
-                    org_solver(self.start_date, sim_days, presence, env, climate, chemParams, bgConc, release)
+                    org_solver(self.start_date, sim_days, presence, env, climate, chemParams, bgConc, release,
+                               self.solver_method, self.progress)
                 funC_df_list = [funC_kg_1, funC_kg_1_sub]
                 funM_df_list = [funM_kg_1, funM_kg_1_sub]
 
             elif self.chem_type == 'IonizableOrganic' or self.chem_type=='Metal':
                 date_array, process_array, funC_kg_1, funC_kg_2, funC_kg_3, funC_kg_1_sub, funC_kg_2_sub, funC_kg_3_sub, \
                 funM_kg_1, funM_kg_2, funM_kg_3, funM_kg_1_sub, funM_kg_2_sub, funM_kg_3_sub = \
-                    ion_solver(self.chem_type, self.start_date, sim_days, presence, env, climate, chemParams, bgConc, release)
+                    ion_solver(self.chem_type, self.start_date, sim_days, presence, env, climate, chemParams, bgConc, release,
+                               self.solver_method, self.progress)
                 funC_df_list = [funC_kg_1, funC_kg_1_sub, funC_kg_2, funC_kg_2_sub, funC_kg_3, funC_kg_3_sub]
                 funM_df_list = [funM_kg_1, funM_kg_1_sub, funM_kg_2, funM_kg_2_sub, funM_kg_3, funM_kg_3_sub]
 
@@ -275,14 +299,64 @@ class Model_SetUp:
                 # run option 1 is for a single run
                 date_array, process_array, funC_kg, funC_kg_sub, funM_kg, funM_kg_sub, \
                 funC_kg_1, funC_kg_2, funC_kg_3, funM_kg_1, funM_kg_2, funM_kg_3 = \
-                    nano_solver(self.start_date, time, presence, env, climate, chemParams, bgConc, release)
+                    nano_solver(self.start_date, time, presence, env, climate, chemParams, bgConc, release,
+                                self.solver_method, self.progress)
                 funC_df_list = [funC_kg_1, funC_kg_2, funC_kg_3]
                 funM_df_list = [funM_kg_1, funM_kg_2, funM_kg_3]
 
         # generate results and plots
+        self.store_results(chemParams, env, release_scenario, release, date_array, process_array, V_bulk_list,
+                           funC_df_list, funM_df_list, wait_plots)
+
+    def load_inputs(self, sim_days):
+        # chemParams, presence, env, climate, bgConc, release, release_scenario of the organoFate, ionOFate and
+        # metalFate runs
+        data = LoadData(self.chem_type, self.chem_file, self.region_file, self.release_file, self.start_date,
+                        self.end_date, sim_days)
+        return data.run_loadData()
+
+    def store_results(self, chemParams, env, release_scenario, release, date_array, process_array, V_bulk_list,
+                      funC_df_list, funM_df_list, wait_plots=True):
         result = GenerateResult()
-        result.store_output(self.chem_type, chemParams['name'], env['name'], release_scenario, release,
-                            date_array, process_array, V_bulk_list, funC_df_list, funM_df_list,
-                            self.output_file_path, self.file_name)
+        self.plot_jobs = result.store_output(self.chem_type, chemParams['name'], env['name'], release_scenario,
+                                             release, date_array, process_array, V_bulk_list, funC_df_list,
+                                             funM_df_list, self.output_file_path, self.file_name,
+                                             self.output_format, self.plots)
+        if wait_plots:
+            self.wait_plots()
+
+
+def bulk_volumes(env):
+    # bulk compartment volumes of the organoFate, ionOFate and metalFate results
+    return [env['airV'], env['rwV'], env['sedRWV'], env['fwV'], env['sedFWV'], env['swV'], env['sedSWV'], env['soilV1'],
+            env['soilV2'], env['soilV3'], env['soilV4']]
+
+
+def ensemble_key(model):
+    # the runs with the same key can be solved together by run_ensemble, None if the run cannot
+    if model.chem_type != 'NonionizableOrganic' or model.solver_method != 'expm' or model.run_option != 1:
+        return None
+    return (os.path.abspath(model.region_file), model.start_date, model.end_date)
+
 
+def run_ensemble(models, wait_plots=True):
+    # run several organoFate models (Model_SetUp) together with org_ensemble_solver, they need the same
+    # ensemble_key (region file and dates, solver_method 'expm', run option 1), the runs of one chemical (eg.
+    # release scenarios) share the daily matrix, every model writes its results as run_model does
+    # the progress of the first model is reported
+    keys = set(ensemble_key(model) for model in models)
+    if None in keys or len(keys) != 1:
+        raise ValueError('the runs solved together should be NonionizableOrganic runs with solver_method expm and '
+                         'run_option 1 on the same region file and dates')
+    first = models[0]
+    sim_days = first.simulation_days()
+    inputs = [model.load_inputs(sim_days) for model in models]
+    chemParams, presence, env, climate, bgConc, release, release_scenario = inputs[0]
+    results = org_ensemble_solver(first.start_date, sim_days, presence, env, climate,
+                                  [(data[0], data[4], data[5]) for data in inputs], first.progress)
 
+    for model, data, result in zip(models, inputs, results):
+        date_array, process_array, funC_kg_1, funC_kg_1_sub, funM_kg_1, funM_kg_1_sub = result
+        model.store_results(data[0], data[2], data[6], data[5], date_array, process_array,
+                            bulk_volumes(data[2]), [funC_kg_1, funC_kg_1_sub], [funM_kg_1, funM_kg_1_sub],
+                            wait_plots)
@@ -3,20 +3,20 @@ from datetime import datetime, timedelta
 import math
 from scipy.integrate import ode
 import json
-import copy
+from collections import OrderedDict
 
 from Y_ion import Y_Value
-from Z_non_ion import zValue
+from Z_non_ion import z_table
+from diffusion_process_non_ion import mtc_table
 from eqDissolution import eqDissolution
 
 from ode_non_ion import org_ode
-from ode_ion import ion_ode
-from ode_metal import metal_ode
+from ode_ion import ion_ode, ion_jac
+from ode_metal import metal_ode, metal_jac
 from ode_nano import ode_nano
+from linear_system import no_source, assemble_linear_system, linear_matrix, linear_ode, linear_jac, expm_step, \
+    expm_step_many, DayJacobian, stacked
 
-from ode_ion_process import ion_process
-from ode_metal_process import metal_process
-from ode_non_ion_process import org_process
 from ode_nano_process import nano_process
 
 #####################
@@ -27,8 +27,30 @@ from ode_nano_process import nano_process
 #####################
 
 
-def org_solver(start_date, time, presence, env, climate, chemParams, bgConc, release):
+# solver methods of each chemical type (solver_method of the solvers below), 'vode' is the default of all
+SOLVER_METHODS = {'NonionizableOrganic': ['vode', 'linear', 'expm'],
+                  'IonizableOrganic': ['vode', 'expm'],
+                  'Metal': ['vode', 'expm'],
+                  'Nanomaterial': ['vode']}
+
+
+def check_solver_method(chem_type, solver_method):
+    if chem_type not in SOLVER_METHODS:
+        raise ValueError('chem_type should be one of %s, not %s' % (', '.join(SOLVER_METHODS), chem_type))
+    if solver_method not in SOLVER_METHODS[chem_type]:
+        raise ValueError('solver_method for %s should be one of %s, not %s'
+                         % (chem_type, ', '.join(SOLVER_METHODS[chem_type]), solver_method))
+
+
+def org_solver(start_date, time, presence, env, climate, chemParams, bgConc, release, solver_method='vode',
+               progress=None):
     # these should all now be in vector format, so need to index through them stepwise
+    # solver_method 'vode' integrates org_ode directly, 'linear' assembles the daily matrix A and
+    # source vector b from org_ode once per day and integrates dfdt = A*f + b with the exact jacobian A,
+    # 'expm' assembles the same A and b and advances the day exactly with the matrix exponential
+    # progress, if given, is called as progress(i, time) at the start of every day i (i days done), the same
+    # in all the solvers
+    check_solver_method('NonionizableOrganic', solver_method)
     V_bulk = [env['areaV'], env['rwV'], env['sedRWV'], env['fwV'], env['sedFWV'], env['swV'], env['sedSWV'], env['soilV1'], env['deepSV1'], env['soilV2'],
               env['deepSV2'], env['soilV3'], env['deepSV3'], env['soilV4'], env['deepSV4']]
 
@@ -43,63 +65,14 @@ def org_solver(start_date, time, presence, env, climate, chemParams, bgConc, rel
 
     # initialize the list to store fugacity values in each compartment in Pa
     funF = np.zeros((time, len(V_bulk)))
-    # initialize the list to store the concentration value in each compartment in kg/m^3
-    funC_bulk_kg = np.zeros((time, len(V_bulk)))
-    funC_bulk_mol = np.zeros((time, len(V_bulk)))
-    funC_sub_kg = np.zeros((time, len(V_sub)))
-    funC_sub_mol = np.zeros((time, len(V_sub)))
-
-    # initialize the list to store the mass value in kg
-    funM_bulk_kg = np.zeros((time, len(V_bulk)))
-    funM_sub_kg = np.zeros((time, len(V_sub)))
-
-    zV = zValue(climate['temp_K'][0], chemParams['Kaw_n'], chemParams['Kp_n'], env['aerP'], chemParams['Koc_n'])
-    zAirSub = zV.zAirSub()
-    zAerSub = zV.zAerSub(zAirSub)
-    zWaterSub = zV.zWaterSub(zAirSub)
-    zRWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Kssrw_unitless'])
-    zFWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Kssfw_unitless'])
-    zSWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Ksssw_unitless'])
-    zRSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbsrw_unitless'])
-    zFSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbsfw_unitless'])
-    zSSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbssw_unitless'])
-    zS1SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd1_unitless'])
-    zS2SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd2_unitless'])
-    zS3SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd3_unitless'])
-    zS4SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd4_unitless'])
-    zS1DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd1_d_unitless'])
-    zS2DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd2_d_unitless'])
-    zS3DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd3_d_unitless'])
-    zS4DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd4_d_unitless'])
-    zAirBulk = zV.zAirBulk(env['aerVf'], zAirSub, zAerSub)
-    zRWBulk = zV.zWaterBulk(env['rSSVf'], zRWSusSedSub, zWaterSub)
-    zFWBulk = zV.zWaterBulk(env['fSSVf'], zFWSusSedSub, zWaterSub)
-    zSWBulk = zV.zWaterBulk(env['sSSVf'], zSWSusSedSub, zWaterSub)
-    zRWSedimentBulk = zV.zSedimentBulk(env['riversedpercSolid'], zWaterSub, zRSedSSub)
-    zFWSedimentBulk = zV.zSedimentBulk(env['fsedpercSolid'], zWaterSub, zFSedSSub)
-    zSWSedimentBulk = zV.zSedimentBulk(env['ssedpercSolid'], zWaterSub, zSSedSSub)
-    zSoil1Bulk = zV.zSoilBulk(env['soilAC1'], env['soilWC1'], zAirSub, zWaterSub, zS1SolidSub)
-    zSoil2Bulk = zV.zSoilBulk(env['soilAC2'], env['soilWC2'], zAirSub, zWaterSub, zS2SolidSub)
-    zSoil3Bulk = zV.zSoilBulk(env['soilAC3'], env['soilWC3'], zAirSub, zWaterSub, zS3SolidSub)
-    zSoil4Bulk = zV.zSoilBulk(env['soilAC4'], env['soilWC4'], zAirSub, zWaterSub, zS4SolidSub)
-
-    Z_bulk = [zAirBulk, zRWBulk, zRWSedimentBulk, zFWBulk, zFWSedimentBulk, zSWBulk, zSWSedimentBulk, zSoil1Bulk, zS1DeepSSub,
-              zSoil2Bulk, zS2DeepSSub, zSoil3Bulk, zS3DeepSSub, zSoil4Bulk, zS4DeepSSub]
-
-    # initial conditions for solver step 1
-    bgConcNames = ['air', 'rw', 'rSedS', 'fw', 'fSedS', 'sw', 'sSedS', 'soilS1', 'dsoil1', 'soilS2', 'dsoil2',
-                   'soilS3', 'dsoil3', 'soilS4', 'dsoil4']
 
-    for i in range(len(V_bulk)):
-        # mol/m3
-        funC_bulk_mol[0, i] = bgConc[bgConcNames[i]]
+    # Z values of every day, computed once and indexed by day in org_ode and below
+    Z_table = z_table(climate, env, chemParams)
+    # same for the mass transfer coefficients, cached per chemical for repeated runs
+    MTC_table = mtc_table(climate, env, chemParams)
 
-    for i in range(len(V_bulk)):
-        try:
-            # mol/m3 / mol/(Pa-m^3) = Pa
-            funF[0, i] = funC_bulk_mol[0,i]/Z_bulk[i]  # fugacity values from concentration and Z
-        except:
-            funF[0, i] = 0
+    # initial conditions for solver step 1
+    funF[0] = org_initial_fugacity(bgConc, Z_table)
 
     # initialize the first solution of fugacity
     f = [funF[0]]
@@ -107,132 +80,177 @@ def org_solver(start_date, time, presence, env, climate, chemParams, bgConc, rel
     process_array = np.zeros((time, 125))
     start_day = datetime.strptime(start_date, "%Y %m %d")
 
+    if solver_method in ['linear', 'expm']:
+        release_no_source, bgConc_no_source = no_source(release, bgConc)
+
     for i in range(time):
-        print (i)
-        # copy a list value without reference
-        env_new = copy.deepcopy(env)
-        env_new['rWaterV'] = env['rWaterV'][i]
-        env_new['rSSV'] = env['rSSV'][i]
-        env_new['rwV'] = env['rwV'][i]
-        env_new['rSSVf'] = env['rSSVf'][i]
-
-        r = ode(org_ode).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
-                                        nsteps= 5000, rtol=1e-6, atol=1e-14)
-        r.set_initial_value(f[-1], 0)
-        r.set_f_params(i, presence, env_new, climate, chemParams, release, bgConc)
-        soln = r.integrate(1)
+        if progress is not None:
+            progress(i, time)
+        env_new = daily_env(env, i)
+
+        if solver_method in ['linear', 'expm']:
+            A, b = assemble_linear_system(org_ode, len(V_bulk),
+                                          (i, presence, env_new, climate, chemParams, release, bgConc, Z_table, MTC_table),
+                                          (i, presence, env_new, climate, chemParams, release_no_source,
+                                           bgConc_no_source, Z_table, MTC_table))
+
+        if solver_method == 'expm':
+            soln = expm_step(A, b, f[-1])
+        elif solver_method == 'linear':
+            r = ode(linear_ode, linear_jac).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
+                                                           nsteps=5000, rtol=1e-6, atol=1e-14)
+            r.set_initial_value(f[-1], 0)
+            r.set_f_params(A, b)
+            r.set_jac_params(A, b)
+            soln = r.integrate(1)
+        else:
+            r = ode(org_ode).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
+                                            nsteps= 5000, rtol=1e-6, atol=1e-14)
+            r.set_initial_value(f[-1], 0)
+            r.set_f_params(i, presence, env_new, climate, chemParams, release, bgConc, Z_table, MTC_table)
+            soln = r.integrate(1)
         f.append(soln)
 
         funF[i] = f[-1]
         date = (start_day + timedelta(days = i)).strftime('%Y %m %d')
         date_array.append(date)
 
-        process_org = org_process(funF[i], i, env_new, climate, chemParams, bgConc)
-        for j in range(0, len(process_org)):
-            process_array[i, j] = process_org[j]
-
-        zV = zValue(climate['temp_K'][i], chemParams['Kaw_n'], chemParams['Kp_n'], env['aerP'], chemParams['Koc_n'])
-        zAirSub = zV.zAirSub()
-        zAerSub = zV.zAerSub(zAirSub)
-        zWaterSub = zV.zWaterSub(zAirSub)
-        zRWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Kssrw_unitless'])
-        zFWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Kssfw_unitless'])
-        zSWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Ksssw_unitless'])
-        zRSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbsrw_unitless'])
-        zFSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbsfw_unitless'])
-        zSSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbssw_unitless'])
-        zS1SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd1_unitless'])
-        zS2SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd2_unitless'])
-        zS3SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd3_unitless'])
-        zS4SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd4_unitless'])
-        zS1DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd1_d_unitless'])
-        zS2DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd2_d_unitless'])
-        zS3DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd3_d_unitless'])
-        zS4DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd4_d_unitless'])
-        zAirBulk = zV.zAirBulk(env['aerVf'], zAirSub, zAerSub)
-        zRWBulk = zV.zWaterBulk(env['rSSVf'][i], zRWSusSedSub, zWaterSub)
-        zFWBulk = zV.zWaterBulk(env['fSSVf'], zFWSusSedSub, zWaterSub)
-        zSWBulk = zV.zWaterBulk(env['sSSVf'], zSWSusSedSub, zWaterSub)
-        zRWSedimentBulk = zV.zSedimentBulk(env['riversedpercSolid'], zWaterSub, zRSedSSub)
-        zFWSedimentBulk = zV.zSedimentBulk(env['fsedpercSolid'], zWaterSub, zFSedSSub)
-        zSWSedimentBulk = zV.zSedimentBulk(env['ssedpercSolid'], zWaterSub, zSSedSSub)
-        zSoil1Bulk = zV.zSoilBulk(env['soilAC1'], env['soilWC1'], zAirSub, zWaterSub, zS1SolidSub)
-        zSoil2Bulk = zV.zSoilBulk(env['soilAC2'], env['soilWC2'], zAirSub, zWaterSub, zS2SolidSub)
-        zSoil3Bulk = zV.zSoilBulk(env['soilAC3'], env['soilWC3'], zAirSub, zWaterSub, zS3SolidSub)
-        zSoil4Bulk = zV.zSoilBulk(env['soilAC4'], env['soilWC4'], zAirSub, zWaterSub, zS4SolidSub)
-
-        Z_bulk = [zAirBulk, zRWBulk, zRWSedimentBulk, zFWBulk, zFWSedimentBulk, zSWBulk, zSWSedimentBulk, zSoil1Bulk, zS1DeepSSub,
-                  zSoil2Bulk, zS2DeepSSub, zSoil3Bulk, zS3DeepSSub, zSoil4Bulk, zS4DeepSSub]
-        Z_sub = [zAirSub, zAerSub,
-                 zWaterSub, zRWSusSedSub, zWaterSub, zRSedSSub,
-                 zWaterSub, zFWSusSedSub, zWaterSub, zFSedSSub,
-                 zWaterSub, zSWSusSedSub, zWaterSub, zSSedSSub,
-                 zAirSub, zWaterSub, zS1SolidSub, zS1DeepSSub,
-                 zAirSub, zWaterSub, zS2SolidSub, zS2DeepSSub,
-                 zAirSub, zWaterSub, zS3SolidSub, zS3DeepSSub,
-                 zAirSub, zWaterSub, zS4SolidSub, zS4DeepSSub]
-
-        V_bulk = [env['areaV'], env['rwV'][i], env['sedRWV'], env['fwV'], env['sedFWV'], env['swV'], env['sedSWV'],
-                  env['soilV1'], env['deepSV1'], env['soilV2'],
-                  env['deepSV2'], env['soilV3'], env['deepSV3'], env['soilV4'], env['deepSV4']]
-
-        V_sub = [env['airV'], env['aerV'], env['rWaterV'][i], env['rSSV'][i], env['rSedWV'], env['rSedSV'],
-                 env['fWaterV'], env['fSSV'], env['fSedWV'], env['fSedSV'],
-                 env['sWaterV'], env['sSSV'], env['sSedWV'], env['sSedSV'], env['soilAV1'], env['soilWV1'],
-                 env['soilSV1'], env['deepSV1'], env['soilAV2'], env['soilWV2'], env['soilSV2'], env['deepSV2'],
-                 env['soilAV3'], env['soilWV2'], env['soilSV3'], env['deepSV3'],
-                 env['soilAV4'], env['soilWV2'], env['soilSV3'], env['deepSV4']]
-        # multiply fugacity*Zvalue to get the concentration in each compartment
-        for j in range(len(V_bulk)):
-            # unit: Pa * mol/m^3-Pa * kg/mol = kg/m^3
-            funC_bulk_kg[i, j] = f[-1][j] * Z_bulk[j] * chemParams['molar_mass']
-            funC_bulk_mol[i, j] = f[-1][j] * Z_bulk[j]
-            funM_bulk_kg[i, j] = funC_bulk_kg[i, j] * V_bulk[j]
-
-        # calculate for the subcompartments concentration and mass
-        funC_sub_mol[i, 0] = funF[i][0] * Z_sub[0]  # air
-        funC_sub_mol[i, 1] = funF[i][0] * Z_sub[1]  # aerosol
-        funC_sub_mol[i, 2] = funF[i][1] * Z_sub[2]  # rw
-        funC_sub_mol[i, 3] = funF[i][1] * Z_sub[3]  # rw sus sed
-        funC_sub_mol[i, 4] = funF[i][2] * Z_sub[4]  # rw sediment water
-        funC_sub_mol[i, 5] = funF[i][2] * Z_sub[5]  # rw sediment sediment
-        funC_sub_mol[i, 6] = funF[i][3] * Z_sub[6]  # fw
-        funC_sub_mol[i, 7] = funF[i][3] * Z_sub[7]  # fw sus sed
-        funC_sub_mol[i, 8] = funF[i][4] * Z_sub[8]  # fw sediment water
-        funC_sub_mol[i, 9] = funF[i][4] * Z_sub[9]  # fw sediment sediment
-        funC_sub_mol[i, 10] = funF[i][5] * Z_sub[10]  # sw
-        funC_sub_mol[i, 11] = funF[i][5] * Z_sub[11]  # sw sus sed
-        funC_sub_mol[i, 12] = funF[i][6] * Z_sub[12]  # sw sediment water
-        funC_sub_mol[i, 13] = funF[i][6] * Z_sub[13]  # sw sediment sediment
-        funC_sub_mol[i, 14] = funF[i][7] * Z_sub[14]  # soil 1 air
-        funC_sub_mol[i, 15] = funF[i][7] * Z_sub[15]  # soil 1 water
-        funC_sub_mol[i, 16] = funF[i][7] * Z_sub[16]  # soil 1 solid
-        funC_sub_mol[i, 17] = funF[i][8] * Z_sub[17]  # soil 1 deep
-        funC_sub_mol[i, 18] = funF[i][9] * Z_sub[18]  # soil 2 air
-        funC_sub_mol[i, 19] = funF[i][9] * Z_sub[19]  # soil 2 water
-        funC_sub_mol[i, 20] = funF[i][9] * Z_sub[20]  # soil 2 solid
-        funC_sub_mol[i, 21] = funF[i][10] * Z_sub[21]  # soil 2 deep
-        funC_sub_mol[i, 22] = funF[i][11] * Z_sub[22]  # soil 3 air
-        funC_sub_mol[i, 23] = funF[i][11] * Z_sub[23]  # soil 3 water
-        funC_sub_mol[i, 24] = funF[i][11] * Z_sub[24]  # soil 3 solid
-        funC_sub_mol[i, 25] = funF[i][12] * Z_sub[25]  # soil 3 deep
-        funC_sub_mol[i, 26] = funF[i][13] * Z_sub[26]  # soil 4 air
-        funC_sub_mol[i, 27] = funF[i][13] * Z_sub[27]  # soil 4 water
-        funC_sub_mol[i, 28] = funF[i][13] * Z_sub[28]  # soil 4 solid
-        funC_sub_mol[i, 29] = funF[i][14] * Z_sub[29]  # soil 4 deep
-
-        for j in range(len(V_sub)):
-            # unit: mol/m3 * kg/mol = kg/m^3
-            funC_sub_kg[i, j] = funC_sub_mol[i, j] * chemParams['molar_mass']
-            funM_sub_kg[i, j] = funC_sub_kg[i, j] * V_sub[j]
-
-        output_array = [funC_bulk_kg, funC_sub_kg, funM_bulk_kg, funM_sub_kg]
-        output_array = remove_floating_values(output_array)
+        # process fluxes (kg/day) at the end of the day, from the same flux kernel as the ode
+        process_array[i] = org_ode(1, funF[i], i, presence, env_new, climate, chemParams, release, bgConc,
+                                   Z_table, MTC_table, return_processes=True)[1]
+
+    output_array = org_outputs(funF, Z_table, env, time, chemParams)
 
     return date_array, process_array, output_array[0], output_array[1], output_array[2], output_array[3]
 
 
-def ion_solver(chem_type, start_date, time, presence, env, climate, chemParams, bgConc, release):
+def org_ensemble_solver(start_date, time, presence, env, climate, scenarios, progress=None):
+    # solve many organic chemical runs on the same region together, scenarios is a list of
+    # (chemParams, bgConc, release), one per run, and the result is a list with the org_solver output of each
+    # run, in the same order
+    # all runs are advanced with the daily matrix exponential (solver_method 'expm' of org_solver), the runs
+    # with equal chemParams (eg. release scenarios of one chemical) share the daily matrix A, which is
+    # assembled once a day for the group, their source vectors and process fluxes come from one org_ode call
+    # with the releases of the whole group stacked, and the group is advanced by a single expm_step_many
+    n = 15
+    start_day = datetime.strptime(start_date, "%Y %m %d")
+    date_array = [(start_day + timedelta(days=i)).strftime('%Y %m %d') for i in range(time)]
+
+    # group the runs by chemical, the chemParams of each run may be loaded separately
+    groups = OrderedDict()
+    for k, (chemParams, bgConc, release) in enumerate(scenarios):
+        key = chem_key(chemParams)
+        if key not in groups:
+            groups[key] = {'chemParams': chemParams, 'runs': []}
+        groups[key]['runs'].append(k)
+    groups = list(groups.values())
+
+    for group in groups:
+        chemParams = group['chemParams']
+        runs = group['runs']
+        group['Z_table'] = z_table(climate, env, chemParams)
+        group['MTC_table'] = mtc_table(climate, env, chemParams)
+        group['release'], group['bgConc'] = stack_sources([scenarios[k][2] for k in runs],
+                                                          [scenarios[k][1] for k in runs])
+        group['no_source'] = no_source(scenarios[runs[0]][2], scenarios[runs[0]][1])
+        # fugacity (time x 15 x runs of the group), in Pa
+        group['funF'] = np.zeros((time, n, len(runs)))
+        for j, k in enumerate(runs):
+            group['funF'][0, :, j] = org_initial_fugacity(scenarios[k][1], group['Z_table'])
+        group['process'] = np.zeros((time, 125, len(runs)))
+
+    for i in range(time):
+        if progress is not None:
+            progress(i, time)
+        env_new = daily_env(env, i)
+
+        for group in groups:
+            params = (i, presence, env_new, climate, group['chemParams'], group['release'], group['bgConc'],
+                      group['Z_table'], group['MTC_table'])
+            release_no_source, bgConc_no_source = group['no_source']
+            A = linear_matrix(org_ode, n, (i, presence, env_new, climate, group['chemParams'], release_no_source,
+                                           bgConc_no_source, group['Z_table'], group['MTC_table']))
+            # org_ode at f = 0 with the stacked sources, one column per run
+            B = stacked(org_ode(0, np.zeros(n), *params), len(group['runs']))
+
+            F = group['funF'][i - 1] if i > 0 else group['funF'][0]
+            F = expm_step_many(A, B, F)
+            group['funF'][i] = F
+            group['process'][i] = stacked(org_ode(1, F, *params, return_processes=True)[1], len(group['runs']))
+
+    results = [None] * len(scenarios)
+    for group in groups:
+        for j, k in enumerate(group['runs']):
+            funF = np.ascontiguousarray(group['funF'][:, :, j])
+            output_array = org_outputs(funF, group['Z_table'], env, time, group['chemParams'])
+            results[k] = (list(date_array), np.ascontiguousarray(group['process'][:, :, j]), output_array[0],
+                          output_array[1], output_array[2], output_array[3])
+    return results
+
+
+def chem_key(chemParams):
+    # equal chemical parameters give equal keys, all the values are numbers or strings
+    return repr(sorted(chemParams.items()))
+
+
+def org_initial_fugacity(bgConc, Z_table):
+    # fugacity (Pa) of the background concentrations at the start of the run
+    bgConcNames = ['air', 'rw', 'rSedS', 'fw', 'fSedS', 'sw', 'sSedS', 'soilS1', 'dsoil1', 'soilS2', 'dsoil2',
+                   'soilS3', 'dsoil3', 'soilS4', 'dsoil4']
+    Z_bulk_t, Z_sub_t = Z_table
+    f0 = np.zeros(len(bgConcNames))
+    for i in range(len(bgConcNames)):
+        try:
+            # mol/m3 / mol/(Pa-m^3) = Pa
+            f0[i] = bgConc[bgConcNames[i]]/Z_bulk_t[0, i]  # fugacity values from concentration and Z
+        except:
+            f0[i] = 0
+    return f0
+
+
+def org_outputs(funF, Z_table, env, time, chemParams):
+    # multiply fugacity*Zvalue to get the concentration in each compartment, for the whole trajectory at once
+    # bulk compartment (index in funF) of each subcompartment
+    sub_to_bulk = [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 7, 8, 9, 9, 9, 10, 11, 11, 11, 12, 13, 13, 13, 14]
+    Z_bulk_t, Z_sub_t = Z_table
+    V_bulk_t, V_sub_t = volume_matrices(env, time)
+    # unit: Pa * mol/m^3-Pa * kg/mol = kg/m^3
+    funC_bulk_mol = funF * Z_bulk_t
+    funC_bulk_kg = funC_bulk_mol * chemParams['molar_mass']
+    funM_bulk_kg = funC_bulk_kg * V_bulk_t
+
+    # calculate for the subcompartments concentration and mass, each subcompartment takes the fugacity of its bulk
+    funC_sub_mol = funF[:, sub_to_bulk] * Z_sub_t
+    # unit: mol/m3 * kg/mol = kg/m^3
+    funC_sub_kg = funC_sub_mol * chemParams['molar_mass']
+    funM_sub_kg = funC_sub_kg * V_sub_t
+
+    # clip the whole trajectories once, after the time loop
+    output_array = [funC_bulk_kg, funC_sub_kg, funM_bulk_kg, funM_sub_kg]
+    return remove_floating_values(output_array)
+
+
+def stack_sources(release_list, bgConc_list):
+    # release and bgConc of several runs in one dict each, release series become (time x runs) arrays and
+    # background concentrations (runs) arrays, so that one ode call evaluates the sources of all runs
+    release = {}
+    for key in release_list[0]:
+        if key in ['dates', 'matrix']:
+            continue
+        release[key] = np.column_stack([np.asarray(r[key], dtype=float) for r in release_list])
+    bgConc = {}
+    for key in bgConc_list[0]:
+        bgConc[key] = np.array([b[key] for b in bgConc_list], dtype=float)
+    return release, bgConc
+
+
+def ion_solver(chem_type, start_date, time, presence, env, climate, chemParams, bgConc, release, solver_method='vode',
+               progress=None):
+    # solver_method 'vode' integrates ion_ode/metal_ode directly, 'expm' assembles the daily matrix A and
+    # source vector b from the ode once per day and advances the day exactly with the matrix exponential
+    if chem_type not in ['IonizableOrganic', 'Metal']:
+        raise ValueError('ion_solver solves IonizableOrganic and Metal, not %s' % chem_type)
+    check_solver_method(chem_type, solver_method)
 
     with open('./IonizableChem_helper.json') as f:
         data = json.load(f)
@@ -252,28 +270,9 @@ def ion_solver(chem_type, start_date, time, presence, env, climate, chemParams,
 
     # initialize the list to store aquivalence values in each compartment
     funF = np.zeros((time, len(compart_list)))
-    # initialize the list to store the concentration value in each compartment in kg/m^3
+    # the concentration (kg/m^3) and mass (kg) of each species are computed after the loop
     # for ionizable organic, 1 - neutral, 2 - ionic
     # for metal, 1 - particle, 2 - colloidal, 3 - dissolved
-    funC_mol_1 = np.zeros((time, len(compart_list)))
-    funC_mol_2 = np.zeros((time, len(compart_list)))
-    funC_mol_3 = np.zeros((time, len(compart_list)))
-    funC_mol_1_sub = np.zeros((time, len(subcompart_list)))
-    funC_mol_2_sub = np.zeros((time, len(subcompart_list)))
-    funC_mol_3_sub = np.zeros((time, len(subcompart_list)))
-    funC_kg_1 = np.zeros((time, len(compart_list)))
-    funC_kg_2 = np.zeros((time, len(compart_list)))
-    funC_kg_3 = np.zeros((time, len(compart_list)))
-    funM_kg_1 = np.zeros((time, len(compart_list)))
-    funM_kg_2 = np.zeros((time, len(compart_list)))
-    funM_kg_3 = np.zeros((time, len(compart_list)))
-
-    funC_kg_1_sub = np.zeros((time, len(subcompart_list)))
-    funC_kg_2_sub = np.zeros((time, len(subcompart_list)))
-    funC_kg_3_sub = np.zeros((time, len(subcompart_list)))
-    funM_kg_1_sub = np.zeros((time, len(subcompart_list)))
-    funM_kg_2_sub = np.zeros((time, len(subcompart_list)))
-    funM_kg_3_sub = np.zeros((time, len(subcompart_list)))
 
     Y_val = Y_Value(chem_type, chemParams, env)
 
@@ -298,112 +297,126 @@ def ion_solver(chem_type, start_date, time, presence, env, climate, chemParams,
 
     start_day = datetime.strptime(start_date, "%Y %m %d")
 
+    # both odes are linear in the aquivalence, their jacobian comes from ion_jac/metal_jac (built once a day)
+    # instead of vode's finite differences
+    if chem_type == 'IonizableOrganic':
+        jac = DayJacobian(ion_jac)
+    else:
+        jac = DayJacobian(metal_jac)
+
+    # the jacobian (and the matrix A of 'expm') is built without the sources
+    release_no_source, bgConc_no_source = no_source(release, bgConc)
+
     for i in range(time):
-        print (i)
-        # copy a list value without reference
-        env_new = copy.deepcopy(env)
-        env_new['rWaterV'] = env['rWaterV'][i]
-        env_new['rSSV'] = env['rSSV'][i]
-        env_new['rwV'] = env['rwV'][i]
-        env_new['rSSVf'] = env['rSSVf'][i]
-
-        V_bulk = [env['areaV'], env['rwV'][i], env['sedRWV'], env['fwV'], env['sedFWV'], env['swV'], env['sedSWV'],
-                  env['soilV1'], env['deepSV1'], env['soilV2'],
-                  env['deepSV2'], env['soilV3'], env['deepSV3'], env['soilV4'], env['deepSV4']]
-
-        V_sub = [env['airV'], env['aerV'], env['rWaterV'][i], env['rSSV'][i], env['rSedWV'], env['rSedSV'],
-                 env['fWaterV'], env['fSSV'], env['fSedWV'], env['fSedSV'],
-                 env['sWaterV'], env['sSSV'], env['sSedWV'], env['sSedSV'], env['soilAV1'], env['soilWV1'],
-                 env['soilSV1'], env['deepSV1'], env['soilAV2'], env['soilWV2'], env['soilSV2'], env['deepSV2'],
-                 env['soilAV3'], env['soilWV2'], env['soilSV3'], env['deepSV3'],
-                 env['soilAV4'], env['soilWV2'], env['soilSV3'], env['deepSV4']]
+        if progress is not None:
+            progress(i, time)
+        env_new = daily_env(env, i)
 
         if chem_type == 'IonizableOrganic':
-            r = ode(ion_ode).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
-                                            nsteps=5000, rtol=1e-6, atol=1e-14)
-            r.set_initial_value(f[-1], 0)
-            r.set_f_params(i, presence, env_new, chemParams, climate, release, bgConc,
-                           Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict, Z_i_dict)
-            soln = r.integrate(1)
+            if solver_method == 'expm':
+                A, b = assemble_linear_system(ion_ode, len(compart_list),
+                                              (i, presence, env_new, chemParams, climate, release, bgConc,
+                                               Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict, Z_i_dict),
+                                              (i, presence, env_new, chemParams, climate, release_no_source,
+                                               bgConc_no_source, Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict,
+                                               Z_i_dict))
+                soln = expm_step(A, b, f[-1])
+            else:
+                r = ode(ion_ode, jac).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
+                                                     nsteps=5000, rtol=1e-6, atol=1e-14)
+                r.set_initial_value(f[-1], 0)
+                r.set_f_params(i, presence, env_new, chemParams, climate, release, bgConc,
+                               Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict, Z_i_dict)
+                r.set_jac_params(i, presence, env_new, chemParams, climate, release_no_source, bgConc_no_source,
+                                 Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict, Z_i_dict)
+                soln = r.integrate(1)
             f.append(soln)
             funF[i] = f[-1]
 
-            process_ion = ion_process(funF[i], i, env_new, chemParams, climate, bgConc, Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict)
-            for j in range(0, len(process_ion)):
-                process_array[i,j] = process_ion[j]
+            # process fluxes (kg/day) at the end of the day, from the same flux kernel as the ode
+            process_array[i] = ion_ode(1, funF[i], i, presence, env_new, chemParams, climate, release, bgConc,
+                                       Z_ij_dict, Z_ij_dict_sub, Y_ij_dict, X_ij_dict, Z_i_dict,
+                                       return_processes=True)[1]
 
         elif chem_type == 'Metal':
-            r = ode(metal_ode).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
-                                            nsteps=1000, rtol=1e-9, atol=1e-10)
-            r.set_initial_value(f[-1], 0)
-            r.set_f_params(i, presence, env_new, chemParams, climate, release, bgConc,
-                           Z_ij_dict, Y_ij_dict, Z_i_dict)
-            soln = r.integrate(1)
+            if solver_method == 'expm':
+                A, b = assemble_linear_system(metal_ode, len(compart_list),
+                                              (i, presence, env_new, chemParams, climate, release, bgConc,
+                                               Z_ij_dict, Y_ij_dict, Z_i_dict),
+                                              (i, presence, env_new, chemParams, climate, release_no_source,
+                                               bgConc_no_source, Z_ij_dict, Y_ij_dict, Z_i_dict))
+                soln = expm_step(A, b, f[-1])
+            else:
+                r = ode(metal_ode, jac).set_integrator('vode', method='bdf', order=5, with_jacobian=True,
+                                                       nsteps=1000, rtol=1e-9, atol=1e-10)
+                r.set_initial_value(f[-1], 0)
+                r.set_f_params(i, presence, env_new, chemParams, climate, release, bgConc,
+                               Z_ij_dict, Y_ij_dict, Z_i_dict)
+                r.set_jac_params(i, presence, env_new, chemParams, climate, release_no_source, bgConc_no_source,
+                                 Z_ij_dict, Y_ij_dict, Z_i_dict)
+                soln = r.integrate(1)
             f.append(soln)
             funF[i] = f[-1]
 
-            process_metal = metal_process(funF[i], i, env_new, chemParams, climate, bgConc, Z_ij_dict, Y_ij_dict)
-            for j in range(0, len(process_metal)):
-                process_array[i, j] = process_metal[j]
+            process_array[i] = metal_ode(1, funF[i], i, presence, env_new, chemParams, climate, release, bgConc,
+                                         Z_ij_dict, Y_ij_dict, Z_i_dict, return_processes=True)[1]
 
 
         date = (start_day + timedelta(days=i)).strftime('%Y %m %d')
         date_array.append(date)
 
-        # multiply aquavalency*Zvalue to get the concentration in each compartment
-        # Cij = Qij*Zij = Qit*Yij*Zij
-
-        for j in range(len(compart_list)):
-            compart = compart_list[j]
-            if chem_type == 'IonizableOrganic':
-                funC_mol_1[i, j] = funF[i][j] * Y_ij_dict[compart][0] * np.mean(Z_ij_dict[compart][0])
-                funC_mol_2[i, j] = funF[i][j] * Y_ij_dict[compart][1] * np.mean(Z_ij_dict[compart][1])
-                funC_kg_1[i, j] = funC_mol_1[i, j] * chemParams['molar_mass']
-                funC_kg_2[i, j] = funC_mol_2[i, j] * chemParams['molar_mass']
-                funM_kg_1[i, j] = funC_kg_1[i, j] * V_bulk[j]
-                funM_kg_2[i, j] = funC_kg_2[i, j] * V_bulk[j]
-            elif chem_type == 'Metal':
-                # for particulate, need to adjust the conc. to particle volumes
-                funC_mol_1[i, j] = funF[i][j] * Y_ij_dict[compart][0] * Z_ij_dict[compart][0]
-                funC_mol_2[i, j] = funF[i][j] * Y_ij_dict[compart][1] * Z_ij_dict[compart][1]
-                funC_mol_3[i, j] = funF[i][j] * Y_ij_dict[compart][2] * Z_ij_dict[compart][2]
-
-                # mol/m3 * kg/mol = kg/m3
-                funC_kg_1[i, j] = funC_mol_1[i, j] * chemParams['molar_mass']
-                funC_kg_2[i, j] = funC_mol_2[i, j] * chemParams['molar_mass']
-                funC_kg_3[i, j] = funC_mol_3[i, j] * chemParams['molar_mass']
-                funM_kg_1[i, j] = funC_kg_1[i, j] * V_bulk[j]
-                funM_kg_2[i, j] = funC_kg_2[i, j] * V_bulk[j]
-                funM_kg_3[i, j] = funC_kg_3[i, j] * V_bulk[j]
-
-        # calculate for the subcompartments concentration
-        for j in range(len(subcompart_list)):
-            subcompart = subcompart_list[j]
-            if chem_type == 'IonizableOrganic':
-                funC_mol_1_sub[i, j] = funF[i][subcompart_map[subcompart][0]] * Y_ij_dict[subcompart_map[subcompart][1]][0] * Z_ij_dict_sub[subcompart][0]
-                funC_mol_2_sub[i, j] = funF[i][subcompart_map[subcompart][0]] * Y_ij_dict[subcompart_map[subcompart][1]][1] * Z_ij_dict_sub[subcompart][1]
-                funC_kg_1_sub[i, j] = funC_mol_1_sub[i, j] * chemParams['molar_mass']
-                funC_kg_2_sub[i, j] = funC_mol_2_sub[i, j] * chemParams['molar_mass']
-                funM_kg_1_sub[i, j] = funC_kg_1_sub[i, j] * V_sub[j]
-                funM_kg_2_sub[i, j] = funC_kg_2_sub[i, j] * V_sub[j]
-
-        output_array = [funC_kg_1, funC_kg_2, funC_kg_3, funC_kg_1_sub, funC_kg_2_sub, funC_kg_3_sub,
-                        funM_kg_1, funM_kg_2, funM_kg_3, funM_kg_1_sub, funM_kg_2_sub, funM_kg_3_sub]
-        # output_array = remove_floating_values(output_array)
+    # multiply aquavalency*Zvalue to get the concentration in each compartment, for the whole trajectory at once
+    # Cij = Qij*Zij = Qit*Yij*Zij
+    V_bulk_t, V_sub_t = volume_matrices(env, time)
+    funC_kg = [np.zeros((time, len(compart_list))) for k in range(3)]
+    funM_kg = [np.zeros((time, len(compart_list))) for k in range(3)]
+    funC_kg_sub = [np.zeros((time, len(subcompart_list))) for k in range(3)]
+    funM_kg_sub = [np.zeros((time, len(subcompart_list))) for k in range(3)]
 
+    if chem_type == 'IonizableOrganic':
+        # bulk compartment (index in funF, name in Y_ij_dict) of each subcompartment
+        sub_to_bulk = [subcompart_map[subcompart][0] for subcompart in subcompart_list]
+        for k in range(2):
+            Y_bulk = [Y_ij_dict[compart][k] for compart in compart_list]
+            Z_bulk = [np.mean(Z_ij_dict[compart][k]) for compart in compart_list]
+            funC_mol = funF * Y_bulk * Z_bulk
+            funC_kg[k] = funC_mol * chemParams['molar_mass']
+            funM_kg[k] = funC_kg[k] * V_bulk_t
+
+            # calculate for the subcompartments concentration
+            Y_sub = [Y_ij_dict[subcompart_map[subcompart][1]][k] for subcompart in subcompart_list]
+            Z_sub = [Z_ij_dict_sub[subcompart][k] for subcompart in subcompart_list]
+            funC_mol_sub = funF[:, sub_to_bulk] * Y_sub * Z_sub
+            funC_kg_sub[k] = funC_mol_sub * chemParams['molar_mass']
+            funM_kg_sub[k] = funC_kg_sub[k] * V_sub_t
+    elif chem_type == 'Metal':
+        for k in range(3):
+            # for particulate, need to adjust the conc. to particle volumes
+            Y_bulk = [Y_ij_dict[compart][k] for compart in compart_list]
+            Z_bulk = [Z_ij_dict[compart][k] for compart in compart_list]
+            funC_mol = funF * Y_bulk * Z_bulk
+            # mol/m3 * kg/mol = kg/m3
+            funC_kg[k] = funC_mol * chemParams['molar_mass']
+            funM_kg[k] = funC_kg[k] * V_bulk_t
+
+    output_array = funC_kg + funC_kg_sub + funM_kg + funM_kg_sub
+    # output_array = remove_floating_values(output_array)
 
     return date_array, process_array, output_array[0], output_array[1], output_array[2], output_array[3], \
            output_array[4], output_array[5], output_array[6], output_array[7], output_array[8], output_array[9], \
            output_array[10], output_array[11]
 
 
-def nano_solver(start_date, time, presence, env, climate, ENM, bgConc, release):
+def nano_solver(start_date, time, presence, env, climate, ENM, bgConc, release, solver_method='vode',
+                progress=None):
     # %   Nano solver function solves the giant differential equation over time
     # %   in a for loop where the coefficients are dependent on the previous solution from the
     # %   previous time step
     # %   Inputs include simulation time, presence of compartments, the
     # %   environment, the climate, the ENM, the background starting
     # %   concentrations, and the releases
+    # solver_method 'vode' (the only one) starts a new integrator every day
+    check_solver_method('Nanomaterial', solver_method)
 
     # %% Volume vector
     # %  Needed for calculations
@@ -465,17 +478,11 @@ def nano_solver(start_date, time, presence, env, climate, ENM, bgConc, release):
 
     # matched tolerance to matlab, can't go lower and still get a match and run matlab
     for i in range(time):
-        print (i)
-        env_new = copy.deepcopy(env)
-        env_new['rSSV'] = env['rSSV'][i]
-        env_new['rwV'] = env['rwV'][i]
-
-        V = [env['airV'], env['aerV'], env['rwV'][i], env['rwV'][i], env['sedRWV'],
-             env['freshwV'], env['freshwV'], env['sedFWV'], env['seawV'], env['seawV'], env['sedSWV'],
-             env['soilV1'], env['soilV1'], env['soilV2'], env['soilV2'], env['soilV3'], env['soilV3'],
-             env['soilV4'], env['soilV4'], env['rwV'][i], env['sedRWV'], env['freshwV'], env['sedFWV'],
-             env['seawV'], env['sedSWV'], env['soilwV1'], env['soilwV2'], env['soilwV3'], env['soilwV4'],
-             env['deepsV1'], env['deepsV2'], env['deepsV3'], env['deepsV4']]
+        if progress is not None:
+            progress(i, time)
+        env_new = daily_env(env, i, ('rSSV', 'rwV'))
+
+        V = nano_volume(env, i)
         # -9 and -10 are a statistical match to matlab
         r = ode(ode_nano).set_integrator('vode', method='bdf', with_jacobian=True,
                                          nsteps=5000, rtol=1e-6, atol=1e-14)
@@ -601,9 +608,52 @@ def bulkCalculator(time, V, funM, presence):
     return bulk_M, bulk_C
 
 
+def volume_matrices(env, time):
+    # bulk (time x 15) and subcompartment (time x 30) volumes in m3 for the organic, ionizable organic and
+    # metal solvers, only the river volumes change from day to day
+    V_bulk = [env['areaV'], env['rwV'], env['sedRWV'], env['fwV'], env['sedFWV'], env['swV'], env['sedSWV'],
+              env['soilV1'], env['deepSV1'], env['soilV2'],
+              env['deepSV2'], env['soilV3'], env['deepSV3'], env['soilV4'], env['deepSV4']]
+
+    V_sub = [env['airV'], env['aerV'], env['rWaterV'], env['rSSV'], env['rSedWV'], env['rSedSV'],
+             env['fWaterV'], env['fSSV'], env['fSedWV'], env['fSedSV'],
+             env['sWaterV'], env['sSSV'], env['sSedWV'], env['sSedSV'], env['soilAV1'], env['soilWV1'],
+             env['soilSV1'], env['deepSV1'], env['soilAV2'], env['soilWV2'], env['soilSV2'], env['deepSV2'],
+             env['soilAV3'], env['soilWV2'], env['soilSV3'], env['deepSV3'],
+             env['soilAV4'], env['soilWV2'], env['soilSV3'], env['deepSV4']]
+
+    V_bulk_t = np.zeros((time, len(V_bulk)))
+    V_sub_t = np.zeros((time, len(V_sub)))
+    for j in range(len(V_bulk)):
+        V_bulk_t[:, j] = np.asarray(V_bulk[j], dtype=float)[:time] if np.ndim(V_bulk[j]) else V_bulk[j]
+    for j in range(len(V_sub)):
+        V_sub_t[:, j] = np.asarray(V_sub[j], dtype=float)[:time] if np.ndim(V_sub[j]) else V_sub[j]
+    return V_bulk_t, V_sub_t
+
+
+def daily_env(env, i, keys=('rWaterV', 'rSSV', 'rwV', 'rSSVf')):
+    # environment of day i, the time-varying entries (river volumes) are replaced by their value on that day
+    # a shallow copy shares the static entries with env, the per-day series themselves are not copied,
+    # so the cost does not grow with the simulation length (nothing downstream modifies env in place)
+    env_new = dict(env)
+    for key in keys:
+        env_new[key] = env[key][i]
+    return env_new
+
+
+def nano_volume(env, i):
+    # nanoFate volume vector of day i
+    V = [env['airV'], env['aerV'], env['rwV'][i], env['rwV'][i], env['sedRWV'],
+         env['freshwV'], env['freshwV'], env['sedFWV'], env['seawV'], env['seawV'], env['sedSWV'],
+         env['soilV1'], env['soilV1'], env['soilV2'], env['soilV2'], env['soilV3'], env['soilV3'],
+         env['soilV4'], env['soilV4'], env['rwV'][i], env['sedRWV'], env['freshwV'], env['sedFWV'],
+         env['seawV'], env['sedSWV'], env['soilwV1'], env['soilwV2'], env['soilwV3'], env['soilwV4'],
+         env['deepsV1'], env['deepsV2'], env['deepsV3'], env['deepsV4']]
+    return V
+
+
 def remove_floating_values(array_list):
-    new_array_list = []
+    # set the negative values (integration round-off) to 0, in place, so no copy of the arrays is made
     for array in array_list:
-        array = array.clip(min=0)
-        new_array_list.append(array)
-    return new_array_list
+        np.clip(array, 0, None, out=array)
+    return array_list
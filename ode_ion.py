@@ -2,6 +2,7 @@ import numpy as np
 from degradation_process import Degradation
 from advective_processes import AdvectiveProcess
 from diffusion_process_ion import Diffusion
+from linear_system import linear_matrix
 
 ##############
 #
@@ -11,7 +12,7 @@ from diffusion_process_ion import Diffusion
 ##############
 
 def ion_ode(t, Q, i, presence, env, chemParams, climate, release, bgConc,
-            Z_ij, Z_ij_sub, Y_ij, X_ij, Z_i):
+            Z_ij, Z_ij_sub, Y_ij, X_ij, Z_i, return_processes=False):
     # Q is the total aquivalence by each subcompartment, also Q_t, unit: mol/m3
     # Q_n = Q_t * Y_n, and Q_i = Q_t * Y_i,
     # D unit: m3/day, N unit: mol/day, Q unit: mol/m3
@@ -1072,4 +1073,171 @@ def ion_ode(t, Q, i, presence, env, chemParams, climate, release, bgConc,
 
     dYdt = [air, rw, rwSed, fw, fwSed, sw, swSed, soil1, deepS1, soil2, deepS2, soil3, deepS3, soil4, deepS4]
 
-    return dYdt
+    # the process table of the solver (kg/day by process) comes from the same fluxes, on request
+    if not return_processes:
+        return dYdt
+
+    ###################################################################
+    # processes output to transport rate kg/day
+    # N * molar mass = mol/day * kg/mol = kg/day
+    ###################################################################
+
+    # 1) degradation process
+    deg_air = (air_deg_n + aer_deg_n + aer_deg_i) * chemParams['molar_mass']
+    deg_rw = (rw_deg_n + rw_deg_i + rSS_deg_n + rSS_deg_i) * chemParams['molar_mass']
+    deg_rwSed = (rSedW_deg_n + rSedW_deg_i + rSedS_deg_n + rSedS_deg_i) * chemParams['molar_mass']
+    deg_fw = (fw_deg_n + fw_deg_i + fSS_deg_n + fSS_deg_i) * chemParams['molar_mass']
+    deg_fwSed = (fSedW_deg_n + fSedW_deg_i + fSedS_deg_n + fSedS_deg_i) * chemParams['molar_mass']
+    deg_sw = (sw_deg_n + sw_deg_i + sSS_deg_n + sSS_deg_i) * chemParams['molar_mass']
+    deg_swSed = (sSedW_deg_n + sSedW_deg_i + sSedS_deg_n + sSedS_deg_i) * chemParams['molar_mass']
+    deg_soil1 = (soilA1_deg_n + soilW1_deg_n + soilW1_deg_i + soilS1_deg_n + soilS1_deg_i) * chemParams['molar_mass']
+    deg_deepS1 = (deepS1_deg_n + deepS1_deg_i) * chemParams['molar_mass']
+    deg_soil2 = (soilA2_deg_n + soilW2_deg_n + soilW2_deg_i + soilS2_deg_n + soilS2_deg_i) * chemParams['molar_mass']
+    deg_deepS2 = (deepS2_deg_n + deepS2_deg_i) * chemParams['molar_mass']
+    deg_soil3 = (soilA3_deg_n + soilW3_deg_n + soilW3_deg_i + soilS3_deg_n + soilS3_deg_i) * chemParams['molar_mass']
+    deg_deepS3 = (deepS3_deg_n + deepS3_deg_i) * chemParams['molar_mass']
+    deg_soil4 = (soilA4_deg_n + soilW4_deg_n + soilW4_deg_i + soilS4_deg_n + soilS4_deg_i) * chemParams['molar_mass']
+    deg_deepS4 = (deepS4_deg_n + deepS4_deg_i) * chemParams['molar_mass']
+
+    # 2) advection process
+    adv_air_in = (airIn_adv_n + airIn_adv_i) * chemParams['molar_mass']
+    adv_air_out = (airOut_adv_n + aerOut_adv_n + aerOut_adv_i) * chemParams['molar_mass']
+    adv_rw_in = (rwIn_adv_n + rwIn_adv_i) * chemParams['molar_mass']
+    adv_rw_out = (rwOut_adv_n + rwOut_adv_i + rSSOut_adv_n + rSSOut_adv_i) * chemParams['molar_mass']
+    adv_rwSed_in = (rSed_adv_inflow_n + rSed_adv_inflow_i) * chemParams['molar_mass']
+    adv_rwSed_out = (rSed_adv_outflow_n + rSed_adv_outflow_i) * chemParams['molar_mass']
+    adv_fw_in = (fwIn_adv_n + fwIn_adv_i) * chemParams['molar_mass']
+    adv_fw_out = (fwOut_adv_n + fwOut_adv_i + fSSOut_adv_n + fSSOut_adv_i) * chemParams['molar_mass']
+    adv_fwSed_in = (fSed_adv_inflow_n + fSed_adv_inflow_i) * chemParams['molar_mass']
+    adv_fwSed_out = (fSed_adv_outflow_n + fSed_adv_outflow_i) * chemParams['molar_mass']
+    adv_sw_in = (swIn_adv_n + swIn_adv_i + sSSIn_adv_n + sSSIn_adv_i) * chemParams['molar_mass']
+    adv_sw_out = (swOut_adv_n + swOut_adv_i + sSSOut_adv_n + sSSOut_adv_i) * chemParams['molar_mass']
+    adv_swSed_out = (sSed_adv_outflow_n + sSed_adv_outflow_i) * chemParams['molar_mass']
+
+    # 3) deposition process
+    dep_dry_air = (aer_dep_dry_n + aer_dep_dry_i) * chemParams['molar_mass']
+    dep_dry_air_rw = (aer_dep_dry_n_to_rSS + aer_dep_dry_i_to_rSS) * chemParams['molar_mass']
+    dep_dry_air_fw = (aer_dep_dry_n_to_fSS + aer_dep_dry_i_to_fSS) * chemParams['molar_mass']
+    dep_dry_air_sw = (aer_dep_dry_n_to_sSS + aer_dep_dry_i_to_sSS) * chemParams['molar_mass']
+    dep_dry_air_soil1 = (aer_dep_dry_n_to_soil1 + aer_dep_dry_i_to_soil1) * chemParams['molar_mass']
+    dep_dry_air_soil2 = (aer_dep_dry_n_to_soil2 + aer_dep_dry_i_to_soil2) * chemParams['molar_mass']
+    dep_dry_air_soil3 = (aer_dep_dry_n_to_soil3 + aer_dep_dry_i_to_soil3) * chemParams['molar_mass']
+    dep_dry_air_soil4 = (aer_dep_dry_n_to_soil4 + aer_dep_dry_i_to_soil4) * chemParams['molar_mass']
+
+    dep_wet_air = (aer_dep_wet_n + aer_dep_wet_i) * chemParams['molar_mass']
+    dep_wet_air_rw = (aer_dep_wet_n_to_rSS + aer_dep_wet_i_to_rSS) * chemParams['molar_mass']
+    dep_wet_air_fw = (aer_dep_wet_n_to_fSS + aer_dep_wet_i_to_fSS) * chemParams['molar_mass']
+    dep_wet_air_sw = (aer_dep_wet_n_to_sSS + aer_dep_wet_i_to_sSS) * chemParams['molar_mass']
+    dep_wet_air_soil1 = (aer_dep_wet_n_to_soil1 + aer_dep_wet_i_to_soil1) * chemParams['molar_mass']
+    dep_wet_air_soil2 = (aer_dep_wet_n_to_soil2 + aer_dep_wet_i_to_soil2) * chemParams['molar_mass']
+    dep_wet_air_soil3 = (aer_dep_wet_n_to_soil3 + aer_dep_wet_i_to_soil3) * chemParams['molar_mass']
+    dep_wet_air_soil4 = (aer_dep_wet_n_to_soil4 + aer_dep_wet_i_to_soil4) * chemParams['molar_mass']
+
+    rain_dis_air = air_rain_diss_n * chemParams['molar_mass']
+    rain_dis_air_rw = air_rain_diss_n_to_rw * chemParams['molar_mass']
+    rain_dis_air_fw = air_rain_diss_n_to_fw * chemParams['molar_mass']
+    rain_dis_air_sw = air_rain_diss_n_to_sw * chemParams['molar_mass']
+    rain_dis_air_soil1 = air_rain_diss_n_to_soil1 * chemParams['molar_mass']
+    rain_dis_air_soil2 = air_rain_diss_n_to_soil2 * chemParams['molar_mass']
+    rain_dis_air_soil3 = air_rain_diss_n_to_soil3 * chemParams['molar_mass']
+    rain_dis_air_soil4 = air_rain_diss_n_to_soil4 * chemParams['molar_mass']
+
+    dep_rSS = (rSS_dep_n + rSS_dep_i) * chemParams['molar_mass']
+    dep_fSS = (fSS_dep_n + fSS_dep_i) * chemParams['molar_mass']
+    dep_sSS = (sSS_dep_n + sSS_dep_i) * chemParams['molar_mass']
+
+    # 4) diffusion process
+    diff_air_rw = air_diff_n_to_rw * chemParams['molar_mass']
+    diff_air_fw = air_diff_n_to_fw * chemParams['molar_mass']
+    diff_air_sw = air_diff_n_to_sw * chemParams['molar_mass']
+    diff_rw_rSedW = (rw_diff_n_to_rSedW + rw_diff_i_to_rSedW) * chemParams['molar_mass']
+    diff_fw_fSedW = (fw_diff_n_to_fSedW + fw_diff_i_to_fSedW) * chemParams['molar_mass']
+    diff_sw_sSedW = (sw_diff_n_to_sSedW + sw_diff_i_to_sSedW) * chemParams['molar_mass']
+    diff_air_soil1 = air_diff_n_to_soil1 * chemParams['molar_mass']
+    diff_air_soil2 = air_diff_n_to_soil2 * chemParams['molar_mass']
+    diff_air_soil3 = air_diff_n_to_soil3 * chemParams['molar_mass']
+    diff_air_soil4 = air_diff_n_to_soil4 * chemParams['molar_mass']
+
+    diff_rw_air = rw_diff_n_to_air * chemParams['molar_mass']
+    diff_fw_air = fw_diff_n_to_air * chemParams['molar_mass']
+    diff_sw_air = sw_diff_n_to_air * chemParams['molar_mass']
+    diff_rSedW_rw = (rSedW_diff_n_to_rw + rSedW_diff_i_to_rw) * chemParams['molar_mass']
+    diff_fSedW_fw = (fSedW_diff_n_to_fw + fSedW_diff_i_to_fw) * chemParams['molar_mass']
+    diff_sSedW_sw = (sSedW_diff_n_to_sw + sSedW_diff_i_to_sw) * chemParams['molar_mass']
+    diff_soil1_air = soil1_diff_n_to_air * chemParams['molar_mass']
+    diff_soil2_air = soil2_diff_n_to_air * chemParams['molar_mass']
+    diff_soil3_air = soil3_diff_n_to_air * chemParams['molar_mass']
+    diff_soil4_air = soil4_diff_n_to_air * chemParams['molar_mass']
+
+    # 5) other process
+    burial_rwSed = (rSedS_burial_n + rSedS_burial_i) * chemParams['molar_mass']
+    burial_fwSed = (fSedS_burial_n + fSedS_burial_i) * chemParams['molar_mass']
+    burial_swSed = (sSedS_burial_n + sSedS_burial_i) * chemParams['molar_mass']
+    resusp_rwSed = (rSedS_resusp_n + rSedS_resusp_i) * chemParams['molar_mass']
+    resusp_fwSed = (fSedS_resusp_n + fSedS_resusp_i) * chemParams['molar_mass']
+    resusp_swSed = (sSedS_resusp_n + sSedS_resusp_i) * chemParams['molar_mass']
+    aero_resusp_sSS = (sSS_resusp_n + sSS_resusp_i) * chemParams['molar_mass']
+    runoff_soil1_river = (soilW1_runoff_n_river + soilW1_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil2_river = (soilW2_runoff_n_river + soilW2_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil3_river = (soilW3_runoff_n_river + soilW3_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil4_river = (soilW4_runoff_n_river + soilW4_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil1_fresh = (soilW1_runoff_n_fresh + soilW1_runoff_i_fresh) * chemParams['molar_mass']
+    runoff_soil2_fresh = (soilW2_runoff_n_fresh + soilW2_runoff_i_fresh) * chemParams['molar_mass']
+    runoff_soil3_fresh = (soilW3_runoff_n_fresh + soilW3_runoff_i_fresh) * chemParams['molar_mass']
+    runoff_soil4_fresh = (soilW4_runoff_n_fresh + soilW4_runoff_i_fresh) * chemParams['molar_mass']
+    erosion_soil1_river = (soilS1_erosion_n_river + soilS1_erosion_i_river) * chemParams['molar_mass']
+    erosion_soil2_river = (soilS2_erosion_n_river + soilS2_erosion_i_river) * chemParams['molar_mass']
+    erosion_soil3_river = (soilS3_erosion_n_river + soilS3_erosion_i_river) * chemParams['molar_mass']
+    erosion_soil4_river = (soilS4_erosion_n_river + soilS4_erosion_i_river) * chemParams['molar_mass']
+    erosion_soil1_fresh = (soilS1_erosion_n_fresh + soilS1_erosion_i_fresh) * chemParams['molar_mass']
+    erosion_soil2_fresh = (soilS2_erosion_n_fresh + soilS2_erosion_i_fresh) * chemParams['molar_mass']
+    erosion_soil3_fresh = (soilS3_erosion_n_fresh + soilS3_erosion_i_fresh) * chemParams['molar_mass']
+    erosion_soil4_fresh = (soilS4_erosion_n_fresh + soilS4_erosion_i_fresh) * chemParams['molar_mass']
+    wind_erosion_soil1 = (soilS1_windErosion_n + soilS1_windErosion_i) * chemParams['molar_mass']
+    wind_erosion_soil2 = (soilS2_windErosion_n + soilS2_windErosion_i) * chemParams['molar_mass']
+    wind_erosion_soil3 = (soilS3_windErosion_n + soilS3_windErosion_i) * chemParams['molar_mass']
+    wind_erosion_soil4 = (soilS4_windErosion_n + soilS4_windErosion_i) * chemParams['molar_mass']
+    infiltra_soil1 = (soilW1_infil_n + soilW1_infil_i) * chemParams['molar_mass']
+    infiltra_soil2 = (soilW2_infil_n + soilW2_infil_i) * chemParams['molar_mass']
+    infiltra_soil3 = (soilW3_infil_n + soilW3_infil_i) * chemParams['molar_mass']
+    infiltra_soil4 = (soilW4_infil_n + soilW4_infil_i) * chemParams['molar_mass']
+    leach_soil1_river = (deepS1_leach_n_river + deepS1_leach_i_river) * chemParams['molar_mass']
+    leach_soil2_river = (deepS2_leach_n_river + deepS2_leach_i_river) * chemParams['molar_mass']
+    leach_soil3_river = (deepS3_leach_n_river + deepS3_leach_i_river) * chemParams['molar_mass']
+    leach_soil4_river = (deepS4_leach_n_river + deepS4_leach_i_river) * chemParams['molar_mass']
+    leach_soil1_fresh = (deepS1_leach_n_fresh + deepS1_leach_i_fresh) * chemParams['molar_mass']
+    leach_soil2_fresh = (deepS2_leach_n_fresh + deepS2_leach_i_fresh) * chemParams['molar_mass']
+    leach_soil3_fresh = (deepS3_leach_n_fresh + deepS3_leach_i_fresh) * chemParams['molar_mass']
+    leach_soil4_fresh = (deepS4_leach_n_fresh + deepS4_leach_i_fresh) * chemParams['molar_mass']
+
+    processes = [adv_air_in, adv_air_out, adv_rw_in, adv_rw_out, adv_rwSed_in, adv_rwSed_out, adv_fw_in, adv_fw_out,
+                 adv_fwSed_in, adv_fwSed_out, adv_sw_in, adv_sw_out, adv_swSed_out, dep_dry_air, dep_dry_air_rw,
+                 dep_dry_air_fw, dep_dry_air_sw, dep_dry_air_soil1, dep_dry_air_soil2, dep_dry_air_soil3, dep_dry_air_soil4,
+                 dep_wet_air, dep_wet_air_rw, dep_wet_air_fw, dep_wet_air_sw, dep_wet_air_soil1,
+                 dep_wet_air_soil2, dep_wet_air_soil3, dep_wet_air_soil4, rain_dis_air, rain_dis_air_rw, rain_dis_air_fw,
+                 rain_dis_air_sw, rain_dis_air_soil1, rain_dis_air_soil2, rain_dis_air_soil3, rain_dis_air_soil4,
+                 dep_rSS, dep_fSS, dep_sSS, diff_air_rw, diff_air_fw, diff_air_sw, diff_rw_rSedW, diff_fw_fSedW,
+                 diff_sw_sSedW, diff_air_soil1, diff_air_soil2, diff_air_soil3, diff_air_soil4, diff_rw_air, diff_fw_air,
+                 diff_sw_air, diff_rSedW_rw, diff_fSedW_fw, diff_sSedW_sw, diff_soil1_air, diff_soil2_air,
+                 diff_soil3_air, diff_soil4_air, burial_rwSed, burial_fwSed, burial_swSed, resusp_rwSed, resusp_fwSed,
+                 resusp_swSed, aero_resusp_sSS, runoff_soil1_river, runoff_soil2_river, runoff_soil3_river, runoff_soil4_river,
+                 runoff_soil1_fresh, runoff_soil2_fresh, runoff_soil3_fresh, runoff_soil4_fresh, erosion_soil1_river,
+                 erosion_soil2_river, erosion_soil3_river, erosion_soil4_river, erosion_soil1_fresh, erosion_soil2_fresh,
+                 erosion_soil3_fresh, erosion_soil4_fresh, wind_erosion_soil1, wind_erosion_soil2,
+                 wind_erosion_soil3, wind_erosion_soil4, infiltra_soil1, infiltra_soil2, infiltra_soil3,
+                 infiltra_soil4, leach_soil1_river, leach_soil2_river, leach_soil3_river, leach_soil4_river,
+                 leach_soil1_fresh, leach_soil2_fresh, leach_soil3_fresh, leach_soil4_fresh, deg_air, deg_rw, deg_fw,
+                 deg_rwSed, deg_fwSed, deg_sw, deg_swSed, deg_soil1, deg_deepS1, deg_soil2, deg_deepS2, deg_soil3,
+                 deg_deepS3, deg_soil4, deg_deepS4]
+
+    return dYdt, processes
+
+
+def ion_jac(t, Q, i, presence, env, chemParams, climate, release, bgConc,
+            Z_ij, Z_ij_sub, Y_ij, X_ij, Z_i):
+    # jacobian of ion_ode, same arguments, unit: 1/day
+    # every flux in ion_ode is a D-value times the aquivalence of one compartment, so the jacobian is the
+    # matrix of D-values (divided by the volumes), built by a single ion_ode call for all the unit vectors
+    # release and bgConc do not enter it, ion_solver passes the no_source ones (see linear_system)
+    return linear_matrix(ion_ode, len(Q), (i, presence, env, chemParams, climate, release, bgConc,
+                                           Z_ij, Z_ij_sub, Y_ij, X_ij, Z_i))
@@ -1,5 +1,6 @@
 from advective_processes import AdvectiveProcess
 from diffusion_process_ion import Diffusion
+from linear_system import linear_matrix
 
 ###############
 #
@@ -10,7 +11,7 @@ from diffusion_process_ion import Diffusion
 
 
 def metal_ode(t, Q, i, presence, env, chemParams, climate, release, bgConc,
-              Z_ij, Y_ij, Z_i):
+              Z_ij, Y_ij, Z_i, return_processes=False):
     # Q is the total aquivalence by each subcompartment, also Q_t, unit: mol/m3
     # Q_n = Q_t * Y_n, and Q_i = Q_t * Y_i,
     # D unit: m3/day, N unit: mol/day, Q unit: mol/m3
@@ -810,4 +811,129 @@ def metal_ode(t, Q, i, presence, env, chemParams, climate, release, bgConc,
 
     dYdt = [air, rw, rwSed, fw, fwSed, sw, swSed, soil1, deepS1, soil2, deepS2, soil3, deepS3, soil4, deepS4]
 
-    return dYdt
+    # the process table of the solver (kg/day by process) comes from the same fluxes, on request
+    if not return_processes:
+        return dYdt
+
+    ###################################################################
+    # processes output to transport rate kg/day
+    # N * molar mass = mol/day * kg/mol = kg/day
+    ###################################################################
+
+    # 1) advection process
+    adv_air_in = (airIn_adv_p + airIn_adv_i) * chemParams['molar_mass']
+    adv_air_out = (aerOut_adv_p + aerOut_adv_c + aerOut_adv_i) * chemParams['molar_mass']
+    adv_rw_in = (rwIn_adv_p + rwIn_adv_c + rwIn_adv_i) * chemParams['molar_mass']
+    adv_rw_out = (rwOut_adv_c + rwOut_adv_i + rSSOut_adv_p) * chemParams['molar_mass']
+    adv_rwSed_in = (rSed_adv_inflow_p + rSed_adv_inflow_c + rSed_adv_inflow_i) * chemParams['molar_mass']
+    adv_rwSed_out = (rSed_adv_outflow_p + rSed_adv_outflow_c + rSed_adv_outflow_i) * chemParams['molar_mass']
+    adv_fw_in = (fwIn_adv_p + fwIn_adv_c + fwIn_adv_i) * chemParams['molar_mass']
+    adv_fw_out = (fwOut_adv_c + fwOut_adv_i + fSSOut_adv_p) * chemParams['molar_mass']
+    adv_fwSed_in = (fSed_adv_inflow_p + fSed_adv_inflow_c + fSed_adv_inflow_i) * chemParams['molar_mass']
+    adv_fwSed_out = (fSed_adv_outflow_p + fSed_adv_outflow_c + fSed_adv_outflow_i) * chemParams['molar_mass']
+    adv_sw_in = (swIn_adv_c + swIn_adv_i + sSSIn_adv_p) * chemParams['molar_mass']
+    adv_sw_out = (swOut_adv_c + swOut_adv_i + sSSOut_adv_p) * chemParams['molar_mass']
+    adv_swSed_out = (sSed_adv_outflow_p + sSed_adv_outflow_c + sSed_adv_outflow_i) * chemParams['molar_mass']
+
+    # 2) deposition process
+    dep_dry_air = (aer_dep_dry_p + aer_dep_dry_i) * chemParams['molar_mass']
+    dep_dry_air_rw = (aer_dep_dry_p_to_rSS + aer_dep_dry_i_to_rSS) * chemParams['molar_mass']
+    dep_dry_air_fw = (aer_dep_dry_p_to_fSS + aer_dep_dry_i_to_fSS) * chemParams['molar_mass']
+    dep_dry_air_sw = (aer_dep_dry_p_to_sSS + aer_dep_dry_i_to_sSS) * chemParams['molar_mass']
+    dep_dry_air_soil1 = (aer_dep_dry_p_to_soil1 + aer_dep_dry_i_to_soil1) * chemParams['molar_mass']
+    dep_dry_air_soil2 = (aer_dep_dry_p_to_soil2 + aer_dep_dry_i_to_soil2) * chemParams['molar_mass']
+    dep_dry_air_soil3 = (aer_dep_dry_p_to_soil3 + aer_dep_dry_i_to_soil3) * chemParams['molar_mass']
+    dep_dry_air_soil4 = (aer_dep_dry_p_to_soil4 + aer_dep_dry_i_to_soil4) * chemParams['molar_mass']
+
+    dep_wet_air = (aer_dep_wet_p + aer_dep_wet_i) * chemParams['molar_mass']
+    dep_wet_air_rw = (aer_dep_wet_p_to_rSS + aer_dep_wet_i_to_rSS) * chemParams['molar_mass']
+    dep_wet_air_fw = (aer_dep_wet_p_to_fSS + aer_dep_wet_i_to_fSS) * chemParams['molar_mass']
+    dep_wet_air_sw = (aer_dep_wet_p_to_sSS + aer_dep_wet_i_to_sSS) * chemParams['molar_mass']
+    dep_wet_air_soil1 = (aer_dep_wet_p_to_soil1 + aer_dep_wet_i_to_soil1) * chemParams['molar_mass']
+    dep_wet_air_soil2 = (aer_dep_wet_p_to_soil2 + aer_dep_wet_i_to_soil2) * chemParams['molar_mass']
+    dep_wet_air_soil3 = (aer_dep_wet_p_to_soil3 + aer_dep_wet_i_to_soil3) * chemParams['molar_mass']
+    dep_wet_air_soil4 = (aer_dep_wet_p_to_soil4 + aer_dep_wet_i_to_soil4) * chemParams['molar_mass']
+
+    dep_rSS = rSS_dep_p * chemParams['molar_mass']
+    dep_fSS = fSS_dep_p * chemParams['molar_mass']
+    dep_sSS = sSS_dep_p * chemParams['molar_mass']
+
+    # 3) diffusion process
+    diff_rw_rSedW = (rw_diff_c_to_rSedW + rw_diff_i_to_rSedW) * chemParams['molar_mass']
+    diff_fw_fSedW = (fw_diff_c_to_fSedW + fw_diff_i_to_fSedW) * chemParams['molar_mass']
+    diff_sw_sSedW = (sw_diff_c_to_sSedW + sw_diff_i_to_sSedW) * chemParams['molar_mass']
+    diff_rSedW_rw = (rSedW_diff_c_to_rw + rSedW_diff_i_to_rw) * chemParams['molar_mass']
+    diff_fSedW_fw = (fSedW_diff_c_to_fw + fSedW_diff_i_to_fw) * chemParams['molar_mass']
+    diff_sSedW_sw = (sSedW_diff_c_to_sw + sSedW_diff_i_to_sw) * chemParams['molar_mass']
+
+    # 4) other process
+    burial_rwSed = rSedS_burial_p * chemParams['molar_mass']
+    burial_fwSed = fSedS_burial_p * chemParams['molar_mass']
+    burial_swSed = sSedS_burial_p * chemParams['molar_mass']
+    resusp_rwSed = rSedS_resusp_p * chemParams['molar_mass']
+    resusp_fwSed = fSedS_resusp_p * chemParams['molar_mass']
+    resusp_swSed = sSedS_resusp_p * chemParams['molar_mass']
+    aero_resusp_sSS = sSS_resusp_p * chemParams['molar_mass']
+    runoff_soil1_river = (soilW1_runoff_c_river + soilW1_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil2_river = (soilW2_runoff_c_river + soilW2_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil3_river = (soilW3_runoff_c_river + soilW3_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil4_river = (soilW4_runoff_c_river + soilW4_runoff_i_river) * chemParams['molar_mass']
+    runoff_soil1_fresh = (soilW1_runoff_c_fresh + soilW1_runoff_i_fresh) * chemParams['molar_mass']
+    runoff_soil2_fresh = (soilW2_runoff_c_fresh + soilW2_runoff_i_fresh) * chemParams['molar_mass']
+    runoff_soil3_fresh = (soilW3_runoff_c_fresh + soilW3_runoff_i_fresh) * chemParams['molar_mass']
+    runoff_soil4_fresh = (soilW4_runoff_c_fresh + soilW4_runoff_i_fresh) * chemParams['molar_mass']
+    erosion_soil1_river = soilS1_erosion_p_river * chemParams['molar_mass']
+    erosion_soil2_river = soilS2_erosion_p_river * chemParams['molar_mass']
+    erosion_soil3_river = soilS3_erosion_p_river * chemParams['molar_mass']
+    erosion_soil4_river = soilS4_erosion_p_river * chemParams['molar_mass']
+    erosion_soil1_fresh = soilS1_erosion_p_fresh * chemParams['molar_mass']
+    erosion_soil2_fresh = soilS2_erosion_p_fresh * chemParams['molar_mass']
+    erosion_soil3_fresh = soilS3_erosion_p_fresh * chemParams['molar_mass']
+    erosion_soil4_fresh = soilS4_erosion_p_fresh * chemParams['molar_mass']
+    wind_erosion_soil1 = soilS1_windErosion_p * chemParams['molar_mass']
+    wind_erosion_soil2 = soilS2_windErosion_p * chemParams['molar_mass']
+    wind_erosion_soil3 = soilS3_windErosion_p * chemParams['molar_mass']
+    wind_erosion_soil4 = soilS4_windErosion_p * chemParams['molar_mass']
+    infiltra_soil1 = (soilW1_infil_c + soilW1_infil_i) * chemParams['molar_mass']
+    infiltra_soil2 = (soilW2_infil_c + soilW2_infil_i) * chemParams['molar_mass']
+    infiltra_soil3 = (soilW3_infil_c + soilW3_infil_i) * chemParams['molar_mass']
+    infiltra_soil4 = (soilW4_infil_c + soilW4_infil_i) * chemParams['molar_mass']
+    leach_soil1_river = (deepS1_leach_c_river + deepS1_leach_i_river) * chemParams['molar_mass']
+    leach_soil2_river = (deepS2_leach_c_river + deepS2_leach_i_river) * chemParams['molar_mass']
+    leach_soil3_river = (deepS3_leach_c_river + deepS3_leach_i_river) * chemParams['molar_mass']
+    leach_soil4_river = (deepS4_leach_c_river + deepS4_leach_i_river) * chemParams['molar_mass']
+    leach_soil1_fresh = (deepS1_leach_c_fresh + deepS1_leach_i_fresh) * chemParams['molar_mass']
+    leach_soil2_fresh = (deepS2_leach_c_fresh + deepS2_leach_i_fresh) * chemParams['molar_mass']
+    leach_soil3_fresh = (deepS3_leach_c_fresh + deepS3_leach_i_fresh) * chemParams['molar_mass']
+    leach_soil4_fresh = (deepS4_leach_c_fresh + deepS4_leach_i_fresh) * chemParams['molar_mass']
+
+
+    processes = [adv_air_in, adv_air_out, adv_rw_in, adv_rw_out, adv_rwSed_in, adv_rwSed_out,
+                 adv_fw_in, adv_fw_out, adv_fwSed_in, adv_fwSed_out, adv_sw_in, adv_sw_out,
+                 adv_swSed_out, dep_dry_air, dep_dry_air_rw, dep_dry_air_fw, dep_dry_air_sw,
+                 dep_dry_air_soil1, dep_dry_air_soil2, dep_dry_air_soil3, dep_dry_air_soil4,
+                 dep_wet_air, dep_wet_air_rw, dep_wet_air_fw, dep_wet_air_sw, dep_wet_air_soil1,
+                 dep_wet_air_soil2, dep_wet_air_soil3, dep_wet_air_soil4, dep_rSS, dep_fSS,
+                 dep_sSS, diff_rw_rSedW, diff_fw_fSedW, diff_sw_sSedW, diff_rSedW_rw,
+                 diff_fSedW_fw, diff_sSedW_sw, burial_rwSed, burial_fwSed, burial_swSed,
+                 resusp_rwSed, resusp_fwSed, resusp_swSed, aero_resusp_sSS,
+                 runoff_soil1_river, runoff_soil2_river, runoff_soil3_river, runoff_soil4_river,
+                 runoff_soil1_fresh, runoff_soil2_fresh, runoff_soil3_fresh, runoff_soil4_fresh,
+                 erosion_soil1_river, erosion_soil2_river, erosion_soil3_river, erosion_soil4_river,
+                 erosion_soil1_fresh, erosion_soil2_fresh, erosion_soil3_fresh, erosion_soil4_fresh,
+                 wind_erosion_soil1, wind_erosion_soil2, wind_erosion_soil3, wind_erosion_soil4,
+                 infiltra_soil1, infiltra_soil2, infiltra_soil3, infiltra_soil4,
+                 leach_soil1_river, leach_soil2_river, leach_soil3_river, leach_soil4_river,
+                 leach_soil1_fresh, leach_soil2_fresh, leach_soil3_fresh, leach_soil4_fresh]
+
+    return dYdt, processes
+
+
+def metal_jac(t, Q, i, presence, env, chemParams, climate, release, bgConc,
+              Z_ij, Y_ij, Z_i):
+    # jacobian of metal_ode, same arguments, unit: 1/day
+    # every flux in metal_ode is a D-value times the aquivalence of one compartment, so the jacobian is the
+    # matrix of D-values (divided by the volumes), built by a single metal_ode call for all the unit vectors
+    # release and bgConc do not enter it, ion_solver passes the no_source ones (see linear_system)
+    return linear_matrix(metal_ode, len(Q), (i, presence, env, chemParams, climate, release, bgConc,
+                                             Z_ij, Y_ij, Z_i))
@@ -1,8 +1,8 @@
 from __future__ import division
 from degradation_process import Degradation
 from advective_processes import AdvectiveProcess
-from diffusion_process_non_ion import Diffusion, MTC
-from Z_non_ion import zValue
+from diffusion_process_non_ion import Diffusion, MTC, MTC_names, mtc_day
+from Z_non_ion import zValue, z_day, z_unpack
 
 
 ##################################################################
@@ -11,57 +11,34 @@ from Z_non_ion import zValue
 #
 #################################################################
 
-def org_ode(t, f, i, presence, env, climate, chemParams, release, bgConc):
+def org_ode(t, f, i, presence, env, climate, chemParams, release, bgConc, Z_table=None, MTC_table=None,
+            return_processes=False):
     # differential equation solver for organic chemical fugacity in all compartments
     # t is time, f is the fugacity by compartment and day (y for equations), i is the iteration in
     # the for loop - so the time step, V is the volume vector
     # flux N = D*f, unit: mol/day = mol/(Pa-day) * Pa
     # changes in fugacity in each compartment as a function of time
-    zV = zValue(climate['temp_K'][i], chemParams['Kaw_n'], chemParams['Kp_n'], env['aerP'], chemParams['Koc_n'])
-    zAirSub = zV.zAirSub()
-    zAerSub = zV.zAerSub(zAirSub)
-    zWaterSub = zV.zWaterSub(zAirSub)
-    zRWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Kssrw_unitless'])
-    zFWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Kssfw_unitless'])
-    zSWSusSedSub = zV.zWaterSusSedSub(zWaterSub, chemParams['Ksssw_unitless'])
-    zRSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbsrw_unitless'])
-    zFSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbsfw_unitless'])
-    zSSedSSub = zV.zWaterSedSolidSub(zWaterSub, chemParams['Kbssw_unitless'])
-    zS1SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd1_unitless'])
-    zS2SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd2_unitless'])
-    zS3SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd3_unitless'])
-    zS4SolidSub = zV.zSoilSolidSub(zWaterSub, chemParams['Kd4_unitless'])
-    zS1DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd1_d_unitless'])
-    zS2DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd2_d_unitless'])
-    zS3DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd3_d_unitless'])
-    zS4DeepSSub = zV.zDeepS(zWaterSub, chemParams['Kd4_d_unitless'])
-    zAirBulk = zV.zAirBulk(env['aerVf'], zAirSub, zAerSub)
-    zRWBulk = zV.zWaterBulk(env['rSSVf'], zRWSusSedSub, zWaterSub)
-    zFWBulk = zV.zWaterBulk(env['fSSVf'], zFWSusSedSub, zWaterSub)
-    zSWBulk = zV.zWaterBulk(env['sSSVf'], zSWSusSedSub, zWaterSub)
-    zRWSedimentBulk = zV.zSedimentBulk(env['riversedpercSolid'], zWaterSub, zRSedSSub)
-    zFWSedimentBulk = zV.zSedimentBulk(env['fsedpercSolid'], zWaterSub, zFSedSSub)
-    zSWSedimentBulk = zV.zSedimentBulk(env['ssedpercSolid'], zWaterSub, zSSedSSub)
-    zSoil1Bulk = zV.zSoilBulk(env['soilAC1'], env['soilWC1'], zAirSub, zWaterSub, zS1SolidSub)
-    zSoil2Bulk = zV.zSoilBulk(env['soilAC2'], env['soilWC2'], zAirSub, zWaterSub, zS2SolidSub)
-    zSoil3Bulk = zV.zSoilBulk(env['soilAC3'], env['soilWC3'], zAirSub, zWaterSub, zS3SolidSub)
-    zSoil4Bulk = zV.zSoilBulk(env['soilAC4'], env['soilWC4'], zAirSub, zWaterSub, zS4SolidSub)
-
-    MTC_process = MTC(chemParams['molar_volume'], climate['temp_K'][i], chemParams['MW'])
-    airMD = MTC_process.airMD()
-    waterMD = MTC_process.waterMD()
-    airWaterMTC = MTC_process.airWaterMTC(airMD)
-    airSoilMTC = MTC_process.airSoilMTC(airMD)
-    soil1AirMTC = MTC_process.soilAirMTC(airMD, env['soilAC1'], env['soilWC1'])
-    soil2AirMTC = MTC_process.soilAirMTC(airMD, env['soilAC2'], env['soilWC2'])
-    soil3AirMTC = MTC_process.soilAirMTC(airMD, env['soilAC3'], env['soilWC3'])
-    soil4AirMTC = MTC_process.soilAirMTC(airMD, env['soilAC4'], env['soilWC4'])
-    soil1WaterMTC = MTC_process.soilWaterMTC(waterMD, env['soilAC1'], env['soilWC1'])
-    soil2WaterMTC = MTC_process.soilWaterMTC(waterMD, env['soilAC2'], env['soilWC2'])
-    soil3WaterMTC = MTC_process.soilWaterMTC(waterMD, env['soilAC3'], env['soilWC3'])
-    soil4WaterMTC = MTC_process.soilWaterMTC(waterMD, env['soilAC4'], env['soilWC4'])
-    waterAirMTC = MTC_process.waterAirMTC(waterMD)
-    sedmtWaterMTC = MTC_process.sedmtWaterMTC(waterMD, env['fsedpercSolid'])
+    # Z values of the day, looked up in the table the solver builds once for the whole run
+    # (Z_non_ion.z_table), or computed for this day only when no table is given
+    if Z_table is None:
+        zV = zValue(climate['temp_K'][i], chemParams['Kaw_n'], chemParams['Kp_n'], env['aerP'], chemParams['Koc_n'])
+        Z_today = z_unpack(*zV.zValues(chemParams, env))
+    else:
+        Z_today = z_day(Z_table, i)
+    (zAirSub, zAerSub, zWaterSub, zRWSusSedSub, zFWSusSedSub, zSWSusSedSub, zRSedSSub, zFSedSSub, zSSedSSub,
+     zS1SolidSub, zS2SolidSub, zS3SolidSub, zS4SolidSub, zS1DeepSSub, zS2DeepSSub, zS3DeepSSub, zS4DeepSSub,
+     zAirBulk, zRWBulk, zFWBulk, zSWBulk, zRWSedimentBulk, zFWSedimentBulk, zSWSedimentBulk,
+     zSoil1Bulk, zSoil2Bulk, zSoil3Bulk, zSoil4Bulk) = Z_today
+
+    # mass transfer coefficients of the day, from the table the solver builds once per run and chemical
+    # (diffusion_process_non_ion.mtc_table), or computed for this day only when no table is given
+    if MTC_table is None:
+        MTC_values = MTC(chemParams['molar_volume'], climate['temp_K'][i], chemParams['MW']).mtcValues(env)
+        MTC_today = [MTC_values[name] for name in MTC_names]
+    else:
+        MTC_today = mtc_day(MTC_table, i)
+    (airMD, waterMD, airWaterMTC, airSoilMTC, soil1AirMTC, soil2AirMTC, soil3AirMTC, soil4AirMTC,
+     soil1WaterMTC, soil2WaterMTC, soil3WaterMTC, soil4WaterMTC, waterAirMTC, sedmtWaterMTC) = MTC_today
 
     deg = Degradation()
     adv = AdvectiveProcess()
@@ -694,4 +671,181 @@ def org_ode(t, f, i, presence, env, climate, chemParams, release, bgConc):
 
     dYdt = [air, rw, rwSed, fw, fwSed, sw, swSed, s1surf, s1deep, s2surf, s2deep, s3surf, s3deep, s4surf, s4deep]
 
-    return dYdt
+    # the process table of the solver (kg/day by process) comes from the same fluxes, on request
+    if not return_processes:
+        return dYdt
+
+    ###################################################################
+    # processes output to transport rate kg/day
+    # N * molar mass = mol/day * kg/mol = kg/day
+    ###################################################################
+
+    # deep soil leaching split between the river and the freshwater by their areas, as for runoff
+    leachingS1deep_river = leachingS1deep * (env['riverwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS1deep_fresh = leachingS1deep * (env['freshwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS2deep_river = leachingS2deep * (env['riverwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS2deep_fresh = leachingS2deep * (env['freshwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS3deep_river = leachingS3deep * (env['riverwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS3deep_fresh = leachingS3deep * (env['freshwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS4deep_river = leachingS4deep * (env['riverwA'] / (env['riverwA'] + env['freshwA']))
+    leachingS4deep_fresh = leachingS4deep * (env['freshwA'] / (env['riverwA'] + env['freshwA']))
+
+    # 1) degradation process
+    deg_air = degradationAir * chemParams['molar_mass']
+    deg_rw = degradationRW * chemParams['molar_mass']
+    deg_rwSed = degradationRSed * chemParams['molar_mass']
+    deg_fw = degradationFW * chemParams['molar_mass']
+    deg_fwSed = degradationFSed * chemParams['molar_mass']
+    deg_sw = degradationSW * chemParams['molar_mass']
+    deg_swSed = degradationSSed * chemParams['molar_mass']
+    deg_soil1 = degradationSoil1surf * chemParams['molar_mass']
+    deg_deepS1 = degradationSoil1deep * chemParams['molar_mass']
+    deg_soil2 = degradationSoil2surf * chemParams['molar_mass']
+    deg_deepS2 = degradationSoil2deep * chemParams['molar_mass']
+    deg_soil3 = degradationSoil3surf * chemParams['molar_mass']
+    deg_deepS3 = degradationSoil3deep * chemParams['molar_mass']
+    deg_soil4 = degradationSoil4surf * chemParams['molar_mass']
+    deg_deepS4 = degradationSoil4deep * chemParams['molar_mass']
+
+    # 2) advection process
+    adv_air_in = advectionAirInflow * chemParams['molar_mass']
+    adv_air_out = advectionAirBulkOutflow * chemParams['molar_mass']
+    adv_rw_in = advectionRWBulkInflow * chemParams['molar_mass']
+    adv_rw_out = advectionRWBulkOutflow * chemParams['molar_mass']
+    adv_rwSed_in = advectionRWSedInflow * chemParams['molar_mass']
+    adv_rwSed_out = advectionRSedOutflow * chemParams['molar_mass']
+    adv_fw_in = advectionFWBulkInflow * chemParams['molar_mass']
+    adv_fw_out = advectionFWBulkOutflow * chemParams['molar_mass']
+    adv_fwSed_in = advectionFWSedInflow * chemParams['molar_mass']
+    adv_fwSed_out = advectionFSedOutflow * chemParams['molar_mass']
+    adv_sw_in = advectionFWBulkOutflow * chemParams['molar_mass']
+    adv_sw_out = advectionSWBulkOutflow * chemParams['molar_mass']
+    adv_swSed_out = advectionSSedOutflow * chemParams['molar_mass']
+
+    # 3) deposition process
+    dep_dry_air = dryDepositionAer * chemParams['molar_mass']
+    dep_dry_air_rw = dryDepositionAer2RW * chemParams['molar_mass']
+    dep_dry_air_fw = dryDepositionAer2FW * chemParams['molar_mass']
+    dep_dry_air_sw = dryDepositionAer2SW * chemParams['molar_mass']
+    dep_dry_air_soil1 = dryDepositionAer2Soil1 * chemParams['molar_mass']
+    dep_dry_air_soil2 = dryDepositionAer2Soil2 * chemParams['molar_mass']
+    dep_dry_air_soil3 = dryDepositionAer2Soil3 * chemParams['molar_mass']
+    dep_dry_air_soil4 = dryDepositionAer2Soil4 * chemParams['molar_mass']
+
+    dep_wet_air = wetDepositionAer * chemParams['molar_mass']
+    dep_wet_air_rw = wetDepositionAer2RW * chemParams['molar_mass']
+    dep_wet_air_fw = wetDepositionAer2FW * chemParams['molar_mass']
+    dep_wet_air_sw = wetDepositionAer2SW * chemParams['molar_mass']
+    dep_wet_air_soil1 = wetDepositionAer2Soil1 * chemParams['molar_mass']
+    dep_wet_air_soil2 = wetDepositionAer2Soil2 * chemParams['molar_mass']
+    dep_wet_air_soil3 = wetDepositionAer2Soil3 * chemParams['molar_mass']
+    dep_wet_air_soil4 = wetDepositionAer2Soil4 * chemParams['molar_mass']
+
+    rain_dis_air = rainDissolutionAer * chemParams['molar_mass']
+    rain_dis_air_rw = rainDissolutionAer2RW * chemParams['molar_mass']
+    rain_dis_air_fw = rainDissolutionAer2FW * chemParams['molar_mass']
+    rain_dis_air_sw = rainDissolutionAer2SW * chemParams['molar_mass']
+    rain_dis_air_soil1 = rainDissolutionAer2Soil1 * chemParams['molar_mass']
+    rain_dis_air_soil2 = rainDissolutionAer2Soil2 * chemParams['molar_mass']
+    rain_dis_air_soil3 = rainDissolutionAer2Soil3 * chemParams['molar_mass']
+    rain_dis_air_soil4 = rainDissolutionAer2Soil4 * chemParams['molar_mass']
+
+    dep_rSS = sedDepRWSusSed * chemParams['molar_mass']
+    dep_fSS = sedDepFWSusSed * chemParams['molar_mass']
+    dep_sSS = sedDepSWSusSed * chemParams['molar_mass']
+
+    # 4) diffusion process
+    diff_air_rw = diffusionAir2RW * chemParams['molar_mass']
+    diff_air_fw = diffusionAir2FW * chemParams['molar_mass']
+    diff_air_sw = diffusionAir2SW * chemParams['molar_mass']
+    diff_rw_rSedW = diffusionRW2RWSed * chemParams['molar_mass']
+    diff_fw_fSedW = diffusionFW2FWSed * chemParams['molar_mass']
+    diff_sw_sSedW = diffusionSW2SWSed * chemParams['molar_mass']
+    diff_air_soil1 = diffusionAir2S1surf * chemParams['molar_mass']
+    diff_air_soil2 = diffusionAir2S2surf * chemParams['molar_mass']
+    diff_air_soil3 = diffusionAir2S3surf * chemParams['molar_mass']
+    diff_air_soil4 = diffusionAir2S4surf * chemParams['molar_mass']
+
+    diff_rw_air = diffusionRW2Air * chemParams['molar_mass']
+    diff_fw_air = diffusionFW2Air * chemParams['molar_mass']
+    diff_sw_air = diffusionSW2Air * chemParams['molar_mass']
+    diff_rSedW_rw = diffusionRWSed2RW * chemParams['molar_mass']
+    diff_fSedW_fw = diffusionFWSed2FW * chemParams['molar_mass']
+    diff_sSedW_sw = diffusionSWSed2SW * chemParams['molar_mass']
+    diff_soil1_air = diffusionS1surf2Air * chemParams['molar_mass']
+    diff_soil2_air = diffusionS2surf2Air * chemParams['molar_mass']
+    diff_soil3_air = diffusionS3surf2Air * chemParams['molar_mass']
+    diff_soil4_air = diffusionS4surf2Air * chemParams['molar_mass']
+
+    # 5) other process
+    burial_rwSed = sedBurialRSed * chemParams['molar_mass']
+    burial_fwSed = sedBurialFSed * chemParams['molar_mass']
+    burial_swSed = sedBurialSSed * chemParams['molar_mass']
+    resusp_rwSed = resuspRWSed * chemParams['molar_mass']
+    resusp_fwSed = resuspFWSed * chemParams['molar_mass']
+    resusp_swSed = resuspSWSed * chemParams['molar_mass']
+    runoff_soil1 = runoffS1Water * chemParams['molar_mass']
+    runoff_soil1_river = runoffS1Water_river * chemParams['molar_mass']
+    runoff_soil1_fresh = runoffS1Water_fresh * chemParams['molar_mass']
+    runoff_soil2 = runoffS2Water * chemParams['molar_mass']
+    runoff_soil2_river = runoffS2Water_river * chemParams['molar_mass']
+    runoff_soil2_fresh = runoffS2Water_fresh * chemParams['molar_mass']
+    runoff_soil3 = runoffS3Water * chemParams['molar_mass']
+    runoff_soil3_river = runoffS3Water_river * chemParams['molar_mass']
+    runoff_soil3_fresh = runoffS3Water_fresh * chemParams['molar_mass']
+    runoff_soil4 = runoffS4Water * chemParams['molar_mass']
+    runoff_soil4_river = runoffS4Water_river * chemParams['molar_mass']
+    runoff_soil4_fresh = runoffS4Water_fresh * chemParams['molar_mass']
+    erosion_soil1 = erosionS1Solid * chemParams['molar_mass']
+    erosion_soil1_river = erosionS1Solid_river * chemParams['molar_mass']
+    erosion_soil1_fresh = erosionS1Solid_fresh * chemParams['molar_mass']
+    erosion_soil2 = erosionS2Solid * chemParams['molar_mass']
+    erosion_soil2_river = erosionS2Solid_river * chemParams['molar_mass']
+    erosion_soil2_fresh = erosionS2Solid_fresh * chemParams['molar_mass']
+    erosion_soil3 = erosionS3Solid * chemParams['molar_mass']
+    erosion_soil3_river = erosionS3Solid_river * chemParams['molar_mass']
+    erosion_soil3_fresh = erosionS3Solid_fresh * chemParams['molar_mass']
+    erosion_soil4 = erosionS4Solid * chemParams['molar_mass']
+    erosion_soil4_river = erosionS4Solid_river * chemParams['molar_mass']
+    erosion_soil4_fresh = erosionS4Solid_fresh * chemParams['molar_mass']
+    wind_erosion_soil1 = windErosionS1Solid * chemParams['molar_mass']
+    wind_erosion_soil2 = windErosionS2Solid * chemParams['molar_mass']
+    wind_erosion_soil3 = windErosionS3Solid * chemParams['molar_mass']
+    wind_erosion_soil4 = windErosionS4Solid * chemParams['molar_mass']
+    infiltra_soil1 = infiltrationSoil1surf * chemParams['molar_mass']
+    infiltra_soil2 = infiltrationSoil2surf * chemParams['molar_mass']
+    infiltra_soil3 = infiltrationSoil3surf * chemParams['molar_mass']
+    infiltra_soil4 = infiltrationSoil4surf * chemParams['molar_mass']
+    leach_soil1 = leachingS1deep * chemParams['molar_mass']
+    leach_soil1_river = leachingS1deep_river * chemParams['molar_mass']
+    leach_soil1_fresh = leachingS1deep_fresh * chemParams['molar_mass']
+    leach_soil2 = leachingS2deep * chemParams['molar_mass']
+    leach_soil2_river = leachingS2deep_river * chemParams['molar_mass']
+    leach_soil2_fresh = leachingS2deep_fresh * chemParams['molar_mass']
+    leach_soil3 = leachingS3deep * chemParams['molar_mass']
+    leach_soil3_river = leachingS3deep_river * chemParams['molar_mass']
+    leach_soil3_fresh = leachingS3deep_fresh * chemParams['molar_mass']
+    leach_soil4 = leachingS4deep * chemParams['molar_mass']
+    leach_soil4_river = leachingS4deep_river * chemParams['molar_mass']
+    leach_soil4_fresh = leachingS4deep_fresh * chemParams['molar_mass']
+
+    processes = [adv_air_in, adv_air_out, adv_rw_in, adv_rw_out, adv_rwSed_in, adv_rwSed_out,
+                 adv_fw_in, adv_fw_out, adv_fwSed_in, adv_fwSed_out, adv_sw_in, adv_sw_out,
+                 adv_swSed_out, dep_dry_air, dep_dry_air_rw, dep_dry_air_fw, dep_dry_air_sw, dep_dry_air_soil1, dep_dry_air_soil2,
+                 dep_dry_air_soil3, dep_dry_air_soil4, dep_wet_air, dep_wet_air_rw, dep_wet_air_fw, dep_wet_air_sw, dep_wet_air_soil1,
+                 dep_wet_air_soil2, dep_wet_air_soil3, dep_wet_air_soil4, rain_dis_air, rain_dis_air_rw, rain_dis_air_fw,
+                 rain_dis_air_sw, rain_dis_air_soil1, rain_dis_air_soil2, rain_dis_air_soil3, rain_dis_air_soil4, dep_rSS, dep_fSS, dep_sSS,
+                 diff_air_rw, diff_air_fw, diff_air_sw, diff_rw_rSedW, diff_fw_fSedW, diff_sw_sSedW, diff_air_soil1, diff_air_soil2, diff_air_soil3,
+                 diff_air_soil4, diff_rw_air, diff_fw_air, diff_sw_air, diff_rSedW_rw, diff_fSedW_fw, diff_sSedW_sw, diff_soil1_air, diff_soil2_air,
+                 diff_soil3_air, diff_soil4_air, burial_rwSed, burial_fwSed, burial_swSed, resusp_rwSed, resusp_fwSed, resusp_swSed,
+                 runoff_soil1, runoff_soil1_river, runoff_soil1_fresh, runoff_soil2, runoff_soil2_river, runoff_soil2_fresh,
+                 runoff_soil3, runoff_soil3_river, runoff_soil3_fresh, runoff_soil4, runoff_soil4_river, runoff_soil4_fresh,
+                 erosion_soil1, erosion_soil1_river, erosion_soil1_fresh, erosion_soil2, erosion_soil2_river, erosion_soil2_fresh,
+                 erosion_soil3, erosion_soil3_river, erosion_soil3_fresh, erosion_soil4, erosion_soil4_river, erosion_soil4_fresh,
+                 wind_erosion_soil1, wind_erosion_soil2, wind_erosion_soil3, wind_erosion_soil4,
+                 infiltra_soil1, infiltra_soil2, infiltra_soil3, infiltra_soil4, leach_soil1, leach_soil1_river, leach_soil1_fresh,
+                 leach_soil2, leach_soil2_river, leach_soil2_fresh, leach_soil3, leach_soil3_river, leach_soil3_fresh,
+                 leach_soil4, leach_soil4_river, leach_soil4_fresh, deg_air, deg_rw, deg_rwSed, deg_fw, deg_fwSed,
+                 deg_sw, deg_swSed, deg_soil1, deg_deepS1, deg_soil2, deg_deepS2, deg_soil3, deg_deepS3, deg_soil4, deg_deepS4]
+
+    return dYdt, processes
@@ -1,7 +1,5 @@
 
 import numpy as np
-from rdkit import Chem
-from mordred import Calculator, descriptors
 
 
 class PartitionCoefficient:
@@ -152,6 +150,9 @@ class PartitionCoefficient:
     def cal_descriptor(self, smiles):
         # call rdkit mordred
         # McGowan's Volume and number of hydrogens bound by the charged nitrogen
+        # rdkit and mordred take long to import and only organic bases need them, so they are imported here
+        from rdkit import Chem
+        from mordred import Calculator, descriptors
         RDKIT_KEYS = ["VMcGowan"]
         mols = [Chem.MolFromSmiles(smi) for smi in [smiles]]
         calc = Calculator(descriptors, ignore_3D=True)
@@ -0,0 +1,204 @@
+from __future__ import division
+import os
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+
+
+##################################################################
+#
+#   Writers of the result tables (concentration, mass and process)
+#
+#################################################################
+
+# every result table has the simulated dates as rows (index) and the compartments or processes as columns,
+# a writer opens a table with table() and gets its rows block by block with append(), write_table passes the
+# arrays a solver returned (the whole run) in blocks of BLOCK_DAYS rows, which are written to the file right away,
+# so no DataFrame of a whole table is built
+# the unit of a table is the name of its date column (the A1 cell, as in the excel files), the parquet and
+# feather files also keep it in their metadata
+#   csv      <output>_<file name>_<table>.csv, one file per table (process_<file name>.csv for the process table)
+#   parquet  <output>_<file name>_<table>.parquet, one row group per block (needs pyarrow)
+#   feather  <output>_<file name>_<table>.feather, one record batch per block (needs pyarrow)
+#   npz      <output>_<file name>.npz with the arrays <table>, <table>_dates and <table>_columns, numpy cannot
+#            append to an npz so its blocks are kept until close()
+#   excel    <output>_<file name>.xlsx with one sheet per table, much slower than the others
+
+OUTPUT_FORMATS = ['csv', 'parquet', 'feather', 'npz', 'excel']
+# rows written at once by write_table
+BLOCK_DAYS = 365
+
+
+def result_writer(output_format, output_file_path, file_name):
+    if output_format not in WRITERS:
+        raise ValueError('output format should be one of %s, not %s' % (', '.join(OUTPUT_FORMATS), output_format))
+    return WRITERS[output_format](output_file_path, file_name)
+
+
+def table_file_name(table):
+    # sheet names such as 'free nano' as part of a file name
+    return table.replace(' ', '_')
+
+
+def import_pyarrow(output_format):
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError('the %s output needs pyarrow (pip install pyarrow), or use the csv output' % output_format)
+
+
+class ResultWriter(ABC):
+    # a writer of each output format implements table()
+
+    def __init__(self, output_file_path, file_name):
+        self.output_file_path = output_file_path
+        self.file_name = file_name
+
+    def path(self, output, table, extension):
+        # the process output has a single table, named like the output, its file is process_<file name>
+        suffix = '' if table == output else '_' + table_file_name(table)
+        return os.path.join(self.output_file_path, output + '_' + self.file_name + suffix + extension)
+
+    @abstractmethod
+    def table(self, output, table, unit, columns):
+        # output is 'chem_conc', 'chem_mass' or 'process', table the sheet name (eg. 'neutral_sub'), returns
+        # the open table, with append(dates, rows) and close()
+        pass
+
+    def write_table(self, output, table, unit, dates, columns, values):
+        # a whole table from the arrays of a solver, appended BLOCK_DAYS rows at a time
+        values = np.asarray(values, dtype=float)
+        writer = self.table(output, table, unit, columns)
+        for start in range(0, len(dates), BLOCK_DAYS):
+            writer.append(dates[start:start + BLOCK_DAYS], values[start:start + BLOCK_DAYS])
+        writer.close()
+
+    def close(self):
+        pass
+
+
+class CsvTable:
+    def __init__(self, path, unit, columns):
+        self.f = open(path, 'w', newline='')
+        self.columns = columns
+        pd.DataFrame(columns=[unit] + list(columns)).to_csv(self.f, index=False)
+
+    def append(self, dates, rows):
+        pd.DataFrame(rows, index=list(dates), columns=self.columns).to_csv(self.f, header=False)
+
+    def close(self):
+        self.f.close()
+
+
+class CsvWriter(ResultWriter):
+    def table(self, output, table, unit, columns):
+        return CsvTable(self.path(output, table, '.csv'), unit, columns)
+
+
+class ArrowTable:
+    # parquet and feather tables, a date column (named by the unit) and one float64 column per compartment
+    def __init__(self, path, unit, columns, output_format):
+        self.pa = import_pyarrow(output_format)
+        fields = [self.pa.field(unit, self.pa.string())] + [self.pa.field(str(c), self.pa.float64()) for c in columns]
+        self.schema = self.pa.schema(fields, metadata={'unit': unit})
+        if output_format == 'parquet':
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        else:
+            import pyarrow.ipc
+            # feather (version 2) is the arrow ipc file format
+            self.writer = pyarrow.ipc.new_file(path, self.schema)
+
+    def append(self, dates, rows):
+        rows = np.asarray(rows, dtype=float)
+        arrays = [self.pa.array([str(date) for date in dates], self.pa.string())] + \
+                 [self.pa.array(rows[:, k]) for k in range(rows.shape[1])]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ParquetWriter(ResultWriter):
+    def table(self, output, table, unit, columns):
+        return ArrowTable(self.path(output, table, '.parquet'), unit, columns, 'parquet')
+
+
+class FeatherWriter(ResultWriter):
+    def table(self, output, table, unit, columns):
+        return ArrowTable(self.path(output, table, '.feather'), unit, columns, 'feather')
+
+
+class NpzTable:
+    def __init__(self, arrays, table, unit, columns):
+        self.arrays = arrays
+        self.table = table
+        self.blocks = []
+        self.dates = []
+        arrays[table + '_columns'] = np.array(columns, dtype=str)
+        arrays[table + '_unit'] = np.array(unit)
+
+    def append(self, dates, rows):
+        self.dates.extend(str(date) for date in dates)
+        self.blocks.append(np.array(rows, dtype=float))
+
+    def close(self):
+        self.arrays[self.table] = np.concatenate(self.blocks) if self.blocks else np.zeros((0, 0))
+        self.arrays[self.table + '_dates'] = np.array(self.dates, dtype=str)
+
+
+class NpzWriter(ResultWriter):
+    def __init__(self, output_file_path, file_name):
+        ResultWriter.__init__(self, output_file_path, file_name)
+        # output: arrays of its npz file
+        self.outputs = {}
+
+    def table(self, output, table, unit, columns):
+        return NpzTable(self.outputs.setdefault(output, {}), table_file_name(table), unit, columns)
+
+    def close(self):
+        for output, arrays in self.outputs.items():
+            np.savez(os.path.join(self.output_file_path, output + '_' + self.file_name + '.npz'), **arrays)
+        self.outputs = {}
+
+
+class ExcelTable:
+    def __init__(self, excel, sheet_name, unit, columns):
+        self.excel = excel
+        self.sheet_name = sheet_name
+        self.unit = unit
+        self.columns = columns
+        self.row = 0
+
+    def append(self, dates, rows):
+        # the first block writes the header row, with the unit in A1
+        df = pd.DataFrame(rows, index=list(dates), columns=self.columns)
+        df.to_excel(self.excel, sheet_name=self.sheet_name, startrow=self.row, header=self.row == 0,
+                    index_label=self.unit)
+        self.row += len(df) + (1 if self.row == 0 else 0)
+
+    def close(self):
+        pass
+
+
+class ExcelWriter(ResultWriter):
+    def __init__(self, output_file_path, file_name):
+        ResultWriter.__init__(self, output_file_path, file_name)
+        # output: its pd.ExcelWriter
+        self.excels = {}
+
+    def table(self, output, table, unit, columns):
+        if output not in self.excels:
+            self.excels[output] = pd.ExcelWriter(os.path.join(self.output_file_path,
+                                                              output + '_' + self.file_name + '.xlsx'))
+        return ExcelTable(self.excels[output], table, unit, columns)
+
+    def close(self):
+        for excel in self.excels.values():
+            excel.close()
+        self.excels = {}
+
+
+WRITERS = {'csv': CsvWriter, 'parquet': ParquetWriter, 'feather': FeatherWriter, 'npz': NpzWriter,
+           'excel': ExcelWriter}
@@ -1,29 +1,33 @@
 import streamlit as st
 from datetime import datetime
 import pandas as pd
-import os
-import base64
-import shutil
-
-from model_setup import Model_SetUp
-
-def create_download_zip(zip_directory, zip_path, filename):
-    """
-        zip_directory (str): path to directory  you want to zip
-        zip_path (str): where you want to save zip file
-        filename (str): download filename for user who download this
-    """
-    shutil.make_archive(zip_path, 'zip', zip_directory)
-    with open(zip_path + '.zip', 'rb') as f:
-        bytes = f.read()
-        b64 = base64.b64encode(bytes).decode()
-        href = f'<a href="data:file/zip;base64,{b64}" download=\'{filename}\'>\
-            **Download Results (.zip)** \
-        </a>'
-        st.markdown(href, unsafe_allow_html=True)
-
-def get_date(region_file):
-    df = pd.read_excel(region_file, sheet_name="Climate")
+import io
+import time
+import zipfile
+
+from result_writer import OUTPUT_FORMATS
+from generate_result import PLOT_OPTIONS
+from input_cache import source_hash
+from job_queue import JobQueue, RUN_NAME
+
+# streamlit runs this script again on every widget change, the dates of a region file are cached across these
+# reruns, keyed by the sha256 of the uploaded file (the upload arguments starting with _ are not hashed by
+# streamlit)
+# the model runs go to a queue of worker processes shared by all the sessions (job_queue), a run with the same
+# files and settings as a finished one (eg. with another output name) reuses its results, the download is built
+# from the result files of the job
+DATE_CACHE_ENTRIES = 32
+# the script updates the progress bar of a run this often (s)
+PROGRESS_INTERVAL = 0.5
+# artifacts that can be left out of the download zip, a result file belongs to the first one whose name start
+# it has (see GenerateResult.store_output), the plots are the png files
+ARTIFACTS = [('Concentrations', 'chem_conc_'), ('Masses', 'chem_mass_'), ('Processes', 'process_')]
+ARTIFACT_PLOTS = 'Plots'
+
+@st.cache_data(max_entries=DATE_CACHE_ENTRIES, show_spinner=False)
+def get_date(region_hash, _region_file):
+    # only the date columns (month, day, year) are needed
+    df = pd.read_excel(_region_file, sheet_name="Climate", usecols=[0, 1, 2])
     start_month = df.iat[0, 0]
     start_day = df.iat[0, 1]
     start_year = df.iat[0, 2]
@@ -34,6 +38,66 @@ def get_date(region_file):
     end_date = str(int(end_year)) + ' ' + str(int(end_month)) + ' ' + str(int(end_day))
     return start_date, end_date
 
+@st.cache_resource
+def job_queue():
+    # one queue of model runs for all the sessions of the server
+    return JobQueue()
+
+def wait_for_job(queue, job):
+    # show the place of the job in the queue, then the days solved and the time left, until it is finished
+    progress_bar = st.progress(0.0, text="Waiting for a free worker ......")
+    while True:
+        progress = job.progress()
+        if progress['state'] in ['done', 'failed']:
+            break
+        if progress['state'] == 'queued':
+            text = "Waiting for a free worker, %d runs before yours" % queue.position(job)
+            progress_bar.progress(0.0, text=text)
+        elif progress['days'] == 0:
+            progress_bar.progress(0.0, text="Loading the input files ......")
+        else:
+            days, sim_days = progress['days'], progress['time']
+            if days + 1 >= sim_days:
+                text = "Saving the results ......"
+            else:
+                # time left from the mean time per day so far (with the loading of the inputs)
+                left = (time.time() - progress['start']) / days * (sim_days - days)
+                text = "Day %d of %d, about %d s left" % (days + 1, sim_days, left)
+            progress_bar.progress(days / sim_days, text=text)
+        time.sleep(PROGRESS_INTERVAL)
+    progress_bar.progress(1.0, text="Done" if progress['state'] == 'done' else "Failed")
+    return progress
+
+def job_outputs(job):
+    # output file name (with RUN_NAME for the output name): content
+    outputs = {}
+    for name in job.output_files():
+        with open(job.output_path(name), 'rb') as f:
+            outputs[name] = f.read()
+    return outputs
+
+def artifact(name):
+    if name.endswith('.png'):
+        return ARTIFACT_PLOTS
+    for label, start in ARTIFACTS:
+        if name.startswith(start):
+            return label
+    return None
+
+def zip_outputs(outputs, file_name, artifacts, compress_level):
+    # zip of the output files of the selected artifacts, built in memory from the run outputs (not from the
+    # output folder), level 0 stores the files, 1 to 9 deflates them (the png plots hardly shrink)
+    buffer = io.BytesIO()
+    if compress_level == 0:
+        zip_file = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED)
+    else:
+        zip_file = zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=compress_level)
+    with zip_file:
+        for name, content in outputs.items():
+            if artifact(name) in artifacts:
+                zip_file.writestr(name.replace(RUN_NAME, file_name), content)
+    return buffer.getvalue()
+
 st.title('Welcome to ChemFate!')
 # selection for chemical type
 step1_txt = "ChemFate predicts daily chemical environmental concentrations for four classes of chemicals. " \
@@ -59,17 +123,20 @@ bgPercOption2 = 10 # can be anywhere between 0-100
 
 st.subheader("Output Files")
 file_name = st.text_input('Output File Name', '') # pyrimethanil, cyprodinil, copper, nanoCopper
+# excel files take longer to write than the model takes to run for long simulations
+output_format = st.selectbox('Output Format', OUTPUT_FORMATS)
+plots = st.selectbox('Plots', PLOT_OPTIONS, index=PLOT_OPTIONS.index('all'))
+artifact_labels = [label for label, start in ARTIFACTS] + [ARTIFACT_PLOTS]
+download_artifacts = st.multiselect('Files in the Download', artifact_labels, default=artifact_labels)
+# higher levels give a smaller zip of the tables but take longer, 0 does not compress
+compress_level = st.select_slider('Download Compression Level', options=list(range(10)), value=6)
 
-CUR_PATH = os.path.dirname(os.path.abspath(__file__))
-output_file_path = os.path.join(CUR_PATH, 'Output', file_name)
-
-if not os.path.exists(output_file_path):
-    os.makedirs(output_file_path)
+queue = job_queue()
 
 start_date_from_file = "2005 1 1"
 end_date_from_file = "2014 12 31"
 if region_file:
-    start_date_from_file, end_date_from_file = get_date(region_file)
+    start_date_from_file, end_date_from_file = get_date(source_hash(region_file), region_file)
 
 st.markdown("Please enter the start date and end date for your model simulation time: ")
 st.markdown("Note: from your input region file, your date range is from " + "**" + start_date_from_file + "**" + " to "
@@ -91,13 +158,31 @@ if (end_day_from_user > end_day_from_file):
     st.markdown("**Error:** your End Date is outside the range.")
     
 if st.button(label="Click to Run ChemFate"):
+    if not (chem_file and region_file and release_file):
+        st.markdown("**Error:** please upload the chemical, region and chemical release files.")
+        st.stop()
+    if not file_name:
+        st.markdown("**Error:** please enter an output file name.")
+        st.stop()
     st.write("ChemFate Model Started to Run ......")
-    model = Model_SetUp(start_date, end_date, run_option, bgPercOption2,
-                        chem_type, chem_file, region_file, release_file, output_file_path, file_name)
-    model.run_model()
-    create_download_zip(zip_directory=output_file_path,
-                        zip_path=output_file_path,
-                        filename=file_name + '.zip')
+    try:
+        job = queue.submit({'chem_file': chem_file.getvalue(), 'region_file': region_file.getvalue(),
+                            'release_file': release_file.getvalue()},
+                           {'chem_type': chem_type, 'start_date': start_date, 'end_date': end_date,
+                            'run_option': run_option, 'bgPercOption2': bgPercOption2,
+                            'output_format': output_format, 'plots': plots})
+    except RuntimeError as e:
+        st.markdown("**Error:** " + str(e))
+        st.stop()
+    progress = wait_for_job(queue, job)
+    if progress['state'] == 'failed':
+        st.markdown("**Error:** the run failed, " + progress['error'])
+        st.stop()
+    outputs = job_outputs(job)
+    # the download does not rerun the script, so the results stay on the page
+    st.download_button(label="Download Results (.zip)",
+                       data=zip_outputs(outputs, file_name, download_artifacts, compress_level),
+                       file_name=file_name + '.zip', mime='application/zip', on_click='ignore')
 
 credit_txt1 = "_nanoFate was developed by Dr. Kendra Garner and Dr. Arturo Keller_"
 credit_txt2 = "_organoFate, ionOFate, and metalFate were developed by Dr. Mengya Tao and Dr. Arturo Keller_"
@@ -0,0 +1,190 @@
+from __future__ import division
+import os
+import io
+import sys
+import csv
+import json
+import time
+import argparse
+import traceback
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from model_setup import Model_SetUp, ensemble_key, run_ensemble
+
+CUR_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# columns of a manifest row, the last five are optional
+# batch runs make no plots unless asked for in the plots column ('summary' or 'all')
+MANIFEST_FIELDS = ['chem_type', 'chem_file', 'region_file', 'release_file', 'start_date', 'end_date', 'file_name',
+                   'run_option', 'bgPercOption2', 'solver_method', 'output_format', 'plots']
+MANIFEST_DEFAULTS = {'run_option': 1, 'bgPercOption2': 10, 'solver_method': 'vode', 'output_format': 'csv',
+                     'plots': 'none'}
+
+
+def init_worker():
+    # the solvers read helper files relative to the working directory, so the workers run from the model
+    # folder, and each worker renders the plots of its runs itself (see generate_result.PLOT_WORKERS)
+    os.chdir(CUR_PATH)
+    import generate_result
+    generate_result.PLOT_WORKERS = 0
+
+
+def read_manifest(manifest_file):
+    # a manifest lists one model run per row (csv) or per object (json, a list or {"runs": [...]})
+    # the input file paths are relative to the folder of the manifest
+    if manifest_file.lower().endswith('.json'):
+        with open(manifest_file) as f:
+            runs = json.load(f)
+        if isinstance(runs, dict):
+            runs = runs['runs']
+    else:
+        with open(manifest_file, newline='') as f:
+            runs = [row for row in csv.DictReader(f)]
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_file))
+    checked = []
+    for n, run in enumerate(runs):
+        run = dict((key.strip(), value.strip() if isinstance(value, str) else value) for key, value in run.items()
+                   if key is not None)
+        for key in MANIFEST_FIELDS[:7]:
+            if not run.get(key):
+                raise ValueError('manifest run %d has no %s' % (n + 1, key))
+        for key, value in MANIFEST_DEFAULTS.items():
+            if run.get(key) in [None, '']:
+                run[key] = value
+        run['run_option'] = int(run['run_option'])
+        run['bgPercOption2'] = float(run['bgPercOption2'])
+        for key in ['chem_file', 'region_file', 'release_file']:
+            run[key] = os.path.join(manifest_dir, run[key])
+        checked.append(run)
+
+    file_names = [run['file_name'] for run in checked]
+    duplicates = sorted(set(name for name in file_names if file_names.count(name) > 1))
+    if duplicates:
+        raise ValueError('manifest output names are not unique: ' + ', '.join(duplicates))
+    return checked
+
+
+def make_model(run, output_file_path):
+    return Model_SetUp(run['start_date'], run['end_date'], run['run_option'], run['bgPercOption2'],
+                       run['chem_type'], run['chem_file'], run['region_file'], run['release_file'],
+                       output_file_path, run['file_name'], run['solver_method'], run['output_format'],
+                       run['plots'])
+
+
+def output_folder(run, output_root):
+    output_file_path = os.path.join(output_root, run['file_name'])
+    if not os.path.exists(output_file_path):
+        os.makedirs(output_file_path)
+    return output_file_path
+
+
+def batch_key(run):
+    # runs with the same key are solved together (see model_setup.run_ensemble), None for the other runs
+    try:
+        return ensemble_key(make_model(run, None))
+    except ValueError:
+        # the run fails in run_one with this error
+        return None
+
+
+def run_one(run, output_root):
+    # one model run in its own output folder, what the model prints (and the traceback of a failed run) goes
+    # to run.log in that folder instead of the console shared by all the workers
+    output_file_path = output_folder(run, output_root)
+
+    start = time.time()
+    status, error = 'ok', ''
+    with open(os.path.join(output_file_path, 'run.log'), 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            make_model(run, output_file_path).run_model()
+        except Exception as e:
+            traceback.print_exc(file=log)
+            status, error = 'failed', '%s: %s' % (type(e).__name__, e)
+    return {'file_name': run['file_name'], 'chem_type': run['chem_type'], 'status': status,
+            'wall_time_s': round(time.time() - start, 2), 'error': error}
+
+
+def run_group(runs, output_root):
+    # runs solved together by run_ensemble in one worker, each run still writes to its own output folder and
+    # run.log (the log of the group), they all fail if one fails and report the wall time of the group
+    start = time.time()
+    status, error = 'ok', ''
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        try:
+            run_ensemble([make_model(run, output_folder(run, output_root)) for run in runs])
+        except Exception as e:
+            traceback.print_exc(file=log)
+            status, error = 'failed', '%s: %s' % (type(e).__name__, e)
+    results = []
+    for run in runs:
+        with open(os.path.join(output_folder(run, output_root), 'run.log'), 'w') as f:
+            f.write(log.getvalue())
+        results.append({'file_name': run['file_name'], 'chem_type': run['chem_type'], 'status': status,
+                        'wall_time_s': round(time.time() - start, 2), 'error': error})
+    return results
+
+
+def run_batch(manifest_file, workers=None, output_root=None, ensemble=True):
+    # run every model of the manifest over a process pool (one worker per cpu by default), each run writes
+    # to its own subfolder of output_root (Output/ by default), batch_summary.csv there lists the status
+    # and wall time of every run
+    # with ensemble, the organoFate runs with solver_method 'expm' and run option 1 that share the region file
+    # and the dates are solved together in one worker (model_setup.run_ensemble), eg. the release scenarios
+    # of a chemical
+    runs = read_manifest(manifest_file)
+    if output_root is None:
+        output_root = os.path.join(CUR_PATH, 'Output')
+    output_root = os.path.abspath(output_root)
+    if not os.path.exists(output_root):
+        os.makedirs(output_root)
+
+    start = time.time()
+    summary = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        groups = OrderedDict()
+        futures = []
+        for run in runs:
+            key = batch_key(run) if ensemble else None
+            if key is None:
+                futures.append(pool.submit(run_one, run, output_root))
+            else:
+                groups.setdefault(key, []).append(run)
+        for group in groups.values():
+            if len(group) == 1:
+                futures.append(pool.submit(run_one, group[0], output_root))
+            else:
+                futures.append(pool.submit(run_group, group, output_root))
+        for future in as_completed(futures):
+            results = future.result()
+            for result in results if isinstance(results, list) else [results]:
+                summary.append(result)
+                print('%s %s (%.1f s)' % (result['file_name'], result['status'], result['wall_time_s']))
+
+    # keep the manifest order in the summary
+    order = [run['file_name'] for run in runs]
+    summary.sort(key=lambda result: order.index(result['file_name']))
+    summary_file = os.path.join(output_root, 'batch_summary.csv')
+    with open(summary_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['file_name', 'chem_type', 'status', 'wall_time_s', 'error'])
+        writer.writeheader()
+        writer.writerows(summary)
+    print('%d runs, %d failed, total wall time %.1f s, summary in %s'
+          % (len(summary), len([r for r in summary if r['status'] != 'ok']), time.time() - start, summary_file))
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the ChemFate models listed in a manifest (csv or json) '
+                                                 'in parallel.')
+    parser.add_argument('manifest', help='manifest file, columns: ' + ', '.join(MANIFEST_FIELDS))
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: cpu count)')
+    parser.add_argument('--output', default=None, help='output folder (default: Output)')
+    parser.add_argument('--separate', action='store_true', help='solve every run on its own, also the organoFate '
+                                                                'expm runs that could be solved together')
+    args = parser.parse_args()
+    summary = run_batch(args.manifest, args.workers, args.output, not args.separate)
+    sys.exit(0 if all(result['status'] == 'ok' for result in summary) else 1)
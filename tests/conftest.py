@@ -0,0 +1,13 @@
+import os
+import sys
+
+CUR_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CUR_PATH)
+
+# the model reads its helper files (IonizableChem_helper.json, the .mat files) relative to the working directory
+os.chdir(CUR_PATH)
+
+
+def pytest_configure(config):
+    # openpyxl warns about an extension of the bundled input workbooks
+    config.addinivalue_line('filterwarnings', 'ignore:Unknown extension is not supported')
@@ -0,0 +1,60 @@
+from __future__ import division
+import pytest
+
+import input_cache
+from load_data import LoadData
+
+
+##################################################################
+#
+#   the daily sheets are read up to the end of the simulated window
+#
+#################################################################
+
+
+class CountingSheet:
+    # a worksheet counting the rows read from it
+    def __init__(self, sheet, counts):
+        self.sheet = sheet
+        self.title = sheet.title
+        self.counts = counts
+
+    def iter_rows(self, values_only=True):
+        for row in self.sheet.iter_rows(values_only=values_only):
+            self.counts[self.title] = self.counts.get(self.title, 0) + 1
+            yield row
+
+
+class CountingBook:
+    # the workbook opened by InputBook, its sheets counting their rows
+    def __init__(self, book, counts):
+        self.excel = book
+        self.counts = counts
+
+    @property
+    def book(self):
+        return self
+
+    def __getitem__(self, sheet_name):
+        return CountingSheet(self.excel.book[sheet_name], self.counts)
+
+    def parse(self, *args, **kwargs):
+        return self.excel.parse(*args, **kwargs)
+
+    def close(self):
+        self.excel.close()
+
+
+@pytest.mark.parametrize('end_date, sim_days', [('2005 1 31', 31), ('2005 3 31', 90)])
+def test_window_rows(monkeypatch, end_date, sim_days):
+    # with the cache off, the rows read from Climate (3653 rows) and Release (24834 rows) are the header rows,
+    # the simulated days and the first row after them
+    counts = {}
+    open_input = input_cache.open_input
+    monkeypatch.setattr(input_cache, 'CACHE_DIR', '')
+    monkeypatch.setattr(input_cache, 'open_input', lambda source: CountingBook(open_input(source), counts))
+    data = LoadData('Metal', 'Input/ChemParam_metal.xlsx', 'Input/Region.xlsx', 'Input/ChemRelease.xlsx',
+                    '2005 1 1', end_date, sim_days)
+    chem_params, presence, env, climate, bgConc, release, release_scenario = data.run_loadData()
+    assert len(climate['dates']) == sim_days and release['matrix'].shape[0] == sim_days
+    assert counts == {'Climate': 1 + sim_days + 1, 'Release': 2 + sim_days + 1}
@@ -0,0 +1,79 @@
+from __future__ import division
+import os
+import time
+
+import input_cache
+from input_cache import cached_load, evict_cache, InputBook
+
+
+##################################################################
+#
+#   input_cache entries and their eviction
+#
+#################################################################
+
+
+def entries(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.pkl'))
+
+
+def test_hit(tmp_path, monkeypatch):
+    monkeypatch.setattr(input_cache, 'CACHE_DIR', str(tmp_path))
+    calls = []
+
+    def load():
+        calls.append(1)
+        return {'value': len(calls)}
+
+    assert cached_load('sheet', 'hash', ('Sheet1',), load) == {'value': 1}
+    assert cached_load('sheet', 'hash', ('Sheet1',), load) == {'value': 1}
+    assert cached_load('sheet', 'hash', ('Sheet2',), load) == {'value': 2}
+    assert len(calls) == 2 and len(entries(str(tmp_path))) == 2
+
+
+def test_older_versions_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(input_cache, 'CACHE_DIR', str(tmp_path))
+    for name in ['cells_0123.pkl', 'v3_sheet_0123.pkl', 'other.txt']:
+        (tmp_path / name).write_bytes(b'x')
+    cached_load('sheet', 'hash', (), lambda: 1)
+    kept = entries(str(tmp_path))
+    assert len(kept) == 1 and kept[0].startswith('v%d_sheet_' % input_cache.CACHE_VERSION)
+    assert (tmp_path / 'other.txt').exists()
+
+
+def test_least_recently_used_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(input_cache, 'CACHE_DIR', str(tmp_path))
+    for k in range(4):
+        cached_load('sheet', 'hash', (k,), lambda: b'x' * 1000)
+    names = entries(str(tmp_path))
+    now = time.time()
+    for name in names:
+        os.utime(os.path.join(str(tmp_path), name), (now - 100, now - 100))
+    # using an entry makes it the most recent
+    assert cached_load('sheet', 'hash', (0,), lambda: None) == b'x' * 1000
+    used = max(names, key=lambda name: os.path.getmtime(os.path.join(str(tmp_path), name)))
+    size = os.path.getsize(os.path.join(str(tmp_path), used))
+
+    evict_cache(max_bytes=2 * size)
+    kept = entries(str(tmp_path))
+    assert len(kept) == 2 and used in kept
+
+    evict_cache(max_age=50)
+    assert entries(str(tmp_path)) == [used]
+
+
+def test_input_book(tmp_path, monkeypatch):
+    # the workbook is opened only for the sheets not in the cache
+    monkeypatch.setattr(input_cache, 'CACHE_DIR', str(tmp_path))
+    book = InputBook('Input/ChemRelease.xlsx')
+    bgConc = book.parse('bgConc', skiprows=1)
+    top, columns = book.date_window('Release', '2005 1 1', '2005 1 31', header_row=1)
+    assert book.book is not None
+    book.close()
+
+    book = InputBook('Input/ChemRelease.xlsx')
+    assert book.parse('bgConc', skiprows=1).equals(bgConc)
+    cached_top, cached_columns = book.date_window('Release', '2005 1 1', '2005 1 31', header_row=1)
+    assert book.book is None
+    assert cached_top == top and list(cached_columns) == list(columns)
+    assert len(cached_columns['Year']) == 31
@@ -0,0 +1,79 @@
+from __future__ import division
+import numpy as np
+import pytest
+
+from load_data import LoadData
+from linear_system import no_source, DayJacobian, vode_layout
+from model_solver import daily_env
+from Y_ion import Y_Value
+from ode_ion import ion_ode, ion_jac
+from ode_metal import metal_ode, metal_jac
+
+
+##################################################################
+#
+#   ion_jac and metal_jac against finite differences of the odes
+#
+#################################################################
+
+CHEM_FILES = {'IonizableOrganic': 'Input/ChemParam_ionizableOrganic.xlsx', 'Metal': 'Input/ChemParam_metal.xlsx'}
+DAYS = 31
+
+
+def ode_params(chem_type, day):
+    # parameters of ion_ode/metal_ode (after t and Q) on day of the bundled inputs, with the sources
+    data = LoadData(chem_type, CHEM_FILES[chem_type], 'Input/Region.xlsx', 'Input/ChemRelease.xlsx', '2005 1 1',
+                    '2005 1 31', DAYS)
+    chemParams, presence, env, climate, bgConc, release, release_scenario = data.run_loadData()
+    Y_val = Y_Value(chem_type, chemParams, env)
+    Z_ij, Z_ij_sub = Y_val.Z_ij()
+    if chem_type == 'IonizableOrganic':
+        return (day, presence, daily_env(env, day), chemParams, climate, release, bgConc, Z_ij, Z_ij_sub,
+                Y_val.Y_ij(), Y_val.X_ij(), Y_val.Z_i())
+    return (day, presence, daily_env(env, day), chemParams, climate, release, bgConc, Z_ij, Y_val.Y_ij(),
+            Y_val.Z_i())
+
+
+def finite_differences(ode_func, Q, params):
+    # central differences, column k is d(ode)/dQ[k]
+    n = len(Q)
+    J = np.zeros((n, n))
+    for k in range(n):
+        h = 1e-4 * max(abs(Q[k]), 1.0)
+        up, down = Q.copy(), Q.copy()
+        up[k] += h
+        down[k] -= h
+        J[:, k] = (np.asarray(ode_func(0, up, *params)) - np.asarray(ode_func(0, down, *params))) / (2 * h)
+    return J
+
+
+@pytest.mark.parametrize('chem_type, ode_func, jac', [('IonizableOrganic', ion_ode, ion_jac),
+                                                      ('Metal', metal_ode, metal_jac)])
+@pytest.mark.parametrize('day', [0, 15, DAYS - 1])
+def test_jacobian_matches_finite_differences(chem_type, ode_func, jac, day):
+    params = ode_params(chem_type, day)
+    release, bgConc = params[5], params[6]
+    Q = np.random.RandomState(day).uniform(0.1, 10.0, 15)
+    J_fd = finite_differences(ode_func, Q, params)
+    scale = np.abs(J_fd).max()
+    # the solver passes the parameters without sources, the sources do not change the jacobian
+    release_no_source, bgConc_no_source = no_source(release, bgConc)
+    J = jac(0, Q, *(params[:5] + (release_no_source, bgConc_no_source) + params[7:]))
+    assert J.shape == (15, 15)
+    assert np.abs(J - J_fd).max() <= 1e-9 * scale
+    assert np.abs(jac(0, Q, *params) - J).max() <= 1e-10 * scale
+
+
+def test_day_jacobian_is_built_once_per_day():
+    calls = []
+
+    def jac(t, y, i):
+        calls.append(i)
+        return np.array([[-1.0, 0.0], [2.0, -3.0]]) * (i + 1)
+
+    day_jac = DayJacobian(jac)
+    first = day_jac(0, np.ones(2), 0)
+    assert day_jac(0.5, np.zeros(2), 0) is first
+    assert np.array_equal(first, vode_layout(jac(0, None, 0)))
+    day_jac(0, np.ones(2), 1)
+    assert calls == [0, 0, 1]
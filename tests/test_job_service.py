@@ -0,0 +1,152 @@
+from __future__ import division
+import io
+import json
+import time
+import uuid
+import zipfile
+import threading
+import http.client
+import urllib.error
+import urllib.request
+import pytest
+
+from job_queue import JobQueue
+from job_service import JobService, MAX_BODY_BYTES
+
+
+##################################################################
+#
+#   job_service on localhost, one short Metal run
+#
+#################################################################
+
+INPUTS = {'chem_file': 'Input/ChemParam_metal.xlsx', 'region_file': 'Input/Region.xlsx',
+          'release_file': 'Input/ChemRelease.xlsx'}
+SETTINGS = {'chem_type': 'Metal', 'start_date': '2005 1 1', 'end_date': '2005 1 10', 'solver_method': 'expm',
+            'plots': 'none'}
+# the run takes a few seconds once the worker has imported the model
+TIMEOUT = 300
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    # the url of a service on a free port, with one worker
+    queue = JobQueue(str(tmp_path_factory.mktemp('jobs')), workers=1)
+    server = JobService(('127.0.0.1', 0), queue, verbose=False)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    queue.shutdown()
+
+
+def form(fields):
+    # multipart/form-data body and content type of the input files and fields
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(('--%s\r\nContent-Disposition: form-data; name="%s"\r\n\r\n%s\r\n'
+                    % (boundary, name, value)).encode())
+    for name, path in INPUTS.items():
+        body.write(('--%s\r\nContent-Disposition: form-data; name="%s"; filename="%s.xlsx"\r\n'
+                    'Content-Type: application/octet-stream\r\n\r\n' % (boundary, name, name)).encode())
+        with open(path, 'rb') as f:
+            body.write(f.read())
+        body.write(b'\r\n')
+    body.write(('--%s--\r\n' % boundary).encode())
+    return body.getvalue(), 'multipart/form-data; boundary=' + boundary
+
+
+def call(url, method='GET', fields=None):
+    # status and body of the answer
+    body, content_type = form(fields) if fields is not None else (None, None)
+    request = urllib.request.Request(url, data=body, method=method)
+    if content_type:
+        request.add_header('Content-Type', content_type)
+    try:
+        with urllib.request.urlopen(request) as answer:
+            return answer.status, answer.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def test_run(service):
+    status, body = call(service + '/jobs', 'POST', SETTINGS)
+    assert status == 202
+    job_id = json.loads(body)['id']
+
+    start = time.time()
+    while True:
+        status, body = call(service + '/jobs/' + job_id)
+        assert status == 200
+        job = json.loads(body)
+        if job['state'] in ['done', 'failed']:
+            break
+        assert time.time() - start < TIMEOUT
+        time.sleep(0.5)
+    assert job['state'] == 'done', job['error']
+    assert job['files'] and all('chemfate-run' in name for name in job['files'])
+
+    status, body = call(service + '/jobs/%s/zip?name=copper_2005' % job_id)
+    assert status == 200
+    with zipfile.ZipFile(io.BytesIO(body)) as zip_file:
+        assert zip_file.testzip() is None
+        assert sorted(zip_file.namelist()) == sorted(name.replace('chemfate-run', 'copper_2005')
+                                                     for name in job['files'])
+
+    # the same inputs and settings give the finished job
+    status, body = call(service + '/jobs', 'POST', SETTINGS)
+    assert status == 200 and json.loads(body)['id'] == job_id
+
+    for name in ['../x', '..', 'a"b', 'a%0D%0Ab']:
+        status, body = call(service + '/jobs/%s/zip?name=%s' % (job_id, name))
+        assert status == 400
+
+
+@pytest.mark.parametrize('name, value', [('chem_type', 'Mercury'), ('solver_method', 'linear'),
+                                         ('output_format', 'xml'), ('plots', 'some'), ('run_option', 'one'),
+                                         ('start_date', '2005-01-01'), ('end_date', '2005 13 1'),
+                                         ('end_date', '2004 12 31')])
+def test_bad_settings(service, name, value):
+    settings = dict(SETTINGS)
+    settings[name] = value
+    status, body = call(service + '/jobs', 'POST', settings)
+    assert status == 400
+    assert json.loads(body)['error']
+
+
+def test_missing_setting(service):
+    settings = dict(SETTINGS)
+    del settings['end_date']
+    status, body = call(service + '/jobs', 'POST', settings)
+    assert status == 400
+
+
+def post_headers(service, headers):
+    # status of a POST /jobs with these headers and no body
+    host, port = service.split('//')[1].split(':')
+    connection = http.client.HTTPConnection(host, int(port))
+    try:
+        connection.putrequest('POST', '/jobs', skip_accept_encoding=True)
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders()
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize('length, status', [(None, 411), ('ten', 400), ('-1', 400),
+                                            (str(MAX_BODY_BYTES + 1), 413)])
+def test_body_length(service, length, status):
+    headers = {'Content-Type': 'multipart/form-data; boundary=x'}
+    if length is not None:
+        headers['Content-Length'] = length
+    assert post_headers(service, headers) == status
+
+
+@pytest.mark.parametrize('path', ['/jobs/0123456789abcdef', '/jobs/0123456789abcdef/zip', '/nothing'])
+def test_not_found(service, path):
+    status, body = call(service + path)
+    assert status == 404